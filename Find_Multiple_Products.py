@@ -12,13 +12,20 @@ import time
 import json
 from pathlib import Path
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+from douyin_extraction import scroll_and_extract_incrementally
+from browser_session import open_browser_context, DOUYIN_CONTEXT_OPTIONS
+from match_cascade import get_match_cascade
+from gemini_client import wrap_model, run_batched
+from gemini_usage import apply_budget_arg
+from reference_shards import ReferenceShards
+from reference_cache import reference_context
 import google.generativeai as genai
 from PIL import Image
+from image_pool import decode_image
+from bunny_store import get_thumbnail_backup, with_backup_column
 import io
 import requests
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import threading
 
 def setup_gemini_api():
     """Setup Gemini API with user's API key"""
@@ -36,7 +43,7 @@ def setup_gemini_api():
     try:
         genai.configure(api_key=api_key)
         # Use latest Gemini 2.5 Flash model (September 2025)
-        model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025')
+        model = wrap_model(genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025'))
         print("✅ Gemini API configured successfully (using gemini-2.5-flash-lite-preview-09-2025)")
         return model
     except Exception as e:
@@ -131,7 +138,11 @@ def download_thumbnail(url):
         response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
-        image = Image.open(io.BytesIO(response.content))
+        backup = get_thumbnail_backup()
+        if backup:
+            backup.submit(url, response.content)  # same bytes go to Bunny in the background
+        
+        image, _ = decode_image(response.content)  # decode in the image process pool
         return image
     except Exception as e:
         print(f"  ⚠️ Error downloading thumbnail: {e}")
@@ -174,7 +185,7 @@ def save_non_matches_to_research(douyin_url, non_matching_videos):
             f.write(f"# Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             
             # Write CSV data
-            writer = csv.DictWriter(f, fieldnames=['video_url', 'thumbnail_url', 'likes', 'index'])
+            writer = csv.DictWriter(f, fieldnames=with_backup_column(['video_url', 'thumbnail_url', 'likes', 'index'], non_matching_videos))
             writer.writeheader()
             writer.writerows(non_matching_videos)
         
@@ -184,14 +195,22 @@ def save_non_matches_to_research(douyin_url, non_matching_videos):
         print(f"  ⚠️ Error writing to {research_file}: {e}")
         return False
 
-def compare_images_with_gemini(model, reference_image, thumbnail_image, video_index=None):
-    """Compare thumbnail with reference image using Gemini (LEGACY - single product)
+async def compare_images_with_gemini(model, reference_image, thumbnail_image, video_index=None):
+    """Compare thumbnail with reference image using Gemini (LEGACY - single product, awaited on the Gemini engine)
     
     Returns:
         tuple: (result, error_type)
         - result: True if match, False if no match, None if error
         - error_type: None if success, 'rate_limit', 'api_error', etc.
     """
+    # Cascade: a cheap screening model rejects confident non-matches, the rest are confirmed below
+    cascade = get_match_cascade()
+    if cascade:
+        if not await cascade.should_escalate_async(reference_image, thumbnail_image):
+            return (False, None)
+        if cascade.confirm_model:
+            model = cascade.confirm_model
+    
     max_retries = 2
     retry_delay = 2
     
@@ -215,7 +234,10 @@ Answer with ONLY ONE WORD:
 
 Be strict - only say MATCH if you're confident it's the same product."""
 
-            response = model.generate_content([prompt, reference_image, thumbnail_image])
+            # Prompt + reference are registered once per run when GEMINI_REFERENCE_CACHE is on
+            async with reference_context(model, prompt, [reference_image], 'match') as context:
+                call_model, contents = context.request([thumbnail_image])
+                response = await call_model.generate_content_async(contents, prompt_type='match')
             
             if response and response.text:
                 answer = response.text.strip().upper()
@@ -231,7 +253,7 @@ Be strict - only say MATCH if you're confident it's the same product."""
             if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
                 if attempt < max_retries - 1:
                     print(f"  ⚠️ Rate limit hit, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
                 else:
@@ -242,12 +264,12 @@ Be strict - only say MATCH if you're confident it's the same product."""
     
     return (None, 'max_retries_exceeded')
 
-def compare_multiple_products_with_gemini(model, reference_images_dict, thumbnail_image, video_index=None):
-    """Compare thumbnail with MULTIPLE reference products using Gemini
+async def compare_shard_with_gemini(model, reference_images_dict, thumbnail_image, video_index=None):
+    """Compare thumbnail with one shard of reference products in a single Gemini call
     
     Args:
         model: Gemini model instance
-        reference_images_dict: dict of {product_name: PIL.Image}
+        reference_images_dict: dict of {product_name: PIL.Image} (one shard)
         thumbnail_image: PIL.Image of video thumbnail
         video_index: Optional video number for logging
     
@@ -283,13 +305,12 @@ Answer in this EXACT format:
 Be strict - only list products you're confident are in the thumbnail.
 Look for exact same product type, design, and appearance."""
 
-            # Build images list: [ref1, ref2, ref3, ..., thumbnail]
-            images_list = [prompt]
-            for name in product_names:
-                images_list.append(reference_images_dict[name])
-            images_list.append(thumbnail_image)
-            
-            response = model.generate_content(images_list)
+            # Images: [ref1, ref2, ref3, ..., thumbnail]; prompt + references are registered
+            # once per shard when GEMINI_REFERENCE_CACHE is on
+            references = [reference_images_dict[name] for name in product_names]
+            async with reference_context(model, prompt, references, 'shard') as context:
+                call_model, contents = context.request([thumbnail_image])
+                response = await call_model.generate_content_async(contents, prompt_type='match_shard')
             
             if response and response.text:
                 answer = response.text.strip()
@@ -325,7 +346,7 @@ Look for exact same product type, design, and appearance."""
             if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
                 if attempt < max_retries - 1:
                     print(f"  ⚠️ Rate limit hit, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
                 else:
@@ -335,7 +356,47 @@ Look for exact same product type, design, and appearance."""
     
     return (None, 'max_retries_exceeded')
 
-def process_single_video(model, reference_image, video, video_num, total_videos):
+async def compare_multiple_products_with_gemini(model, reference_images_dict, thumbnail_image, video_index=None,
+                                               shards=None):
+    """Compare thumbnail with MULTIPLE reference products using Gemini
+    
+    References are split into shards of at most K products; the shards the local prefilter
+    picks for this thumbnail are asked in parallel and their matches merged.
+    
+    Args:
+        model: Gemini model instance
+        reference_images_dict: dict of {product_name: PIL.Image}
+        thumbnail_image: PIL.Image of video thumbnail
+        video_index: Optional video number for logging
+        shards: ReferenceShards for reference_images_dict (built here if not given)
+    
+    Returns:
+        tuple: (matched_products, error_type)
+        - matched_products: list of product names that matched, in reference order
+        - error_type: None if success, or the first shard error (rate limits first)
+    """
+    if shards is None:
+        shards = ReferenceShards(reference_images_dict)
+    
+    selected = await asyncio.to_thread(shards.select, thumbnail_image)
+    if not selected:
+        return ([], None)
+    
+    results = await asyncio.gather(*[
+        compare_shard_with_gemini(model, shard_images, thumbnail_image, video_index)
+        for shard_images in selected
+    ])
+    
+    errors = [error for _, error in results if error]
+    if errors:
+        # Any failed shard fails the video so the batch runner retries it whole
+        rate_limits = [error for error in errors if 'rate_limit' in error]
+        return (None, (rate_limits or errors)[0])
+    
+    matched = {name for matched_products, _ in results for name in matched_products}
+    return ([name for name in reference_images_dict if name in matched], None)
+
+async def process_single_video(model, reference_image, video, video_num, total_videos):
     """Process a single video - download and compare (LEGACY - single product)
     
     Returns:
@@ -345,13 +406,13 @@ def process_single_video(model, reference_image, video, video_num, total_videos)
     """
     try:
         # Download thumbnail
-        thumbnail = download_thumbnail(video['thumbnail_url'])
+        thumbnail = await asyncio.to_thread(download_thumbnail, video['thumbnail_url'])
         if not thumbnail:
             print(f"  [{video_num}/{total_videos}] ⚠️ Failed to download thumbnail")
             return (None, 'download_failed')
         
         # Compare with reference image
-        result, error = compare_images_with_gemini(model, reference_image, thumbnail, video_num)
+        result, error = await compare_images_with_gemini(model, reference_image, thumbnail, video_num)
         
         if error:
             # API error occurred
@@ -373,12 +434,14 @@ def process_single_video(model, reference_image, video, video_num, total_videos)
         print(f"  [{video_num}/{total_videos}] ⚠️ Processing error: {e}")
         return (None, f'processing_error: {str(e)}')
 
-def process_single_video_multi_product(model, reference_images_dict, video, video_num, total_videos):
+async def process_single_video_multi_product(model, reference_images_dict, video, video_num, total_videos,
+                                             shards=None):
     """Process a single video against MULTIPLE products
     
     Args:
         model: Gemini model instance
         reference_images_dict: dict of {product_name: PIL.Image}
+        shards: ReferenceShards for reference_images_dict
         video: video data dict
         video_num: current video number
         total_videos: total number of videos
@@ -390,14 +453,14 @@ def process_single_video_multi_product(model, reference_images_dict, video, vide
     """
     try:
         # Download thumbnail
-        thumbnail = download_thumbnail(video['thumbnail_url'])
+        thumbnail = await asyncio.to_thread(download_thumbnail, video['thumbnail_url'])
         if not thumbnail:
             print(f"  [{video_num}/{total_videos}] ⚠️ Failed to download thumbnail")
             return (None, 'download_failed')
         
-        # Compare with all reference products
-        matched_products, error = compare_multiple_products_with_gemini(
-            model, reference_images_dict, thumbnail, video_num
+        # Compare with the reference shards the prefilter picks (in parallel)
+        matched_products, error = await compare_multiple_products_with_gemini(
+            model, reference_images_dict, thumbnail, video_num, shards
         )
         
         if error:
@@ -422,121 +485,50 @@ def process_single_video_multi_product(model, reference_images_dict, video, vide
         print(f"  [{video_num}/{total_videos}] ⚠️ Processing error: {e}")
         return (None, f'processing_error: {str(e)}')
 
-def scroll_and_load_all_videos(page, max_duration_minutes=30):
-    """Scroll page to load all videos with time limit"""
-    print(f"⏬ Scrolling to load all videos (max {max_duration_minutes} minutes)...")
-    
-    start_time = time.time()
-    max_duration_seconds = max_duration_minutes * 60
-    max_scrolls = 200  # Maximum scroll attempts
-    scroll_pause_time = 2  # Wait between scrolls
+def analyze_videos_multi_product(videos, model, reference_images_dict, shards=None, max_workers=None):
+    """Match videos against every reference product in one sharded pass
     
-    previous_height = None
-    scroll_count = 0
+    Args:
+        videos: list of video dicts
+        model: Gemini model instance
+        reference_images_dict: dict of {product_name: PIL.Image}
+        shards: ReferenceShards for reference_images_dict (built here if not given)
+        max_workers: videos in flight at once (default GEMINI_MAX_IN_FLIGHT)
     
-    # Find the scroll container (Douyin uses a div with class 'route-scroll-container')
-    scroll_container_selector = "document.querySelector('.route-scroll-container')"
+    Returns:
+        tuple: (product_matches, videos_with_any_match, error_types)
+        - product_matches: {product_name: [video, ...]}
+        - videos_with_any_match: set of video URLs that matched at least one product
+        - error_types: {error: count}
+    """
+    if shards is None:
+        shards = ReferenceShards(reference_images_dict)
     
-    while scroll_count < max_scrolls:
-        # Check time limit
-        elapsed = time.time() - start_time
-        if elapsed > max_duration_seconds:
-            print(f"  ⏱️ Reached {max_duration_minutes} minute time limit")
-            break
-        
-        # Scroll the container to bottom
-        page.evaluate(f"{scroll_container_selector}.scrollTo(0, {scroll_container_selector}.scrollHeight)")
-        
-        # Wait for new content to load
-        time.sleep(scroll_pause_time)
-        
-        # Get current scroll height of the container
-        current_height = page.evaluate(f"{scroll_container_selector}.scrollHeight")
-        
-        # Count videos for progress
-        video_count = page.locator('a[href*="/video/"]').count()
-        
-        # Check if height changed (new content loaded)
-        if current_height == previous_height:
-            print(f"  ✅ No more content to load. Found {video_count} videos.")
-            break
-        
-        print(f"  📊 Loaded {video_count} videos... (elapsed: {int(elapsed)}s)")
-        previous_height = current_height
-        scroll_count += 1
+    product_matches = {name: [] for name in reference_images_dict.keys()}
+    videos_with_any_match = set()  # Track which videos matched ANY product
+    error_types = {}
     
-    final_count = page.locator('a[href*="/video/"]').count()
-    print(f"✅ Finished scrolling. Total videos: {final_count}")
-    return final_count
-
-def extract_videos_from_page(page):
-    """Extract video URLs, thumbnail URLs, and likes from page - FAST version"""
-    print("🔍 Extracting video data from page...")
+    async def task(video, video_num, total):
+        return await process_single_video_multi_product(
+            model, reference_images_dict, video, video_num, total, shards
+        )
     
-    try:
-        # Wait for content to load
-        page.wait_for_selector('img', timeout=10000)
-        
-        # Extract ALL video data in ONE JavaScript call (much faster!)
-        videos = page.evaluate("""
-            () => {
-                const videoLinks = document.querySelectorAll('a[href*="/video/"]');
-                const videos = [];
-                
-                videoLinks.forEach((link, index) => {
-                    const videoUrl = link.href;
-                    const img = link.querySelector('img');
-                    const thumbnailUrl = img ? (img.src || img.getAttribute('data-src')) : null;
-                    
-                    // Try to find likes count (Douyin shows it in various places)
-                    let likes = '';
-                    
-                    // Look for common like count patterns in the video card
-                    const container = link.closest('li') || link.closest('div[class*="video"]');
-                    if (container) {
-                        // Try different selectors for like count
-                        const likeSelectors = [
-                            'span[class*="count"]',
-                            'span[class*="like"]',
-                            'div[class*="count"]',
-                            'div[class*="digg"]',
-                            'span[class*="digg"]'
-                        ];
-                        
-                        for (const selector of likeSelectors) {
-                            const elements = container.querySelectorAll(selector);
-                            for (const el of elements) {
-                                const text = el.textContent.trim();
-                                // Check if it looks like a number (could be "1.2w", "10k", "1234", etc.)
-                                if (text && /[\d.]+[wkm万千]?/i.test(text)) {
-                                    likes = text;
-                                    break;
-                                }
-                            }
-                            if (likes) break;
-                        }
-                    }
-                    
-                    if (videoUrl && thumbnailUrl) {
-                        videos.push({
-                            video_url: videoUrl,
-                            thumbnail_url: thumbnailUrl,
-                            likes: likes || 'N/A',
-                            index: index + 1
-                        });
-                    }
-                });
-                
-                return videos;
-            }
-        """)
-        
-        print(f"✅ Extracted {len(videos)} videos with thumbnails and likes")
-        return videos
-        
-    except Exception as e:
-        print(f"❌ Error extracting videos: {e}")
-        return []
+    def on_result(video, result):
+        matched_products, error = result if result else (None, 'timeout')
+        if error:
+            # Track error
+            error_types[error] = error_types.get(error, 0) + 1
+            return 'errors'
+        elif matched_products:
+            for product_name in matched_products:
+                product_matches[product_name].append(video)
+            videos_with_any_match.add(video['video_url'])
+            return 'matches'
+        return 'non-matches'
+    
+    # Timed-out calls are retried and quota errors pause the run instead of dropping videos
+    run_batched(videos, task, on_result, batch_size=max_workers)
+    return (product_matches, videos_with_any_match, error_types)
 
 def find_matching_videos(douyin_url, reference_image_path, output_csv='matching_videos.csv', max_duration_minutes=30):
     """Main function to find matching videos"""
@@ -557,44 +549,12 @@ def find_matching_videos(douyin_url, reference_image_path, output_csv='matching_
     print(f"\n🌐 Opening Douyin page: {douyin_url}")
     
     with sync_playwright() as p:
-        # Launch browser with anti-detection settings
-        browser = p.chromium.launch(
-            headless=False,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
-        )
-        
-        # Load cookies if available
-        cookies_file = 'douyin_cookies.json'
-        storage_state = None
-        
-        if os.path.exists(cookies_file):
-            print(f"✅ Loading cookies from {cookies_file}")
-            with open(cookies_file, 'r') as f:
-                storage_state = json.load(f)
-        else:
-            print(f"ℹ️ No cookies file found. Create '{cookies_file}' to avoid login.")
-            print(f"   Instructions will be shown after the run.")
-        
-        # Create context with realistic browser fingerprint
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Referer': 'https://www.douyin.com/',
-            },
-            storage_state=storage_state
+        # Open browser context (attaches to a long-lived browser if configured)
+        context, close_browser, session_warm = open_browser_context(
+            p,
+            context_options=DOUYIN_CONTEXT_OPTIONS,
+            storage_state_file='douyin_cookies.json',
+            login_site='douyin'
         )
         
         # Hide automation indicators
@@ -612,22 +572,22 @@ def find_matching_videos(douyin_url, reference_image_path, output_csv='matching_
             page.goto(douyin_url, wait_until='networkidle', timeout=60000)
             
             # Wait for user to complete CAPTCHA manually
-            print("\n⏸️  CAPTCHA Check")
-            print("=" * 50)
-            print("If you see a CAPTCHA, please complete it now.")
-            print("When ready, press ENTER to start collecting videos...")
-            input()
+            if session_warm:
+                print("\n♻️  Warm browser session - skipping CAPTCHA pause")
+            else:
+                print("\n⏸️  CAPTCHA Check")
+                print("=" * 50)
+                print("If you see a CAPTCHA, please complete it now.")
+                print("When ready, press ENTER to start collecting videos...")
+                input()
             print("\n✅ Starting video collection...")
             
-            # Scroll and load all videos
-            total_videos = scroll_and_load_all_videos(page, max_duration_minutes)
-            
-            # Extract video data
-            videos = extract_videos_from_page(page)
+            # Scroll and extract videos incrementally (keeps DOM small)
+            videos = scroll_and_extract_incrementally(page, max_duration_minutes)
             
             if not videos:
                 print("❌ No videos found on page!")
-                browser.close()
+                close_browser()
                 return False
             
             print(f"\n🔎 Analyzing {len(videos)} videos with parallel processing...")
@@ -638,56 +598,26 @@ def find_matching_videos(douyin_url, reference_image_path, output_csv='matching_
             error_count = 0
             error_types = {}
             
-            # Process in batches for parallel requests
-            batch_size = 50  # Process 50 videos at a time
-            total_batches = (len(videos) + batch_size - 1) // batch_size
+            async def task(video, video_num, total):
+                return await process_single_video(model, reference_image, video, video_num, total)
+            
+            def on_result(video, result):
+                nonlocal error_count
+                is_match, error = result if result else (None, 'timeout')
+                if error:
+                    # Track error
+                    error_count += 1
+                    error_types[error] = error_types.get(error, 0) + 1
+                    return 'errors'
+                elif is_match:
+                    matching_videos.append(video)
+                    return 'matches'
+                else:
+                    non_matching_videos.append(video)
+                    return 'non-matches'
             
-            with ThreadPoolExecutor(max_workers=50) as executor:
-                for batch_num in range(total_batches):
-                    start_idx = batch_num * batch_size
-                    end_idx = min(start_idx + batch_size, len(videos))
-                    batch = videos[start_idx:end_idx]
-                    
-                    print(f"\n📦 Processing batch {batch_num + 1}/{total_batches} ({len(batch)} videos)")
-                    print(f"   Videos {start_idx + 1}-{end_idx} of {len(videos)}")
-                    
-                    # Submit all videos in batch to thread pool
-                    futures = []
-                    for i, video in enumerate(batch):
-                        video_num = start_idx + i + 1
-                        future = executor.submit(
-                            process_single_video,
-                            model, reference_image, video, video_num, len(videos)
-                        )
-                        futures.append((future, video))
-                    
-                    # Collect results
-                    batch_matches = 0
-                    batch_errors = 0
-                    for future, video in futures:
-                        try:
-                            is_match, error = future.result(timeout=30)
-                            
-                            if error:
-                                # Track error
-                                error_count += 1
-                                batch_errors += 1
-                                error_types[error] = error_types.get(error, 0) + 1
-                            elif is_match:
-                                matching_videos.append(video)
-                                batch_matches += 1
-                            else:
-                                non_matching_videos.append(video)
-                        except Exception as e:
-                            print(f"  ⚠️ Thread error: {e}")
-                            error_count += 1
-                            batch_errors += 1
-                    
-                    print(f"   ✅ Batch complete: {batch_matches} matches, {batch_errors} errors")
-                    
-                    # Small delay between batches to respect rate limits
-                    if batch_num < total_batches - 1:
-                        time.sleep(0.5)
+            # Process in batches for parallel requests; timed-out Gemini calls are retried
+            run_batched(videos, task, on_result)
             
             # Save matches to Matches folder
             matches_folder = 'Matches'
@@ -704,7 +634,7 @@ def find_matching_videos(douyin_url, reference_image_path, output_csv='matching_
                 f.write(f"# Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
                 
                 # Write CSV data
-                writer = csv.DictWriter(f, fieldnames=['video_url', 'thumbnail_url', 'likes', 'index'])
+                writer = csv.DictWriter(f, fieldnames=with_backup_column(['video_url', 'thumbnail_url', 'likes', 'index'], matching_videos))
                 writer.writeheader()
                 writer.writerows(matching_videos)
             
@@ -712,6 +642,8 @@ def find_matching_videos(douyin_url, reference_image_path, output_csv='matching_
             print(f"📊 Total videos: {len(videos)}")
             print(f"✅ Matches: {len(matching_videos)}")
             print(f"❌ Non-matches: {len(non_matching_videos)}")
+            if get_match_cascade():
+                print(get_match_cascade().summary())
             
             # Show error summary if any errors occurred
             if error_count > 0:
@@ -750,12 +682,12 @@ def find_matching_videos(douyin_url, reference_image_path, output_csv='matching_
                 except:
                     pass
             
-            browser.close()
+            close_browser()
             return True
             
         except Exception as e:
             print(f"❌ Error during search: {e}")
-            browser.close()
+            close_browser()
             return False
 
 def find_matching_videos_multi_product(douyin_url, reference_images_dict, max_duration_minutes=30):
@@ -781,41 +713,12 @@ def find_matching_videos_multi_product(douyin_url, reference_images_dict, max_du
     print(f"\n🌐 Opening Douyin page: {douyin_url}")
     
     with sync_playwright() as p:
-        # Launch browser
-        browser = p.chromium.launch(
-            headless=False,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
-        )
-        
-        # Load cookies if available
-        cookies_file = 'douyin_cookies.json'
-        storage_state = None
-        
-        if os.path.exists(cookies_file):
-            print(f"✅ Loading cookies from {cookies_file}")
-            with open(cookies_file, 'r') as f:
-                storage_state = json.load(f)
-        
-        # Create context
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Referer': 'https://www.douyin.com/',
-            },
-            storage_state=storage_state
+        # Open browser context (attaches to a long-lived browser if configured)
+        context, close_browser, session_warm = open_browser_context(
+            p,
+            context_options=DOUYIN_CONTEXT_OPTIONS,
+            storage_state_file='douyin_cookies.json',
+            login_site='douyin'
         )
         
         page = context.new_page()
@@ -832,98 +735,47 @@ def find_matching_videos_multi_product(douyin_url, reference_images_dict, max_du
             page.goto(douyin_url, wait_until='networkidle', timeout=60000)
             
             # Wait for user to complete CAPTCHA
-            print("\n⏸️  CAPTCHA Check")
-            print("=" * 50)
-            print("If you see a CAPTCHA, please complete it now.")
-            print("When ready, press ENTER to start collecting videos...")
-            input()
+            if session_warm:
+                print("\n♻️  Warm browser session - skipping CAPTCHA pause")
+            else:
+                print("\n⏸️  CAPTCHA Check")
+                print("=" * 50)
+                print("If you see a CAPTCHA, please complete it now.")
+                print("When ready, press ENTER to start collecting videos...")
+                input()
             print("\n✅ Starting video collection...")
             
-            # Scroll and load all videos
-            total_videos = scroll_and_load_all_videos(page, max_duration_minutes)
-            
-            # Extract video data
-            videos = extract_videos_from_page(page)
+            # Scroll and extract videos incrementally (keeps DOM small)
+            videos = scroll_and_extract_incrementally(page, max_duration_minutes)
             
             if not videos:
                 print("❌ No videos found on page!")
-                browser.close()
+                close_browser()
                 return False
             
             print(f"\n🔎 Analyzing {len(videos)} videos with parallel processing...")
             print("=" * 50)
             
-            # Track matches per product
-            product_matches = {name: [] for name in reference_images_dict.keys()}
-            videos_with_any_match = set()  # Track which videos matched ANY product
-            error_count = 0
-            error_types = {}
+            # One pass over the videos; each thumbnail goes only to the reference shards
+            # (groups of K products) that the local prefilter picks
+            shards = ReferenceShards(reference_images_dict)
+            print(shards.describe())
+            
+            product_matches, videos_with_any_match, error_types = analyze_videos_multi_product(
+                videos, model, reference_images_dict, shards
+            )
+            error_count = sum(error_types.values())
+            print(shards.summary())
             
-            # Process EACH PRODUCT INDIVIDUALLY for best accuracy
             product_list = list(reference_images_dict.items())
             total_products = len(product_list)
             
             for product_idx, (product_name, product_image) in enumerate(product_list, 1):
-                print(f"\n{'=' * 60}")
-                print(f"🔍 Product {product_idx}/{total_products}: {product_name}")
-                print(f"{'=' * 60}")
-                
-                # Process in batches for this specific product
-                batch_size = 50
-                total_batches = (len(videos) + batch_size - 1) // batch_size
-                
-                with ThreadPoolExecutor(max_workers=50) as executor:
-                    for batch_num in range(total_batches):
-                        start_idx = batch_num * batch_size
-                        end_idx = min(start_idx + batch_size, len(videos))
-                        batch = videos[start_idx:end_idx]
-                        
-                        print(f"\n📦 Batch {batch_num + 1}/{total_batches} ({len(batch)} videos)")
-                        print(f"   Videos {start_idx + 1}-{end_idx} of {len(videos)}")
-                        
-                        # Submit batch to thread pool
-                        futures = []
-                        for i, video in enumerate(batch):
-                            video_num = start_idx + i + 1
-                            future = executor.submit(
-                                process_single_video,
-                                model, product_image, video, video_num, len(videos)
-                            )
-                            futures.append((future, video))
-                        
-                        # Collect results for this product
-                        batch_matches = 0
-                        batch_errors = 0
-                        for future, video in futures:
-                            try:
-                                is_match, error = future.result(timeout=30)
-                                
-                                if error:
-                                    # Track error
-                                    error_count += 1
-                                    batch_errors += 1
-                                    error_types[error] = error_types.get(error, 0) + 1
-                                elif is_match:
-                                    # This video matches this product
-                                    product_matches[product_name].append(video)
-                                    videos_with_any_match.add(video['video_url'])
-                                    batch_matches += 1
-                            except Exception as e:
-                                print(f"  ⚠️ Thread error: {e}")
-                                error_count += 1
-                                batch_errors += 1
-                        
-                        print(f"   ✅ Batch complete: {batch_matches} matches, {batch_errors} errors")
-                        
-                        # Small delay between batches
-                        if batch_num < total_batches - 1:
-                            time.sleep(0.5)
-                
                 # Show summary for this product
                 matches_found = len(product_matches[product_name])
-                print(f"\n✅ {product_name}: {matches_found} matches found")
+                print(f"\n✅ Product {product_idx}/{total_products} {product_name}: {matches_found} matches found")
                 
-                # Save matches for this product immediately (if any matches found)
+                # Save matches for this product (if any matches found)
                 if matches_found > 0:
                     # Generate CSV filename from product name
                     product_base_name = os.path.splitext(product_name)[0]  # Remove extension
@@ -951,7 +803,7 @@ def find_matching_videos_multi_product(douyin_url, reference_images_dict, max_du
                             f.write(f"# Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
                             
                             # Write CSV data
-                            writer = csv.DictWriter(f, fieldnames=['video_url', 'thumbnail_url', 'likes', 'index'])
+                            writer = csv.DictWriter(f, fieldnames=with_backup_column(['video_url', 'thumbnail_url', 'likes', 'index'], product_matches[product_name]))
                             writer.writeheader()
                             writer.writerows(product_matches[product_name])
                         
@@ -1012,16 +864,17 @@ def find_matching_videos_multi_product(douyin_url, reference_images_dict, max_du
                 except:
                     pass
             
-            browser.close()
+            close_browser()
             return True
             
         except Exception as e:
             print(f"❌ Error during search: {e}")
-            browser.close()
+            close_browser()
             return False
 
 def main():
     """Main entry point"""
+    apply_budget_arg()
     # Try to load API key from .env file
     if os.path.exists('.env'):
         try:
@@ -8,10 +8,9 @@ import os
 import csv
 import sys
 from pathlib import Path
-import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
-import hashlib
+from bunny_store import BunnyStore
 
 def load_env():
     """Load environment variables from .env file"""
@@ -50,56 +49,6 @@ def setup_bunny():
     print(f"   CDN URL: {config['cdn_url']}")
     return config
 
-def upload_to_bunny(image_url, bunny_config, retries=3):
-    """Upload image URL to Bunny.net and return permanent CDN URL"""
-    
-    # Generate unique filename from URL
-    url_hash = hashlib.md5(image_url.encode()).hexdigest()
-    filename = f"douyin_thumbnails/{url_hash}.jpg"
-    
-    for attempt in range(retries):
-        try:
-            # Download the image
-            img_response = requests.get(image_url, timeout=30)
-            if img_response.status_code != 200:
-                print(f"  ❌ Failed to download image: HTTP {img_response.status_code}")
-                return None
-            
-            # Upload to Bunny Storage
-            upload_url = f"{bunny_config['storage_endpoint']}/{filename}"
-            headers = {
-                'AccessKey': bunny_config['api_key'],
-                'Content-Type': 'application/octet-stream'
-            }
-            
-            upload_response = requests.put(
-                upload_url,
-                headers=headers,
-                data=img_response.content,
-                timeout=30
-            )
-            
-            if upload_response.status_code == 201:
-                # Return CDN URL
-                cdn_url = f"{bunny_config['cdn_url']}/{filename}"
-                return cdn_url
-            else:
-                if attempt < retries - 1:
-                    print(f"  ⚠️ Upload failed (attempt {attempt + 1}/{retries}), retrying...")
-                    continue
-                else:
-                    print(f"  ❌ Upload failed after {retries} attempts: HTTP {upload_response.status_code}")
-                    return None
-                    
-        except Exception as e:
-            if attempt < retries - 1:
-                print(f"  ⚠️ Error (attempt {attempt + 1}/{retries}): {e}, retrying...")
-                continue
-            else:
-                print(f"  ❌ Unexpected error after {retries} attempts: {e}")
-                return None
-    return None
-
 def read_csv_with_comments(csv_path):
     """Read CSV file preserving header comments (lines starting with #)"""
     comments = []
@@ -180,6 +129,7 @@ def backup_thumbnails(csv_path, bunny_config):
     successful = 0
     failed = 0
     lock = threading.Lock()
+    store = BunnyStore(bunny_config)
     
     print(f"\n🔄 Uploading thumbnails to Cloudinary (parallel processing)...")
     print("=" * 50)
@@ -203,7 +153,7 @@ def backup_thumbnails(csv_path, bunny_config):
         with lock:
             print(f"  [{index + 1}/{len(rows)}] Uploading thumbnail...")
         
-        backup_url = upload_to_bunny(thumbnail_url, bunny_config)
+        backup_url = store.backup_url(thumbnail_url)
         
         if backup_url:
             row[backup_column] = backup_url
@@ -234,6 +184,9 @@ def backup_thumbnails(csv_path, bunny_config):
                 print(f"  ❌ Thread error: {e}")
                 failed += 1
     
+    store.save()
+    print(f"\n{store.summary()}")
+    
     # Check if too many failures overall (not consecutive since we're parallel)
     failure_rate = failed / len(rows) if len(rows) > 0 else 0
     if failure_rate > 0.5 and failed > 10:
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Browser Session Reuse
+Opens the Playwright browser context used by the scrapers, optionally attaching to a
+long-lived browser so Douyin/AliPrice sessions stay warm between runs
+
+Modes (set in .env or the environment):
+  BROWSER_CDP_URL=http://localhost:9222   attach to a running browser via CDP
+  BROWSER_USER_DATA_DIR=browser_profile    reuse a persistent Chromium profile
+  (neither)                                fresh browser + cookies JSON (original behavior)
+
+A reused session only skips the CAPTCHA/login pause when it holds the site's login
+cookie (see LOGIN_MARKERS; override the names with DOUYIN_LOGIN_COOKIES /
+ALIPRICE_LOGIN_COOKIES, comma-separated).
+
+Start a long-lived browser once with:
+  python3 browser_session.py
+"""
+
+import os
+import sys
+import json
+import time
+
+DEFAULT_LAUNCH_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-web-security',
+    '--disable-features=IsolateOrigins,site-per-process'
+]
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
+
+DOUYIN_HTTP_HEADERS = {
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Referer': 'https://www.douyin.com/',
+}
+
+DOUYIN_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': DEFAULT_USER_AGENT,
+    'locale': 'en-US',
+    'timezone_id': 'America/New_York',
+    'extra_http_headers': DOUYIN_HTTP_HEADERS,
+}
+
+# Per site: (URL whose cookies are checked, setting that overrides the names, default
+# login cookie names). AliPrice has no known default - set ALIPRICE_LOGIN_COOKIES to
+# skip its login pause.
+LOGIN_MARKERS = {
+    'douyin': ('https://www.douyin.com/', 'DOUYIN_LOGIN_COOKIES', ('sessionid', 'sessionid_ss', 'sid_guard')),
+    'aliprice': ('https://www.aliprice.com/', 'ALIPRICE_LOGIN_COOKIES', ()),
+}
+
+DEFAULT_CDP_PORT = 9222
+DEFAULT_USER_DATA_DIR = 'browser_profile'
+
+
+def read_env_setting(name):
+    """Read a setting from the environment, falling back to the .env file"""
+    value = os.getenv(name)
+    if value is None and os.path.exists('.env'):
+        try:
+            with open('.env', 'r') as f:
+                for line in f:
+                    if line.startswith(f'{name}='):
+                        value = line.split('=', 1)[1]
+                        break
+        except Exception:
+            pass
+    return (value or '').strip()
+
+
+def get_session_mode():
+    """Return ('cdp', url), ('persistent', dir) or ('fresh', None) from the environment"""
+    cdp_url = read_env_setting('BROWSER_CDP_URL')
+    if cdp_url:
+        return ('cdp', cdp_url)
+
+    user_data_dir = read_env_setting('BROWSER_USER_DATA_DIR')
+    if user_data_dir:
+        return ('persistent', user_data_dir)
+
+    return ('fresh', None)
+
+
+def load_storage_state(cookies_file):
+    """Load a Playwright storage_state JSON file if it exists"""
+    if not cookies_file or not os.path.exists(cookies_file):
+        return None
+    try:
+        with open(cookies_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Error loading {cookies_file}: {e}")
+        return None
+
+
+def login_cookie(context, site):
+    """Name of an unexpired login cookie for site in the context, or None"""
+    if site not in LOGIN_MARKERS:
+        return None
+    url, setting, default_names = LOGIN_MARKERS[site]
+    configured = read_env_setting(setting)
+    names = [name.strip() for name in configured.split(',') if name.strip()] if configured else default_names
+    if not names:
+        return None
+    try:
+        cookies = context.cookies(url)
+    except Exception:
+        return None
+    now = time.time()
+    for cookie in cookies:
+        expires = cookie.get('expires', -1)
+        if cookie['name'] in names and cookie.get('value') and (expires is None or expires < 0 or expires > now):
+            return cookie['name']
+    return None
+
+
+def check_login(context, site):
+    """True if a reused context is still logged in to site (prints what it found)"""
+    marker = login_cookie(context, site)
+    if marker:
+        print(f"🔓 Reused session is logged in to {site} ({marker} cookie)")
+        return True
+    print(f"🔐 Reused session has no {site} login cookie - keeping the CAPTCHA/login pause")
+    return False
+
+
+def open_browser_context(p, context_options=None, storage_state_file=None, cookies=None,
+                         launch_args=None, headless=False, mode=None, login_site=None):
+    """Open a browser context, reusing a long-lived browser when configured
+
+    Args:
+        p: sync_playwright() instance
+        context_options: kwargs for new_context (viewport, user_agent, headers, ...)
+        storage_state_file: Playwright storage_state JSON to seed a fresh session
+        cookies: list of Playwright cookies to seed a fresh session
+        launch_args: Chromium command-line args
+        headless: Launch headless (fresh/persistent modes only)
+        mode: Override the configured session mode ('fresh' for extra browsers that
+              can't share a persistent profile)
+        login_site: LOGIN_MARKERS key ('douyin', 'aliprice') whose login cookie makes a
+              reused session warm
+
+    Returns:
+        tuple: (context, close_browser, is_warm)
+        - context: BrowserContext to open pages in
+        - close_browser: call instead of browser.close(); never kills a shared browser
+        - is_warm: True if the session was reused and still has login_site's login
+          cookie (skip manual CAPTCHA/login pauses)
+    """
+    context_options = dict(context_options or {})
+    launch_args = launch_args if launch_args is not None else DEFAULT_LAUNCH_ARGS
+    configured_mode, target = get_session_mode()
+    mode = mode or configured_mode
+
+    if mode == 'cdp':
+        print(f"♻️  Attaching to running browser: {target}")
+        browser = p.chromium.connect_over_cdp(target)
+        if browser.contexts:
+            context = browser.contexts[0]
+        else:
+            context = browser.new_context(**context_options)
+        existing_pages = list(context.pages)
+
+        def close_browser():
+            # Close only the tabs this run opened, then disconnect - the long-lived
+            # browser keeps running with its session
+            try:
+                for page in context.pages:
+                    if page not in existing_pages:
+                        page.close()
+                browser.close()
+            except Exception:
+                pass
+
+        return (context, close_browser, check_login(context, login_site))
+
+    if mode == 'persistent':
+        is_reused = os.path.isdir(target) and bool(os.listdir(target))
+        print(f"♻️  Using persistent browser profile: {target} ({'existing' if is_reused else 'new'})")
+        context = p.chromium.launch_persistent_context(
+            target,
+            headless=headless,
+            args=launch_args,
+            **context_options
+        )
+        if not is_reused:
+            seed_cookies(context, storage_state_file, cookies)
+
+        def close_browser():
+            try:
+                context.close()
+            except Exception:
+                pass
+
+        return (context, close_browser, is_reused and check_login(context, login_site))
+
+    browser = p.chromium.launch(headless=headless, args=launch_args)
+    storage_state = load_storage_state(storage_state_file)
+    if storage_state:
+        print(f"✅ Loading cookies from {storage_state_file}")
+        context_options['storage_state'] = storage_state
+    elif storage_state_file:
+        print(f"ℹ️ No cookies file found. Create '{storage_state_file}' to avoid login.")
+    context = browser.new_context(**context_options)
+    if cookies:
+        context.add_cookies(cookies)
+        print(f"🍪 Cookies loaded into browser context")
+
+    def close_browser():
+        try:
+            browser.close()
+        except Exception:
+            pass
+
+    return (context, close_browser, False)
+
+
+def seed_cookies(context, storage_state_file=None, cookies=None):
+    """Copy cookies from a storage_state file and/or a cookie list into a context"""
+    storage_state = load_storage_state(storage_state_file)
+    if storage_state and storage_state.get('cookies'):
+        context.add_cookies(storage_state['cookies'])
+        print(f"✅ Seeded profile with cookies from {storage_state_file}")
+    if cookies:
+        context.add_cookies(cookies)
+        print(f"🍪 Seeded profile with {len(cookies)} cookies")
+
+
+def main():
+    """Launch a long-lived Chromium that later runs attach to via BROWSER_CDP_URL"""
+    from playwright.sync_api import sync_playwright
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CDP_PORT
+    user_data_dir = read_env_setting('BROWSER_USER_DATA_DIR') or DEFAULT_USER_DATA_DIR
+
+    print("🌐 Long-lived Browser Session")
+    print("=" * 50)
+
+    with sync_playwright() as p:
+        context = p.chromium.launch_persistent_context(
+            user_data_dir,
+            headless=False,
+            args=DEFAULT_LAUNCH_ARGS + [f'--remote-debugging-port={port}'],
+            viewport=DOUYIN_CONTEXT_OPTIONS['viewport'],
+            user_agent=DEFAULT_USER_AGENT
+        )
+        page = context.pages[0] if context.pages else context.new_page()
+        page.goto('https://www.douyin.com/', wait_until='domcontentloaded', timeout=60000)
+
+        print(f"✅ Browser running with profile: {os.path.abspath(user_data_dir)}")
+        print(f"   Log in to Douyin and AliPrice / solve CAPTCHAs once in this window.")
+        print(f"\n   Then add this to your .env file:")
+        print(f"   BROWSER_CDP_URL=http://localhost:{port}")
+        print(f"\n   Press Ctrl+C to stop the browser.")
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n👋 Closing browser...")
+            context.close()
+
+
+if __name__ == "__main__":
+    main()
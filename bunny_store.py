@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Bunny.net Thumbnail Store
+Uploads thumbnails to Bunny.net under the SHA-256 of their bytes and remembers what is
+already stored, so re-running the backup scripts on overlapping data transfers almost
+nothing:
+
+- A source URL seen before (matched on host, path and query minus the signing parameters,
+  so a fresh x-expires/x-signature still counts) is answered from the manifest without
+  downloading anything.
+- Downloaded bytes whose hash is already stored are not uploaded again.
+- With the HEAD probe on, objects uploaded elsewhere (another machine, a lost manifest,
+  or the old URL-named objects) are found on the CDN instead of re-uploaded.
+
+The manifest is bunny_manifest.json, one section per storage zone.
+
+The scrapers can also back thumbnails up while they run (THUMBNAIL_BACKUP=on): bytes
+already downloaded for Gemini are handed to a background upload pool, so nothing is
+downloaded twice and signed URLs are saved before they expire.
+
+Settings (.env or environment):
+  BUNNY_HEAD_PROBE=on                check the CDN for an object before uploading it
+  THUMBNAIL_BACKUP=on                back up thumbnails at scrape time (needs the
+                                     BUNNY_API_KEY / BUNNY_STORAGE_ZONE credentials)
+  THUMBNAIL_BACKUP_WORKERS=8         concurrent scrape-time uploads
+"""
+
+import os
+import json
+import atexit
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import requests
+from browser_session import read_env_setting
+
+MANIFEST_PATH = 'bunny_manifest.json'
+OBJECT_FOLDER = 'douyin_thumbnails'
+SAVE_EVERY = 25
+DEFAULT_BACKUP_WORKERS = 8
+
+# Query parameters that change every time a URL is re-signed
+SIGNING_PARAMS = {'x-expires', 'x-signature', 'x-orig-authkey', 'x-orig-expires', 'x-orig-sign',
+                  'expires', 'signature', 'policy', 'key-pair-id', 'auth_key'}
+
+
+def url_key(image_url):
+    """Stable key for a source URL: host, path and query without the signing parameters"""
+    parts = urlsplit(image_url)
+    if not parts.netloc:
+        return image_url
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if name.lower() not in SIGNING_PARAMS)
+    key = f"{parts.netloc.lower()}{parts.path}"
+    return f"{key}?{urlencode(query)}" if query else key
+
+
+class BunnyStore:
+    """Uploads thumbnails by content hash, skipping anything already stored"""
+
+    def __init__(self, bunny_config, manifest_path=MANIFEST_PATH, head_probe=None):
+        self.config = bunny_config
+        self.manifest_path = manifest_path
+        self.head_probe = (head_probe if head_probe is not None
+                           else read_env_setting('BUNNY_HEAD_PROBE').lower() in ('on', '1', 'true', 'yes'))
+        self.lock = threading.Lock()
+        self.unsaved = 0
+        self.stats = {'known_urls': 0, 'known_content': 0, 'found_on_cdn': 0, 'uploaded': 0}
+
+        manifest = self.load_manifest()
+        zone = manifest.get(bunny_config['storage_zone']) or {}
+        self.content = dict(zone.get('content') or {})
+        self.urls = dict(zone.get('urls') or {})
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read {self.manifest_path}: {e}")
+            return {}
+
+    def save(self):
+        """Merge this run's entries into the manifest (temp file first so a crash can't corrupt it)"""
+        with self.lock:
+            manifest = self.load_manifest()
+            zone = manifest.setdefault(self.config['storage_zone'], {})
+            # Keep entries another process added since we loaded
+            zone['content'] = {**(zone.get('content') or {}), **self.content}
+            zone['urls'] = {**(zone.get('urls') or {}), **self.urls}
+            temp_path = f"{self.manifest_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            os.replace(temp_path, self.manifest_path)
+            self.unsaved = 0
+
+    def record(self, image_url, digest, cdn_url, stat):
+        with self.lock:
+            self.content[digest] = cdn_url
+            if image_url:
+                self.urls[url_key(image_url)] = digest
+            self.stats[stat] += 1
+            self.unsaved += 1
+            save_due = self.unsaved >= SAVE_EVERY
+        if save_due:
+            self.save()
+
+    def object_urls(self, name):
+        """(storage URL, CDN URL) for an object name"""
+        filename = f"{OBJECT_FOLDER}/{name}.jpg"
+        return (f"{self.config['storage_endpoint']}/{filename}", f"{self.config['cdn_url']}/{filename}")
+
+    def exists_on_cdn(self, cdn_url):
+        try:
+            return requests.head(cdn_url, timeout=10).status_code == 200
+        except Exception:
+            return False
+
+    def known_url(self, image_url):
+        """CDN URL for a source URL that is already backed up, or None"""
+        with self.lock:
+            digest = self.urls.get(url_key(image_url))
+            cdn_url = self.content.get(digest) if digest else None
+            if cdn_url:
+                self.stats['known_urls'] += 1
+        return cdn_url
+
+    def backup_url(self, image_url, retries=3):
+        """Back up a thumbnail URL and return its permanent CDN URL (None on failure)
+
+        The download is skipped when the URL is already in the manifest.
+        """
+        cdn_url = self.known_url(image_url)
+        if cdn_url:
+            return cdn_url
+
+        if self.head_probe:
+            # Objects uploaded before content naming are named by the URL's MD5
+            _, legacy_url = self.object_urls(hashlib.md5(image_url.encode()).hexdigest())
+            if self.exists_on_cdn(legacy_url):
+                self.record(image_url, f"url-md5:{hashlib.md5(image_url.encode()).hexdigest()}",
+                            legacy_url, 'found_on_cdn')
+                return legacy_url
+
+        for attempt in range(retries):
+            try:
+                img_response = requests.get(image_url, timeout=30)
+                if img_response.status_code != 200:
+                    print(f"  ❌ Failed to download image: HTTP {img_response.status_code}")
+                    return None
+                return self.backup_bytes(img_response.content, image_url, retries=retries)
+            except Exception as e:
+                if attempt < retries - 1:
+                    print(f"  ⚠️ Error (attempt {attempt + 1}/{retries}): {e}, retrying...")
+                    continue
+                print(f"  ❌ Unexpected error after {retries} attempts: {e}")
+                return None
+        return None
+
+    def backup_bytes(self, data, image_url=None, retries=3):
+        """Back up already-downloaded image bytes and return the CDN URL (None on failure)
+
+        The upload is skipped when the same content is already stored.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            cdn_url = self.content.get(digest)
+        if cdn_url:
+            self.record(image_url, digest, cdn_url, 'known_content')
+            return cdn_url
+
+        upload_url, cdn_url = self.object_urls(digest)
+        if self.head_probe and self.exists_on_cdn(cdn_url):
+            self.record(image_url, digest, cdn_url, 'found_on_cdn')
+            return cdn_url
+
+        headers = {
+            'AccessKey': self.config['api_key'],
+            'Content-Type': 'application/octet-stream'
+        }
+        for attempt in range(retries):
+            try:
+                upload_response = requests.put(upload_url, headers=headers, data=data, timeout=30)
+                if upload_response.status_code == 201:
+                    self.record(image_url, digest, cdn_url, 'uploaded')
+                    return cdn_url
+                if attempt < retries - 1:
+                    print(f"  ⚠️ Upload failed (attempt {attempt + 1}/{retries}), retrying...")
+                    continue
+                print(f"  ❌ Upload failed after {retries} attempts: HTTP {upload_response.status_code}")
+                return None
+            except Exception as e:
+                if attempt < retries - 1:
+                    print(f"  ⚠️ Error (attempt {attempt + 1}/{retries}): {e}, retrying...")
+                    continue
+                print(f"  ❌ Unexpected error after {retries} attempts: {e}")
+                return None
+        return None
+
+    def summary(self):
+        """One-line transfer summary for end-of-run output"""
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"🧬 Bunny dedup: {stats['uploaded']} uploaded, {stats['known_urls']} known URLs "
+                f"(no download), {stats['known_content']} duplicate images (no upload), "
+                f"{stats['found_on_cdn']} already on CDN")
+
+
+class ThumbnailBackup:
+    """Background Bunny uploads of thumbnails a scraper has already downloaded"""
+
+    def __init__(self, store, max_workers=DEFAULT_BACKUP_WORKERS):
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bunny-backup')
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def submit(self, image_url, data):
+        """Queue downloaded thumbnail bytes for upload (once per URL)"""
+        with self.lock:
+            if image_url in self.futures:
+                return
+            self.futures[image_url] = self.executor.submit(self.store.backup_bytes, data, image_url)
+
+    def backup_url(self, image_url):
+        """CDN URL for a thumbnail, waiting for its upload if one is queued ('' if none)"""
+        with self.lock:
+            future = self.futures.get(image_url)
+        if future:
+            try:
+                return future.result() or ''
+            except Exception as e:
+                print(f"  ⚠️ Thumbnail backup failed: {e}")
+                return ''
+        # Not downloaded this run (e.g. resumed from a checkpoint) - use the manifest if it knows it
+        return self.store.known_url(image_url) or ''
+
+    def annotate(self, videos):
+        """Set backup_thumbnail_url on each video dict (left empty for backup_thumbnails.py to retry)"""
+        for video in videos:
+            if not video.get('backup_thumbnail_url'):
+                video['backup_thumbnail_url'] = self.backup_url(video.get('thumbnail_url', ''))
+
+    def finish(self):
+        """Wait for queued uploads and write the manifest"""
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            queued = len(self.futures)
+        if queued:
+            self.store.save()
+            print(f"\n☁️  Scrape-time thumbnail backup: {queued} thumbnails")
+            print(self.store.summary())
+
+
+def with_backup_column(fieldnames, videos):
+    """CSV fieldnames plus backup_thumbnail_url when scrape-time backup is on
+
+    Fills backup_thumbnail_url on the videos (waiting for their uploads); returns the
+    fieldnames unchanged when backup is off.
+    """
+    backup = get_thumbnail_backup()
+    if not backup:
+        return fieldnames
+    backup.annotate(videos)
+    return list(fieldnames) + ['backup_thumbnail_url']
+
+
+def bunny_config_from_env():
+    """Bunny.net storage settings from .env/environment (None if credentials are missing)"""
+    api_key = read_env_setting('BUNNY_API_KEY')
+    storage_zone = read_env_setting('BUNNY_STORAGE_ZONE')
+    if not api_key or not storage_zone:
+        return None
+    return {
+        'api_key': api_key,
+        'storage_zone': storage_zone,
+        'storage_endpoint': f'https://storage.bunnycdn.com/{storage_zone}',
+        'cdn_url': f'https://{storage_zone}.b-cdn.net'
+    }
+
+
+_backup = None
+_backup_loaded = False
+_backup_lock = threading.Lock()
+
+
+def get_thumbnail_backup():
+    """Return the process-wide ThumbnailBackup, or None unless THUMBNAIL_BACKUP=on"""
+    global _backup, _backup_loaded
+    with _backup_lock:
+        if _backup_loaded:
+            return _backup
+        _backup_loaded = True
+
+        if read_env_setting('THUMBNAIL_BACKUP').lower() not in ('on', '1', 'true', 'yes'):
+            return None
+
+        bunny_config = bunny_config_from_env()
+        if not bunny_config:
+            print("⚠️ THUMBNAIL_BACKUP is on but BUNNY_API_KEY / BUNNY_STORAGE_ZONE are missing - not backing up")
+            return None
+
+        try:
+            max_workers = int(read_env_setting('THUMBNAIL_BACKUP_WORKERS') or DEFAULT_BACKUP_WORKERS)
+        except ValueError:
+            max_workers = DEFAULT_BACKUP_WORKERS
+
+        _backup = ThumbnailBackup(BunnyStore(bunny_config), max_workers=max(1, max_workers))
+        atexit.register(_backup.finish)
+        print(f"☁️  Scrape-time thumbnail backup enabled ({bunny_config['storage_zone']}, {max_workers} uploads at once)")
+        return _backup
@@ -2,12 +2,34 @@
 """
 Consolidate watch price CSVs into a master file.
 Filters for products with final_score > 90% and selects the cheapest 3 per reference watch.
+
+Runs are incremental: only new or changed CSVs are read (see master_watch_prices.manifest.json).
+
+Usage:
+  python3 consolidate_watch_prices.py             # process new/changed files
+  python3 consolidate_watch_prices.py --rebuild   # reprocess every file
 """
 
 import csv
 import os
+import sys
 import glob
 import re
+import json
+import heapq
+import hashlib
+
+SCORE_THRESHOLD = 90.0
+TOP_K = 3
+MANIFEST_VERSION = 1
+
+MASTER_FIELDNAMES = [
+    'ref_img_url',
+    'price1', 'price2', 'price3',
+    'final_score1', 'final_score2', 'final_score3',
+    'img_url1', 'img_url2', 'img_url3',
+    'aliprice_link1', 'aliprice_link2', 'aliprice_link3'
+]
 
 
 def extract_price_value(price_str):
@@ -21,106 +43,195 @@ def extract_price_value(price_str):
     return float('inf')
 
 
-def process_watch_csvs(input_folder, output_file):
+def file_sha1(path):
+    """SHA-1 of a file's bytes"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_path_for(output_file):
+    """Manifest stored next to the master CSV (master_watch_prices.manifest.json)"""
+    return os.path.splitext(output_file)[0] + '.manifest.json'
+
+
+def load_manifest(manifest_path, output_file):
+    """Load the processed-files manifest (empty if missing, unreadable or for another output)"""
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION and manifest.get('output_file') == os.path.basename(output_file):
+                return manifest
+        except Exception as e:
+            print(f"Warning: could not read manifest {manifest_path}: {e}")
+    return {'version': MANIFEST_VERSION, 'output_file': os.path.basename(output_file), 'files': {}}
+
+
+def save_manifest(manifest_path, manifest):
+    """Save the manifest (written to a temp file first so a crash can't corrupt it)"""
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+
+def build_master_row(csv_file):
+    """Stream one detailed CSV and build its master row
+    
+    Rows are read one at a time; a bounded heap keeps only the TOP_K cheapest products
+    scoring above SCORE_THRESHOLD (ties keep file order, like a stable sort).
+    
+    Returns:
+        tuple: (master row dict or None, row count, qualifying product count)
+    """
+    ref_img_url = None
+    heap = []
+    row_count = 0
+    qualifying = 0
+    
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        for seq, row in enumerate(csv.DictReader(f)):
+            row_count += 1
+            if ref_img_url is None:
+                # Reference image URL (same for all rows in this file)
+                ref_img_url = row.get('reference_image_url', '')
+            try:
+                if float(row.get('final_score', 0)) <= SCORE_THRESHOLD:
+                    continue
+            except ValueError:
+                continue
+            qualifying += 1
+            
+            # Max-heap on (price, position): the priciest/latest entry is evicted first
+            heapq.heappush(heap, (-extract_price_value(row.get('price', '')), -seq, row))
+            if len(heap) > TOP_K:
+                heapq.heappop(heap)
+    
+    if not heap:
+        return (None, row_count, qualifying)
+    
+    top = [row for _, _, row in sorted(heap, key=lambda entry: (-entry[0], -entry[1]))]
+    
+    master_row = {'ref_img_url': ref_img_url}
+    
+    # Add data for each of the top 3 (or fewer)
+    for i in range(TOP_K):
+        num = i + 1
+        if i < len(top):
+            master_row[f'price{num}'] = top[i].get('price', '')
+            master_row[f'final_score{num}'] = top[i].get('final_score', '')
+            master_row[f'img_url{num}'] = top[i].get('1688_product_image_url', '')
+            master_row[f'aliprice_link{num}'] = top[i].get('1688_url', '')
+        else:
+            # Fill with empty strings if fewer than 3 products
+            master_row[f'price{num}'] = ''
+            master_row[f'final_score{num}'] = ''
+            master_row[f'img_url{num}'] = ''
+            master_row[f'aliprice_link{num}'] = ''
+    
+    return (master_row, row_count, qualifying)
+
+
+def process_watch_csvs(input_folder, output_file, rebuild=False):
     """
-    Process all watch price CSV files and create master consolidated file.
+    Consolidate the watch price CSV files into the master file, incrementally.
+    
+    A manifest next to the master CSV records every processed file (mtime, size, SHA-1)
+    and the master row it produced. Only new or changed files are read again; when files
+    were only added and all sort after the files already in the master CSV, their rows are
+    appended; otherwise it is rewritten from the manifest without reopening unchanged
+    files. Either way rows stay in filename order, so the result is byte-for-byte what
+    --rebuild writes.
     
     Args:
         input_folder: Path to folder containing Watched_prices_detailed*.csv files
         output_file: Path to output master CSV file
+        rebuild: Ignore the manifest and reprocess every file
     """
     # Get all CSV files matching the pattern
     csv_pattern = os.path.join(input_folder, 'Watched_prices_detailed*.csv')
     csv_files = sorted(glob.glob(csv_pattern))
     
-    print(f"Found {len(csv_files)} CSV files to process")
+    manifest_path = manifest_path_for(output_file)
+    manifest = load_manifest(manifest_path, output_file)
+    fresh = rebuild or not os.path.exists(output_file)
+    if fresh:
+        manifest['files'] = {}
+    known = manifest['files']
     
-    # Store results for each reference image
-    master_data = []
+    current = {os.path.basename(csv_file): csv_file for csv_file in csv_files}
+    removed = [filename for filename in known if filename not in current]
+    added = []
+    changed = []
     
-    # Process each CSV file (one per reference watch)
-    for csv_file in csv_files:
-        filename = os.path.basename(csv_file)
-        print(f"\nProcessing {filename}...")
+    for filename, csv_file in current.items():
+        stat = os.stat(csv_file)
+        entry = known.get(filename)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            continue
         
+        sha1 = file_sha1(csv_file)
+        if entry and entry['sha1'] == sha1:
+            # Touched but not modified
+            entry.update(mtime=stat.st_mtime, size=stat.st_size)
+            continue
+        
+        print(f"\nProcessing {filename}...")
         try:
-            with open(csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                rows = list(reader)
-            
-            if not rows:
-                print(f"  No data found in {filename}")
-                continue
-            
-            # Get reference image URL (should be same for all rows in this file)
-            ref_img_url = rows[0].get('reference_image_url', '')
-            
-            # Filter for final_score > 90%
-            filtered_rows = []
-            for row in rows:
-                try:
-                    final_score = float(row.get('final_score', 0))
-                    if final_score > 90.0:
-                        filtered_rows.append(row)
-                except ValueError:
-                    continue
-            
-            print(f"  Found {len(filtered_rows)} products with score > 90%")
-            
-            if not filtered_rows:
-                print(f"  No products met the > 90% threshold")
-                continue
-            
-            # Sort by price (cheapest first)
-            filtered_rows.sort(key=lambda x: extract_price_value(x.get('price', '')))
-            
-            # Take top 3 cheapest
-            top_3 = filtered_rows[:3]
-            
-            # Build master row
-            master_row = {'ref_img_url': ref_img_url}
-            
-            # Add data for each of the top 3 (or fewer)
-            for i in range(3):
-                num = i + 1
-                if i < len(top_3):
-                    master_row[f'price{num}'] = top_3[i].get('price', '')
-                    master_row[f'final_score{num}'] = top_3[i].get('final_score', '')
-                    master_row[f'img_url{num}'] = top_3[i].get('1688_product_image_url', '')
-                    master_row[f'aliprice_link{num}'] = top_3[i].get('1688_url', '')
-                else:
-                    # Fill with empty strings if fewer than 3 products
-                    master_row[f'price{num}'] = ''
-                    master_row[f'final_score{num}'] = ''
-                    master_row[f'img_url{num}'] = ''
-                    master_row[f'aliprice_link{num}'] = ''
-            
-            master_data.append(master_row)
-            print(f"  Added to master with {len(top_3)} product(s)")
-            
+            master_row, row_count, qualifying = build_master_row(csv_file)
         except Exception as e:
             print(f"  Error processing {filename}: {e}")
             continue
+        
+        if row_count == 0:
+            print(f"  No data found in {filename}")
+        elif master_row is None:
+            print(f"  Found {qualifying} products with score > 90%")
+            print(f"  No products met the > 90% threshold")
+        else:
+            print(f"  Found {qualifying} products with score > 90%")
+            print(f"  Added to master with {min(qualifying, TOP_K)} product(s)")
+        
+        (changed if entry else added).append(filename)
+        known[filename] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': sha1, 'row': master_row}
+    
+    for filename in removed:
+        del known[filename]
+    
+    print(f"\nFound {len(csv_files)} CSV files: {len(added)} new, {len(changed)} changed, "
+          f"{len(removed)} removed, {len(csv_files) - len(added) - len(changed)} unchanged")
+    
+    written = sorted(filename for filename in known if known[filename]['row'])
+    master_data = [known[filename]['row'] for filename in written]
+    new_files = [filename for filename in written if filename in added]
+    new_rows = [known[filename]['row'] for filename in new_files]
+    # Appending keeps filename order only if the new files all sort after the existing ones
+    appendable = not fresh and written[len(written) - len(new_files):] == new_files
     
     # Write master CSV
     if not master_data:
         print("\nNo data to write to master file!")
+        save_manifest(manifest_path, manifest)
         return
     
-    fieldnames = [
-        'ref_img_url',
-        'price1', 'price2', 'price3',
-        'final_score1', 'final_score2', 'final_score3',
-        'img_url1', 'img_url2', 'img_url3',
-        'aliprice_link1', 'aliprice_link2', 'aliprice_link3'
-    ]
-    
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(master_data)
+    if not (added or changed or removed):
+        print(f"\n✓ Master CSV already up to date: {output_file}")
+    elif not (changed or removed) and appendable:
+        # Only new files, all sorting last: append their rows instead of rewriting the master CSV
+        with open(output_file, 'a', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=MASTER_FIELDNAMES).writerows(new_rows)
+        print(f"\n✓ Appended {len(new_rows)} rows to master CSV: {output_file}")
+    else:
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=MASTER_FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(master_data)
+        print(f"\n✓ Master CSV created: {output_file}")
     
-    print(f"\n✓ Master CSV created: {output_file}")
+    save_manifest(manifest_path, manifest)
     print(f"✓ Total reference watches: {len(master_data)}")
 
 
@@ -142,7 +253,7 @@ def main():
         return
     
     # Process the files
-    process_watch_csvs(input_folder, output_file)
+    process_watch_csvs(input_folder, output_file, rebuild='--rebuild' in sys.argv[1:])
     
     print("\n" + "=" * 60)
     print("Done!")
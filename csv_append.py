@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Locked CSV Appends
+Appends rows to shared result CSVs (Watched_prices.csv, Watches.csv, Matches/*.csv) safely from several
+threads and several processes at once. Each append takes an exclusive fcntl lock on the
+file, writes the header only if the file is still empty under that lock, and writes all
+of its rows in one flush, so rows never interleave and headers are never duplicated.
+
+Where fcntl is unavailable (Windows) a per-path lock still covers threads in one process.
+"""
+
+import io
+import os
+import csv
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+
+def _path_lock(path):
+    """In-process lock for a path"""
+    key = os.path.abspath(path)
+    with _path_locks_lock:
+        if key not in _path_locks:
+            _path_locks[key] = threading.Lock()
+        return _path_locks[key]
+
+
+def _locked_append(path, render):
+    """Append the text render(f) builds from the open file, holding both locks"""
+    with _path_lock(path):
+        with open(path, mode='a+', newline='', encoding='utf-8') as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                # Another process may have created the file since we checked - decide under the lock
+                text = render(f)
+                f.seek(0, os.SEEK_END)
+                f.write(text)
+                f.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def append_csv_rows(path, header, rows):
+    """Append rows to a CSV, writing the header first if the file is new or empty
+
+    Args:
+        path: CSV file path
+        header: column names (written only to an empty file)
+        rows: list of row lists
+    """
+    def render(f):
+        f.seek(0, os.SEEK_END)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if f.tell() == 0:
+            writer.writerow(header)
+        writer.writerows(rows)
+        return buffer.getvalue()
+
+    _locked_append(path, render)
+
+
+def append_csv_dicts(path, fieldnames, rows):
+    """Append dict rows to a CSV, keeping the columns of an existing file
+
+    The header is read under the lock (skipping '#' comment lines), so rows line up with
+    the file even if it was started with other columns. A new or empty file gets
+    fieldnames as its header.
+
+    Args:
+        path: CSV file path
+        fieldnames: column names for a new file
+        rows: list of dicts
+    """
+    def render(f):
+        f.seek(0)
+        header = next(csv.reader(line for line in f if not line.startswith('#')), None)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=header or fieldnames, restval='', extrasaction='ignore')
+        if not header:
+            writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue()
+
+    _locked_append(path, render)
+
+
+def create_numbered_csv(folder, base_filename):
+    """Create and open a new folder/base_filename{N}.csv without racing other writers
+
+    The first free name (base_filename.csv, base_filename1.csv, ...) is claimed with an
+    exclusive create, so two processes can never pick the same file.
+
+    Returns:
+        tuple: (path, open file object for writing)
+    """
+    counter = 0
+    while True:
+        path = os.path.join(folder, f"{base_filename}{counter or ''}.csv")
+        try:
+            return (path, open(path, mode='x', newline='', encoding='utf-8'))
+        except FileExistsError:
+            counter += 1
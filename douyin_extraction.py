@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Douyin Incremental Extraction
+Shared scroll loop that harvests video cards as they load and removes them from the DOM,
+so long pages (5k+ videos) keep a constant per-scroll cost and a small tab footprint
+"""
+
+import re
+import time
+
+# Douyin uses a div with class 'route-scroll-container'; fall back for layouts without it
+SCROLL_CONTAINER_JS = """(
+    document.querySelector('.route-scroll-container') ||
+    document.querySelector('#douyin-right-container') ||
+    document.scrollingElement ||
+    document.body
+)"""
+
+# Harvest every card that already has a thumbnail, skip ids seen in earlier batches,
+# then remove the harvested cards. Cards whose thumbnail has not lazy-loaded yet stay
+# in the DOM and are picked up by a later batch. Seen ids live on the window so they
+# only have to be sent once per page.
+HARVEST_AND_CLEAR_JS = """
+    (seedIds) => {
+        if (!window.__harvestedVideoIds) window.__harvestedVideoIds = new Set();
+        const seen = window.__harvestedVideoIds;
+        seedIds.forEach(id => seen.add(id));
+        const videoLinks = document.querySelectorAll('a[href*="/video/"]');
+        const videos = [];
+        const toRemove = [];
+
+        videoLinks.forEach((link) => {
+            const videoUrl = link.href;
+            const match = videoUrl ? videoUrl.match(/\\/video\\/(\\d+)/) : null;
+            const videoId = match ? match[1] : videoUrl;
+            const container = link.closest('li') || link.closest('div[class*="video"]') || link;
+
+            if (!videoId) return;
+
+            // Already harvested in a previous batch (Douyin re-renders some cards)
+            if (seen.has(videoId)) {
+                toRemove.push(container);
+                return;
+            }
+
+            const img = link.querySelector('img');
+            const thumbnailUrl = img ? (img.src || img.getAttribute('data-src')) : null;
+            if (!thumbnailUrl || thumbnailUrl.startsWith('data:')) return;
+
+            let likes = '';
+            const likeSelectors = [
+                'span[class*="count"]',
+                'span[class*="like"]',
+                'div[class*="count"]',
+                'div[class*="digg"]',
+                'span[class*="digg"]'
+            ];
+
+            for (const selector of likeSelectors) {
+                const elements = container.querySelectorAll(selector);
+                for (const el of elements) {
+                    const text = el.textContent.trim();
+                    if (text && /[\\d.]+[wkm万千]?/i.test(text)) {
+                        likes = text;
+                        break;
+                    }
+                }
+                if (likes) break;
+            }
+
+            seen.add(videoId);
+            videos.push({
+                video_id: videoId,
+                video_url: videoUrl,
+                thumbnail_url: thumbnailUrl,
+                likes: likes || 'N/A'
+            });
+            toRemove.push(container);
+        });
+
+        // Clear harvested cards from DOM to free memory
+        toRemove.forEach(el => el.remove());
+
+        return {
+            videos: videos,
+            remaining: document.querySelectorAll('a[href*="/video/"]').length
+        };
+    }
+"""
+
+
+def extract_video_id(video_url):
+    """Extract the numeric Douyin video ID from a video URL (falls back to the URL itself)"""
+    if not video_url:
+        return None
+    match = re.search(r'/video/(\d+)', video_url)
+    return match.group(1) if match else video_url
+
+
+def harvest_and_clear(page, seen_ids, start_index=0, seed_page=False):
+    """Harvest new video cards from the DOM, remove them, and dedup against seen_ids
+
+    Args:
+        page: Playwright page
+        seen_ids: set of video IDs already harvested (updated in place)
+        start_index: number of videos harvested so far (used for the 'index' column)
+        seed_page: Send seen_ids to the page (only needed on the first call per page)
+
+    Returns:
+        tuple: (new_videos, remaining_cards_in_dom)
+    """
+    result = page.evaluate(HARVEST_AND_CLEAR_JS, list(seen_ids) if seed_page else [])
+
+    new_videos = []
+    for video in result.get('videos', []):
+        video_id = video.pop('video_id', None) or extract_video_id(video['video_url'])
+        if video_id in seen_ids:
+            continue
+        seen_ids.add(video_id)
+        video['index'] = start_index + len(new_videos) + 1
+        new_videos.append(video)
+
+    return new_videos, result.get('remaining', 0)
+
+
+def scroll_and_extract_incrementally(page, max_duration_minutes=30, batch_size=100,
+                                     max_scrolls=300, scroll_pause_time=2, seen_ids=None,
+                                     on_batch=None, stop_when_caught_up=False):
+    """Scroll a Douyin page, harvesting and clearing video cards as they load
+
+    Args:
+        page: Playwright page (already navigated, CAPTCHA done)
+        max_duration_minutes: Max time to scroll
+        batch_size: Harvest once this many cards are in the DOM (keeps DOM size bounded)
+        max_scrolls: Maximum scroll attempts
+        scroll_pause_time: Wait between scrolls (lower values trigger anti-bot)
+        seen_ids: Optional set of video IDs to skip (e.g. from a previous run)
+        on_batch: Optional callback(new_videos) called after each harvested batch
+        stop_when_caught_up: Stop once a full batch contains only seen_ids (pages list
+            newest first, so everything below is already known)
+
+    Returns:
+        list: video dicts with video_url, thumbnail_url, likes, index (unique by video ID)
+    """
+    print(f"⏬ Scrolling with incremental extraction (max {max_duration_minutes} minutes)...")
+
+    start_time = time.time()
+    max_duration_seconds = max_duration_minutes * 60
+    seen_ids = set(seen_ids) if seen_ids else set()
+    stop_on_seen = stop_when_caught_up and bool(seen_ids)
+
+    all_videos = []
+    previous_dom_count = None
+    no_new_videos_count = 0
+    scroll_count = 0
+    batch_num = 1
+    seed_page = True
+
+    def harvest():
+        nonlocal batch_num, seed_page
+        new_videos, remaining = harvest_and_clear(page, seen_ids, len(all_videos), seed_page)
+        seed_page = False
+        if new_videos:
+            all_videos.extend(new_videos)
+            print(f"  🗑️  Batch {batch_num}: Extracted {len(new_videos)} videos, cleared from DOM "
+                  f"(total: {len(all_videos)})")
+            batch_num += 1
+            if on_batch:
+                on_batch(new_videos)
+        return new_videos, remaining
+
+    while scroll_count < max_scrolls:
+        elapsed = time.time() - start_time
+        if elapsed > max_duration_seconds:
+            print(f"  ⏱️ Reached {max_duration_minutes} minute time limit")
+            break
+
+        # Scroll to bottom
+        page.evaluate(f"{SCROLL_CONTAINER_JS}.scrollTo(0, {SCROLL_CONTAINER_JS}.scrollHeight)")
+        time.sleep(scroll_pause_time)
+
+        dom_count = page.locator('a[href*="/video/"]').count()
+
+        if dom_count >= batch_size:
+            cards_before = dom_count
+            new_videos, dom_count = harvest()
+            if new_videos:
+                no_new_videos_count = 0
+                previous_dom_count = dom_count
+                scroll_count += 1
+                continue
+            # Nothing new but cards were cleared: the batch was entirely seen_ids
+            if stop_on_seen and dom_count < cards_before:
+                print(f"  ✅ Reached previously seen videos - caught up.")
+                break
+
+        # Check if no new videos are being loaded
+        if dom_count == previous_dom_count:
+            no_new_videos_count += 1
+            if no_new_videos_count >= 3:  # No new videos for 3 scrolls
+                print(f"  ✅ No more new videos.")
+                break
+        else:
+            no_new_videos_count = 0
+            print(f"  📊 {dom_count} videos in DOM, {len(all_videos)} extracted... (elapsed: {int(elapsed)}s)")
+
+        previous_dom_count = dom_count
+        scroll_count += 1
+
+    # Extract whatever is still in the DOM
+    harvest()
+
+    print(f"✅ Finished scrolling. Total unique videos: {len(all_videos)}")
+    return all_videos
@@ -11,6 +11,8 @@ import time
 import json
 from pathlib import Path
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+from douyin_extraction import scroll_and_extract_incrementally
+from browser_session import open_browser_context, DOUYIN_CONTEXT_OPTIONS
 
 def extract_user_id_from_url(url):
     """Extract user ID from Douyin URL"""
@@ -24,118 +26,6 @@ def extract_user_id_from_url(url):
     except Exception as e:
         return f"page_{hash(url) % 100000}"
 
-def scroll_and_load_all_videos(page, max_duration_minutes=30):
-    """Scroll page to load all videos with time limit"""
-    print(f"⏬ Scrolling to load all videos (max {max_duration_minutes} minutes)...")
-    
-    start_time = time.time()
-    max_duration_seconds = max_duration_minutes * 60
-    max_scrolls = 200
-    scroll_pause_time = 2
-    
-    previous_height = None
-    scroll_count = 0
-    
-    # Wait for page to fully load and find scroll container
-    print("  ⏳ Waiting for page to load...")
-    time.sleep(3)  # Give page time to fully render
-    
-    # Try to find the scroll container - use fallback if not found
-    scroll_container_selector = """
-        document.querySelector('.route-scroll-container') || 
-        document.querySelector('#douyin-right-container') || 
-        document.body
-    """
-    
-    while scroll_count < max_scrolls:
-        elapsed = time.time() - start_time
-        if elapsed > max_duration_seconds:
-            print(f"  ⏱️ Reached {max_duration_minutes} minute time limit")
-            break
-        
-        # Scroll to bottom
-        page.evaluate(f"({scroll_container_selector}).scrollTo(0, ({scroll_container_selector}).scrollHeight)")
-        time.sleep(scroll_pause_time)
-        
-        # Get current scroll height
-        current_height = page.evaluate(f"({scroll_container_selector}).scrollHeight")
-        video_count = page.locator('a[href*="/video/"]').count()
-        
-        # Check if height changed (new content loaded)
-        if current_height == previous_height:
-            print(f"  ✅ No more content to load. Found {video_count} videos.")
-            break
-        
-        print(f"  📊 Loaded {video_count} videos... (elapsed: {int(elapsed)}s)")
-        previous_height = current_height
-        scroll_count += 1
-    
-    final_count = page.locator('a[href*="/video/"]').count()
-    print(f"✅ Finished scrolling. Total videos: {final_count}")
-    return final_count
-
-def extract_videos_from_page(page):
-    """Extract video URLs, thumbnail URLs, and likes from page"""
-    print("🔍 Extracting video data from page...")
-    
-    try:
-        page.wait_for_selector('img', timeout=10000)
-        
-        videos = page.evaluate("""
-            () => {
-                const videoLinks = document.querySelectorAll('a[href*="/video/"]');
-                const videos = [];
-                
-                videoLinks.forEach((link, index) => {
-                    const videoUrl = link.href;
-                    const img = link.querySelector('img');
-                    const thumbnailUrl = img ? (img.src || img.getAttribute('data-src')) : null;
-                    
-                    let likes = '';
-                    const container = link.closest('li') || link.closest('div[class*="video"]');
-                    if (container) {
-                        const likeSelectors = [
-                            'span[class*="count"]',
-                            'span[class*="like"]',
-                            'div[class*="count"]',
-                            'div[class*="digg"]',
-                            'span[class*="digg"]'
-                        ];
-                        
-                        for (const selector of likeSelectors) {
-                            const elements = container.querySelectorAll(selector);
-                            for (const el of elements) {
-                                const text = el.textContent.trim();
-                                if (text && /[\d.]+[wkm万千]?/i.test(text)) {
-                                    likes = text;
-                                    break;
-                                }
-                            }
-                            if (likes) break;
-                        }
-                    }
-                    
-                    if (videoUrl && thumbnailUrl) {
-                        videos.push({
-                            video_url: videoUrl,
-                            thumbnail_url: thumbnailUrl,
-                            likes: likes || 'N/A',
-                            index: index + 1
-                        });
-                    }
-                });
-                
-                return videos;
-            }
-        """)
-        
-        print(f"✅ Extracted {len(videos)} videos with thumbnails and likes")
-        return videos
-        
-    except Exception as e:
-        print(f"❌ Error extracting videos: {e}")
-        return []
-
 def save_to_csv(videos, douyin_url, output_folder):
     """Save videos to CSV file in specified folder"""
     
@@ -216,41 +106,12 @@ def main():
     print(f"\n✅ Ready to process {len(page_urls)} pages")
     
     with sync_playwright() as p:
-        # Launch browser
-        browser = p.chromium.launch(
-            headless=False,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
-        )
-        
-        # Load cookies if available
-        cookies_file = 'douyin_cookies.json'
-        storage_state = None
-        
-        if os.path.exists(cookies_file):
-            print(f"\n✅ Loading cookies from {cookies_file}")
-            with open(cookies_file, 'r') as f:
-                storage_state = json.load(f)
-        
-        # Create context
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Referer': 'https://www.douyin.com/',
-            },
-            storage_state=storage_state
+        # Open browser context (attaches to a long-lived browser if configured)
+        context, close_browser, session_warm = open_browser_context(
+            p,
+            context_options=DOUYIN_CONTEXT_OPTIONS,
+            storage_state_file='douyin_cookies.json',
+            login_site='douyin'
         )
         
         try:
@@ -285,7 +146,7 @@ def main():
             
             if not pages:
                 print("❌ No pages loaded successfully!")
-                browser.close()
+                close_browser()
                 return False
             
             print(f"\n✅ Successfully loaded {len(pages)} out of {len(page_urls)} pages")
@@ -295,11 +156,14 @@ def main():
                     print(f"   - {url}")
             
             # Wait for user to complete ALL CAPTCHAs
-            print("\n⏸️  CAPTCHA Check - MULTI-PAGE MODE")
-            print("=" * 50)
-            print(f"Please complete CAPTCHAs in ALL {len(pages)} tabs if needed.")
-            print("When ALL CAPTCHAs are done, press ENTER to start scrolling...")
-            input()
+            if session_warm:
+                print("\n♻️  Warm browser session - skipping CAPTCHA pause")
+            else:
+                print("\n⏸️  CAPTCHA Check - MULTI-PAGE MODE")
+                print("=" * 50)
+                print(f"Please complete CAPTCHAs in ALL {len(pages)} tabs if needed.")
+                print("When ALL CAPTCHAs are done, press ENTER to start scrolling...")
+                input()
             
             # Phase 2: Process each page one by one
             print("\n🔄 Phase 2: Processing pages one by one...")
@@ -319,11 +183,12 @@ def main():
                 try:
                     print(f"\n✅ Starting video collection for page {i}...")
                     
-                    # Scroll and load all videos
-                    total_videos = scroll_and_load_all_videos(page, max_duration_minutes=30)
+                    # Give page time to fully render
+                    print("  ⏳ Waiting for page to load...")
+                    time.sleep(3)
                     
-                    # Extract video data
-                    videos = extract_videos_from_page(page)
+                    # Scroll and extract videos incrementally (keeps DOM small)
+                    videos = scroll_and_extract_incrementally(page, max_duration_minutes=30)
                     
                     if not videos:
                         print(f"⚠️ No videos found on page {i}!")
@@ -367,12 +232,12 @@ def main():
                 print(f"  - {csv_file}")
             print(f"{'=' * 50}")
             
-            browser.close()
+            close_browser()
             return True
             
         except Exception as e:
             print(f"❌ Error during collection: {e}")
-            browser.close()
+            close_browser()
             return False
 
 if __name__ == "__main__":
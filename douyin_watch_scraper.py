@@ -8,15 +8,25 @@ import os
 import sys
 import csv
 import time
+import asyncio
 import json
 from pathlib import Path
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+from douyin_extraction import scroll_and_extract_incrementally
+from browser_session import open_browser_context, read_env_setting, DOUYIN_CONTEXT_OPTIONS
 import google.generativeai as genai
 from PIL import Image
 import io
 import requests
-from concurrent.futures import ThreadPoolExecutor
-import imagehash
+from watch_fingerprint_index import FingerprintIndex
+from image_signature import compute_signature, phash_hex, SignatureIndex
+from image_pool import decode_image
+from gemini_client import wrap_model, run_batched
+from gemini_usage import apply_budget_arg
+from bunny_store import get_thumbnail_backup, with_backup_column
+
+# Videos per dedup batch; new watches are added to the database between batches
+DEDUP_BATCH_SIZE = 50
 
 def setup_gemini_api():
     """Setup Gemini API with user's API key"""
@@ -33,15 +43,19 @@ def setup_gemini_api():
     
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025')
+        model = wrap_model(genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025'))
         print("✅ Gemini API configured successfully (using gemini-2.5-flash-lite-preview-09-2025)")
         return model
     except Exception as e:
         print(f"❌ Error configuring Gemini API: {e}")
         return None
 
-def download_thumbnail(url):
-    """Download thumbnail from URL"""
+def download_thumbnail(url, with_signature=False, crop_resistant=False):
+    """Download thumbnail from URL
+    
+    Decoding/resizing (and hashing, if with_signature) runs in the image process pool.
+    Returns: PIL.Image or None, or (image, signature) if with_signature
+    """
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15'
@@ -49,22 +63,26 @@ def download_thumbnail(url):
         response = requests.get(url, headers=headers, timeout=25)
         response.raise_for_status()
         
-        image = Image.open(io.BytesIO(response.content))
+        backup = get_thumbnail_backup()
+        if backup:
+            backup.submit(url, response.content)  # same bytes go to Bunny in the background
+        
+        image, signature = decode_image(response.content, with_signature, crop_resistant)
+        if with_signature:
+            return (image, signature)
         return image
     except Exception as e:
         print(f"  ⚠️ Error downloading thumbnail: {e}")
-        return None
+        return (None, None) if with_signature else None
 
-def calculate_perceptual_hash(image):
-    """Calculate perceptual hash using pHash algorithm"""
-    try:
-        phash = imagehash.phash(image, hash_size=8)
-        return str(phash)
-    except Exception as e:
-        print(f"  ⚠️ Error calculating phash: {e}")
-        return None
+def calculate_perceptual_hash(image, crop_resistant=False):
+    """Calculate the composite image signature (pHash + dHash + colorhash [+ crop-resistant])"""
+    signature = compute_signature(image, crop_resistant)
+    if not signature:
+        print(f"  ⚠️ Error calculating image signature")
+    return signature
 
-def check_multiple_products(model, image):
+async def check_multiple_products(model, image):
     """Filter 1: Check if image contains multiple products
     Returns: (is_single_product: bool or None, error: str or None)
     """
@@ -87,7 +105,7 @@ Answer with ONLY ONE WORD:
 - "MULTIPLE" if two or more different products
 - "NONE" if no products visible'''
 
-            response = model.generate_content([prompt, image])
+            response = await model.generate_content_async([prompt, image], prompt_type='watch_single')
             
             if response and response.text:
                 answer = response.text.strip().upper()
@@ -107,7 +125,7 @@ Answer with ONLY ONE WORD:
             if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
                 if attempt < max_retries - 1:
                     print(f"  ⚠️ Rate limit hit, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
                 else:
@@ -117,7 +135,7 @@ Answer with ONLY ONE WORD:
     
     return (None, 'max_retries_exceeded')
 
-def extract_watch_attributes(model, image):
+async def extract_watch_attributes(model, image):
     """Filter 2: Extract watch attributes for fingerprinting
     Returns: (attributes_dict, error)
     """
@@ -151,7 +169,7 @@ DIAL_MARKERS_COLOR: [value]
 STRAP_TYPE: [value]
 STRAP_COLOR: [value]'''
 
-            response = model.generate_content([prompt, image])
+            response = await model.generate_content_async([prompt, image], prompt_type='watch_attributes')
             
             if response and response.text:
                 answer = response.text.strip()
@@ -185,7 +203,7 @@ STRAP_COLOR: [value]'''
             if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
                 if attempt < max_retries - 1:
                     print(f"  ⚠️ Rate limit hit, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
                 else:
@@ -195,7 +213,107 @@ STRAP_COLOR: [value]'''
     
     return (None, 'max_retries_exceeded')
 
-def compare_watches_visual(model, original_image, current_image):
+WATCH_ATTRIBUTE_KEYS = ['CASE_SHAPE', 'CASE_COLOR', 'DIAL_COLOR', 'DIAL_MARKERS',
+                        'DIAL_MARKERS_COLOR', 'STRAP_TYPE', 'STRAP_COLOR']
+
+def get_analysis_mode():
+    """'combined' (default): one structured call for product count + attributes
+    'separate': original check_multiple_products + extract_watch_attributes calls
+    """
+    mode = read_env_setting('WATCH_ANALYSIS_MODE').lower()
+    return 'separate' if mode == 'separate' else 'combined'
+
+async def analyze_watch_combined(model, image):
+    """Filters 1+2 in one call: product count verdict and watch attributes together
+    Returns: (is_single_product: bool or None, attributes_dict or None, error: str or None)
+    """
+    max_retries = 2
+    retry_delay = 2
+    
+    for attempt in range(max_retries):
+        try:
+            prompt = '''Look at this image carefully.
+
+First, how many DISTINCT watch/jewelry products are visible?
+Count separate products, not:
+- Same product shown from different angles
+- Reflections or shadows of one product
+- Product + packaging/box
+PRODUCT_COUNT: "SINGLE" if exactly one product, "MULTIPLE" if two or more different products, "NONE" if no products visible
+
+If PRODUCT_COUNT is SINGLE, analyze the watch and extract these attributes:
+
+1. CASE_SHAPE: round, square, rectangular, oval, triangular, other
+
+2. CASE_COLOR: Choose from: white, black, silver, gold, rose-gold, burgundy, navy, emerald, turquoise, beige, brown, pink, purple, orange, other
+
+3. DIAL_COLOR: Choose from: white, black, silver, gold, rose-gold, burgundy, navy, emerald, turquoise, beige, brown, pink, purple, orange, other
+
+4. DIAL_MARKERS: roman, arabic, minimalist, crystals, mixed, other
+
+5. DIAL_MARKERS_COLOR: The color of the hour markers/indices themselves. Choose from: white, black, silver, gold, rose-gold, burgundy, navy, emerald, turquoise, beige, brown, pink, purple, orange, other
+
+6. STRAP_TYPE: metal-bracelet, leather, fabric, other
+
+7. STRAP_COLOR: Choose from: white, black, silver, gold, rose-gold, burgundy, navy, emerald, turquoise, beige, brown, pink, purple, orange, other
+
+Respond with ONLY a JSON object in this EXACT format:
+{"PRODUCT_COUNT": "SINGLE", "CASE_SHAPE": "...", "CASE_COLOR": "...", "DIAL_COLOR": "...", "DIAL_MARKERS": "...", "DIAL_MARKERS_COLOR": "...", "STRAP_TYPE": "...", "STRAP_COLOR": "..."}
+
+If PRODUCT_COUNT is MULTIPLE or NONE, respond with only {"PRODUCT_COUNT": "MULTIPLE"} or {"PRODUCT_COUNT": "NONE"}.'''
+
+            response = await model.generate_content_async(
+                [prompt, image],
+                generation_config={'response_mime_type': 'application/json'},
+                prompt_type='watch_combined'
+            )
+            
+            if response and response.text:
+                answer = response.text.strip()
+                if answer.startswith('```'):
+                    answer = answer.strip('`').split('\n', 1)[-1]
+                
+                try:
+                    data = json.loads(answer)
+                except json.JSONDecodeError:
+                    return (None, None, 'invalid_response')
+                if not isinstance(data, dict):
+                    return (None, None, 'invalid_response')
+                
+                count = str(data.get('PRODUCT_COUNT', '')).strip().upper()
+                if count in ('MULTIPLE', 'NONE'):
+                    return (False, None, None)
+                if count != 'SINGLE':
+                    return (None, None, 'invalid_response')
+                
+                attributes = {
+                    key: str(data[key]).strip().lower()
+                    for key in WATCH_ATTRIBUTE_KEYS if data.get(key)
+                }
+                if all(key in attributes for key in WATCH_ATTRIBUTE_KEYS):
+                    return (True, attributes, None)
+                else:
+                    return (None, None, 'incomplete_attributes')
+            else:
+                return (None, None, 'empty_response')
+                
+        except Exception as e:
+            error_msg = str(e).lower()
+            
+            if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
+                if attempt < max_retries - 1:
+                    print(f"  ⚠️ Rate limit hit, retrying in {retry_delay}s...")
+                    await asyncio.sleep(retry_delay)
+                    retry_delay *= 2
+                    continue
+                else:
+                    return (None, None, 'rate_limit')
+            else:
+                return (None, None, f'api_error: {str(e)[:100]}')
+    
+    return (None, None, 'max_retries_exceeded')
+
+async def compare_watches_visual(model, original_image, current_image):
     """Visual comparison of two watches using AI
     Returns: (is_same: bool or None, error: str or None)
     """
@@ -221,7 +339,8 @@ Answer with ONLY ONE WORD:
 
 Be strict - only say MATCH if you're very confident."""
 
-            response = model.generate_content([prompt, original_image, current_image])
+            response = await model.generate_content_async([prompt, original_image, current_image],
+                                                          prompt_type='watch_verify')
             
             if response and response.text:
                 answer = response.text.strip().upper()
@@ -241,7 +360,7 @@ Be strict - only say MATCH if you're very confident."""
             if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
                 if attempt < max_retries - 1:
                     print(f"  ⚠️ Rate limit hit, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
                 else:
@@ -278,6 +397,10 @@ def load_database():
                 if 'ai_verifications' not in db:
                     db['ai_verifications'] = {}
                 
+                # Composite signature components (dhash/colorhash ints) keyed by phash
+                if 'signatures' not in db:
+                    db['signatures'] = {}
+                
                 print(f"✅ Loaded database: {len(db.get('phashes', {}))} phashes, {len(db.get('fingerprints', {}))} fingerprints")
                 return db
         except Exception as e:
@@ -288,7 +411,8 @@ def load_database():
     db = {
         'phashes': {},  # Dict to store phash -> URL mapping
         'fingerprints': {},
-        'ai_verifications': {}  # Track AI verification decisions
+        'ai_verifications': {},  # Track AI verification decisions
+        'signatures': {}  # phash -> other signature components
     }
     return db
 
@@ -305,12 +429,31 @@ def save_database(db):
         print(f"❌ Error saving database: {e}")
         return False
 
-def is_duplicate_phash(phash, db):
-    """Check if perceptual hash exists in database
+def build_signature_index(db):
+    """Index every stored image signature (phash-only legacy entries match on identical phash)"""
+    index = SignatureIndex()
+    for phash, urls in db.get('phashes', {}).items():
+        try:
+            signature = {'phash': int(phash, 16)}
+        except ValueError:
+            continue
+        signature.update(db.get('signatures', {}).get(phash, {}))
+        index.add(signature, phash)
+    return index
+
+def is_duplicate_phash(signature, db, signature_index=None):
+    """Check if a matching image signature exists in database
     Returns: (is_duplicate: bool, list of duplicate URLs or None)
     """
-    if phash in db.get('phashes', {}):
-        return (True, db['phashes'][phash])  # Returns list of URLs
+    if signature_index is None:
+        phash = phash_hex(signature)
+        if phash in db.get('phashes', {}):
+            return (True, db['phashes'][phash])  # Returns list of URLs
+        return (False, None)
+    
+    dup_phash, distances = signature_index.find(signature)
+    if dup_phash is not None:
+        return (True, db['phashes'].get(dup_phash, []))
     return (False, None)
 
 def is_duplicate_fingerprint(fingerprint, db):
@@ -321,7 +464,7 @@ def is_duplicate_fingerprint(fingerprint, db):
         return (True, db['fingerprints'][fingerprint]['thumbnail_url'])
     return (False, None)
 
-def add_to_database(db, phash, fingerprint, thumbnail_url):
+def add_to_database(db, phash, fingerprint, thumbnail_url, signature=None):
     """Add new watch to database"""
     # Add phash with URL (store as list to track all duplicates)
     if phash:
@@ -331,6 +474,12 @@ def add_to_database(db, phash, fingerprint, thumbnail_url):
             # Add to existing list if not already there
             if thumbnail_url not in db['phashes'][phash]:
                 db['phashes'][phash].append(thumbnail_url)
+        
+        # Remaining signature components, stored as ints keyed by phash
+        if signature:
+            db.setdefault('signatures', {})[phash] = {
+                key: value for key, value in signature.items() if key != 'phash'
+            }
     
     # Add fingerprint
     if fingerprint and fingerprint not in db['fingerprints']:
@@ -354,7 +503,8 @@ def add_ai_verification(db, video_url, fingerprint, original_url, ai_decision):
         'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
     }
 
-def process_watch_thumbnail(model, video, db, video_num, total):
+async def process_watch_thumbnail(model, video, db, video_num, total, analysis_mode='combined',
+                            fingerprint_index=None, signature_index=None, crop_resistant=False):
     """
     Process single watch through deduplication pipeline
     
@@ -362,26 +512,34 @@ def process_watch_thumbnail(model, video, db, video_num, total):
       result: dict if unique, None if duplicate/filtered
     """
     try:
-        # Step 1: Download thumbnail
-        image = download_thumbnail(video['thumbnail_url'])
+        # Step 1: Download thumbnail (decoded + hashed in the image process pool)
+        image, signature = await asyncio.to_thread(download_thumbnail, video['thumbnail_url'],
+                                                   with_signature=True, crop_resistant=crop_resistant)
         if not image:
             print(f"  [{video_num}/{total}] ⚠️ Failed to download thumbnail")
             return (None, 'download_failed')
         
-        # Step 2: Perceptual hash check
-        phash = calculate_perceptual_hash(image)
-        if not phash:
+        # Step 2: Composite image signature check (hashing and the index scan are CPU work -
+        # run them off the engine loop so in-flight Gemini calls keep moving)
+        if not signature:
+            signature = await asyncio.to_thread(calculate_perceptual_hash, image, crop_resistant)
+        if not signature:
             print(f"  [{video_num}/{total}] ⚠️ Failed to calculate phash")
             return (None, 'phash_failed')
+        phash = phash_hex(signature)
         
-        is_dup_phash, dup_urls = is_duplicate_phash(phash, db)
+        is_dup_phash, dup_urls = await asyncio.to_thread(is_duplicate_phash, signature, db, signature_index)
         if is_dup_phash:
-            print(f"  [{video_num}/{total}] ⏭️  SKIP - Duplicate image (phash)")
+            print(f"  [{video_num}/{total}] ⏭️  SKIP - Duplicate image (signature)")
             print(f"      Dups: {', '.join(dup_urls)}")
             return (None, 'duplicate_phash')
         
-        # Step 3: AI Filter 1 - Multiple products check
-        is_single, error = check_multiple_products(model, image)
+        # Step 3: AI Filters 1+2 - one structured call (or two separate calls)
+        if analysis_mode == 'combined':
+            is_single, attributes, error = await analyze_watch_combined(model, image)
+        else:
+            is_single, error = await check_multiple_products(model, image)
+            attributes = None
         if error:
             if 'rate_limit' in str(error):
                 print(f"  [{video_num}/{total}] 🚫 RATE LIMIT")
@@ -393,58 +551,74 @@ def process_watch_thumbnail(model, video, db, video_num, total):
             print(f"  [{video_num}/{total}] ⏭️  SKIP - Multiple products")
             return (None, 'multiple_products')
         
-        # Step 4: AI Filter 2 - Extract attributes
-        attributes, error = extract_watch_attributes(model, image)
-        if error:
-            if 'rate_limit' in str(error):
-                print(f"  [{video_num}/{total}] 🚫 RATE LIMIT")
-            else:
-                print(f"  [{video_num}/{total}] ⚠️ ERROR: {error}")
-            return (None, error)
+        # Step 4: AI Filter 2 - Extract attributes (separate mode only)
+        if attributes is None:
+            attributes, error = await extract_watch_attributes(model, image)
+            if error:
+                if 'rate_limit' in str(error):
+                    print(f"  [{video_num}/{total}] 🚫 RATE LIMIT")
+                else:
+                    print(f"  [{video_num}/{total}] ⚠️ ERROR: {error}")
+                return (None, error)
         
-        # Step 5: Fingerprint check
+        # Step 5: Fingerprint check - nearest prior watches by attribute distance
+        # (visual verification only runs when there is a close candidate)
         fingerprint = generate_watch_fingerprint(attributes)
-        is_dup_fingerprint, dup_url = is_duplicate_fingerprint(fingerprint, db)
+        if fingerprint_index is not None:
+            candidates = await asyncio.to_thread(fingerprint_index.nearest, attributes)
+        else:
+            is_dup_fingerprint, dup_url = is_duplicate_fingerprint(fingerprint, db)
+            candidates = [(fingerprint, 0, dup_url)] if is_dup_fingerprint else []
         
         fingerprint_match_but_different = False
         
-        if is_dup_fingerprint:
-            # Fingerprint match found - verify with AI visual comparison
-            print(f"  [{video_num}/{total}] 🔍 Fingerprint match - verifying visually...")
+        for candidate_fingerprint, distance, dup_url in candidates:
+            exact = distance == 0
+            if exact:
+                print(f"  [{video_num}/{total}] 🔍 Fingerprint match - verifying visually...")
+            else:
+                print(f"  [{video_num}/{total}] 🔍 Near fingerprint (distance {distance:g}) - verifying visually...")
             
             # Download original image
-            original_image = download_thumbnail(dup_url)
+            original_image = await asyncio.to_thread(download_thumbnail, dup_url)
             if not original_image:
-                print(f"  [{video_num}/{total}] ⚠️ Could not download original - treating as duplicate")
                 # Record verification attempt
-                add_ai_verification(db, video['video_url'], fingerprint, dup_url, 'ERROR_DOWNLOAD')
-                return (None, 'duplicate_fingerprint')
+                add_ai_verification(db, video['video_url'], candidate_fingerprint, dup_url, 'ERROR_DOWNLOAD')
+                if exact:
+                    print(f"  [{video_num}/{total}] ⚠️ Could not download original - treating as duplicate")
+                    return (None, 'duplicate_fingerprint')
+                continue
             
             # Compare visually with AI
-            is_same, error = compare_watches_visual(model, original_image, image)
+            is_same, error = await compare_watches_visual(model, original_image, image)
             if error:
                 if 'rate_limit' in str(error):
                     print(f"  [{video_num}/{total}] 🚫 RATE LIMIT during verification")
                 else:
                     print(f"  [{video_num}/{total}] ⚠️ Verification error: {error}")
                 # Record verification error
-                add_ai_verification(db, video['video_url'], fingerprint, dup_url, f'ERROR_{error}')
-                # On error, treat as duplicate (conservative approach)
-                return (None, f'duplicate_fingerprint_verify_error: {error}')
+                add_ai_verification(db, video['video_url'], candidate_fingerprint, dup_url, f'ERROR_{error}')
+                # On error with an exact match, treat as duplicate (conservative approach)
+                if exact:
+                    return (None, f'duplicate_fingerprint_verify_error: {error}')
+                continue
             
             if is_same:
                 print(f"  [{video_num}/{total}] ⏭️  SKIP - Duplicate confirmed by AI")
                 print(f"      Fingerprint: {fingerprint}")
+                if not exact:
+                    print(f"      Nearest: {candidate_fingerprint}")
                 print(f"      Dup: {dup_url[:80]}...")
                 # Record AI confirmed duplicate
-                add_ai_verification(db, video['video_url'], fingerprint, dup_url, 'MATCH')
+                add_ai_verification(db, video['video_url'], candidate_fingerprint, dup_url, 'MATCH')
                 return (None, 'duplicate_fingerprint')
             else:
-                print(f"  [{video_num}/{total}] ✨ Different watch! (same attributes but different design)")
                 # Record AI said different
-                add_ai_verification(db, video['video_url'], fingerprint, dup_url, 'NO')
-                # Mark this as a special case - will be tracked in stats
-                fingerprint_match_but_different = True
+                add_ai_verification(db, video['video_url'], candidate_fingerprint, dup_url, 'NO')
+                if exact:
+                    print(f"  [{video_num}/{total}] ✨ Different watch! (same attributes but different design)")
+                    # Mark this as a special case - will be tracked in stats
+                    fingerprint_match_but_different = True
         
         # Step 6: Unique watch found!
         print(f"  [{video_num}/{total}] ✅ UNIQUE WATCH - {fingerprint}")
@@ -453,6 +627,7 @@ def process_watch_thumbnail(model, video, db, video_num, total):
             'thumbnail_url': video['thumbnail_url'],
             'likes': video['likes'],
             'phash': phash,
+            'signature': signature,
             'fingerprint': fingerprint,
             'attributes': attributes,
             'fingerprint_match_but_different': fingerprint_match_but_different
@@ -462,106 +637,66 @@ def process_watch_thumbnail(model, video, db, video_num, total):
         print(f"  [{video_num}/{total}] ⚠️ Processing error: {e}")
         return (None, f'processing_error: {str(e)}')
 
-def scroll_and_load_all_videos(page, max_duration_minutes=30):
-    """Scroll page to load all videos with time limit"""
-    print(f"⏬ Scrolling to load all videos (max {max_duration_minutes} minutes)...")
+def deduplicate_watches(model, videos, db, max_workers=None):
+    """Run all videos through the deduplication pipeline and update db in place
     
-    start_time = time.time()
-    max_duration_seconds = max_duration_minutes * 60
-    max_scrolls = 200
-    scroll_pause_time = 2
+    max_workers is the number of videos in flight per batch (default 50). Watches in the
+    same batch are not deduplicated against each other until the next run, so this stays
+    smaller than GEMINI_MAX_IN_FLIGHT.
     
-    previous_height = None
-    scroll_count = 0
+    Returns: (unique_watches, stats)
+    """
+    # Process all thumbnails with parallel processing
+    analysis_mode = get_analysis_mode()
+    fingerprint_index = FingerprintIndex(db)
+    signature_index = build_signature_index(db)
+    crop_resistant = read_env_setting('WATCH_CROP_RESISTANT_HASH').lower() in ('1', 'true', 'yes')
+    print(f"\n🔎 Analyzing {len(videos)} videos with deduplication ({analysis_mode} AI analysis)...")
+    print("=" * 50)
+    
+    unique_watches = []
+    stats = {
+        'total': len(videos),
+        'duplicate_phash': 0,
+        'multiple_products': 0,
+        'duplicate_fingerprint': 0,
+        'fingerprint_match_but_different': 0,
+        'unique': 0,
+        'errors': 0
+    }
     
-    scroll_container_selector = "document.querySelector('.route-scroll-container')"
+    async def task(video, video_num, total):
+        return await process_watch_thumbnail(model, video, db, video_num, total, analysis_mode,
+                                             fingerprint_index, signature_index, crop_resistant)
     
-    while scroll_count < max_scrolls:
-        elapsed = time.time() - start_time
-        if elapsed > max_duration_seconds:
-            print(f"  ⏱️ Reached {max_duration_minutes} minute time limit")
-            break
-        
-        page.evaluate(f"{scroll_container_selector}.scrollTo(0, {scroll_container_selector}.scrollHeight)")
-        time.sleep(scroll_pause_time)
+    def on_result(video, outcome):
+        result, error = outcome if outcome else (None, 'timeout')
+        if error:
+            # Track error
+            if error in ('duplicate_phash', 'multiple_products', 'duplicate_fingerprint'):
+                stats[error] += 1
+                return 'skipped'
+            stats['errors'] += 1
+            return 'errors'
         
-        current_height = page.evaluate(f"{scroll_container_selector}.scrollHeight")
-        video_count = page.locator('a[href*="/video/"]').count()
+        unique_watches.append(result)
+        stats['unique'] += 1
         
-        if current_height == previous_height:
-            print(f"  ✅ No more content to load. Found {video_count} videos.")
-            break
+        # Track if this was a fingerprint match that AI said was different
+        if result.get('fingerprint_match_but_different', False):
+            stats['fingerprint_match_but_different'] += 1
         
-        print(f"  📊 Loaded {video_count} videos... (elapsed: {int(elapsed)}s)")
-        previous_height = current_height
-        scroll_count += 1
+        # Add to database
+        add_to_database(db, result['phash'], result['fingerprint'], result['thumbnail_url'],
+                        result['signature'])
+        fingerprint_index.add(result['fingerprint'], result['thumbnail_url'])
+        signature_index.add(result['signature'], result['phash'])
+        return 'unique watches'
     
-    final_count = page.locator('a[href*="/video/"]').count()
-    print(f"✅ Finished scrolling. Total videos: {final_count}")
-    return final_count
-
-def extract_videos_from_page(page):
-    """Extract video URLs, thumbnail URLs, and likes from page"""
-    print("🔍 Extracting video data from page...")
+    # Process in batches; timed-out Gemini calls go back to a retry queue
+    run_batched(videos, task, on_result, batch_size=max_workers or DEDUP_BATCH_SIZE)
     
-    try:
-        page.wait_for_selector('img', timeout=10000)
-        
-        videos = page.evaluate("""
-            () => {
-                const videoLinks = document.querySelectorAll('a[href*="/video/"]');
-                const videos = [];
-                
-                videoLinks.forEach((link, index) => {
-                    const videoUrl = link.href;
-                    const img = link.querySelector('img');
-                    const thumbnailUrl = img ? (img.src || img.getAttribute('data-src')) : null;
-                    
-                    let likes = '';
-                    
-                    const container = link.closest('li') || link.closest('div[class*="video"]');
-                    if (container) {
-                        const likeSelectors = [
-                            'span[class*="count"]',
-                            'span[class*="like"]',
-                            'div[class*="count"]',
-                            'div[class*="digg"]',
-                            'span[class*="digg"]'
-                        ];
-                        
-                        for (const selector of likeSelectors) {
-                            const elements = container.querySelectorAll(selector);
-                            for (const el of elements) {
-                                const text = el.textContent.trim();
-                                if (text && /[\d.]+[wkm万千]?/i.test(text)) {
-                                    likes = text;
-                                    break;
-                                }
-                            }
-                            if (likes) break;
-                        }
-                    }
-                    
-                    if (videoUrl && thumbnailUrl) {
-                        videos.push({
-                            video_url: videoUrl,
-                            thumbnail_url: thumbnailUrl,
-                            likes: likes || 'N/A',
-                            index: index + 1
-                        });
-                    }
-                });
-                
-                return videos;
-            }
-        """)
-        
-        print(f"✅ Extracted {len(videos)} videos with thumbnails and likes")
-        return videos
-        
-    except Exception as e:
-        print(f"❌ Error extracting videos: {e}")
-        return []
+    return (unique_watches, stats)
 
 def save_to_csv(unique_watches, douyin_url):
     """Save unique watches to CSV file"""
@@ -585,6 +720,7 @@ def save_to_csv(unique_watches, douyin_url):
             fieldnames = ['video_url', 'thumbnail_url', 'likes', 'case_shape', 'case_color', 
                          'dial_color', 'dial_markers', 'dial_markers_color', 'strap_type', 'strap_color', 
                          'fingerprint', 'phash']
+            fieldnames = with_backup_column(fieldnames, unique_watches)
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
             
@@ -603,6 +739,8 @@ def save_to_csv(unique_watches, douyin_url):
                     'fingerprint': watch['fingerprint'],
                     'phash': watch['phash']
                 }
+                if 'backup_thumbnail_url' in fieldnames:
+                    row['backup_thumbnail_url'] = watch['backup_thumbnail_url']
                 writer.writerow(row)
         
         print(f"💾 Saved {len(unique_watches)} unique watches to {csv_file}")
@@ -613,6 +751,7 @@ def save_to_csv(unique_watches, douyin_url):
 
 def main():
     """Main entry point"""
+    apply_budget_arg()
     # Try to load API key from .env file
     if os.path.exists('.env'):
         try:
@@ -642,43 +781,12 @@ def main():
     print(f"\n🌐 Opening Douyin page: {douyin_url}")
     
     with sync_playwright() as p:
-        # Launch browser with anti-detection settings
-        browser = p.chromium.launch(
-            headless=False,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
-        )
-        
-        # Load cookies if available
-        cookies_file = 'douyin_cookies.json'
-        storage_state = None
-        
-        if os.path.exists(cookies_file):
-            print(f"✅ Loading cookies from {cookies_file}")
-            with open(cookies_file, 'r') as f:
-                storage_state = json.load(f)
-        else:
-            print(f"ℹ️ No cookies file found. Create '{cookies_file}' to avoid login.")
-        
-        # Create context with realistic browser fingerprint
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Referer': 'https://www.douyin.com/',
-            },
-            storage_state=storage_state
+        # Open browser context (attaches to a long-lived browser if configured)
+        context, close_browser, session_warm = open_browser_context(
+            p,
+            context_options=DOUYIN_CONTEXT_OPTIONS,
+            storage_state_file='douyin_cookies.json',
+            login_site='douyin'
         )
         
         # Hide automation indicators
@@ -695,102 +803,29 @@ def main():
             page.goto(douyin_url, wait_until='networkidle', timeout=60000)
             
             # Wait for user to complete CAPTCHA manually
-            print("\n⏸️  CAPTCHA Check")
-            print("=" * 50)
-            print("If you see a CAPTCHA, please complete it now.")
-            print("When ready, press ENTER to start collecting videos...")
-            input()
+            if session_warm:
+                print("\n♻️  Warm browser session - skipping CAPTCHA pause")
+            else:
+                print("\n⏸️  CAPTCHA Check")
+                print("=" * 50)
+                print("If you see a CAPTCHA, please complete it now.")
+                print("When ready, press ENTER to start collecting videos...")
+                input()
             print("\n✅ Starting video collection...")
             
-            # Scroll and load all videos
-            total_videos = scroll_and_load_all_videos(page, max_duration_minutes=30)
-            
-            # Extract video data
-            videos = extract_videos_from_page(page)
+            # Scroll and extract videos incrementally (keeps DOM small)
+            videos = scroll_and_extract_incrementally(page, max_duration_minutes=30)
             
             if not videos:
                 print("❌ No videos found on page!")
-                browser.close()
+                close_browser()
                 return False
             
             # Load database
             print(f"\n📂 Loading watch database...")
             db = load_database()
             
-            # Process all thumbnails with parallel processing
-            print(f"\n🔎 Analyzing {len(videos)} videos with deduplication...")
-            print("=" * 50)
-            
-            unique_watches = []
-            stats = {
-                'total': len(videos),
-                'duplicate_phash': 0,
-                'multiple_products': 0,
-                'duplicate_fingerprint': 0,
-                'fingerprint_match_but_different': 0,
-                'unique': 0,
-                'errors': 0
-            }
-            
-            # Process in batches
-            batch_size = 50
-            total_batches = (len(videos) + batch_size - 1) // batch_size
-            
-            with ThreadPoolExecutor(max_workers=50) as executor:
-                for batch_num in range(total_batches):
-                    start_idx = batch_num * batch_size
-                    end_idx = min(start_idx + batch_size, len(videos))
-                    batch = videos[start_idx:end_idx]
-                    
-                    print(f"\n📦 Processing batch {batch_num + 1}/{total_batches} ({len(batch)} videos)")
-                    print(f"   Videos {start_idx + 1}-{end_idx} of {len(videos)}")
-                    
-                    # Submit all videos in batch to thread pool
-                    futures = []
-                    for i, video in enumerate(batch):
-                        video_num = start_idx + i + 1
-                        future = executor.submit(
-                            process_watch_thumbnail,
-                            model, video, db, video_num, len(videos)
-                        )
-                        futures.append((future, video))
-                    
-                    # Collect results
-                    batch_unique = 0
-                    for future, video in futures:
-                        try:
-                            result, error = future.result(timeout=30)
-                            
-                            if error:
-                                # Track error
-                                if error == 'duplicate_phash':
-                                    stats['duplicate_phash'] += 1
-                                elif error == 'multiple_products':
-                                    stats['multiple_products'] += 1
-                                elif error == 'duplicate_fingerprint':
-                                    stats['duplicate_fingerprint'] += 1
-                                else:
-                                    stats['errors'] += 1
-                            elif result:
-                                unique_watches.append(result)
-                                batch_unique += 1
-                                stats['unique'] += 1
-                                
-                                # Track if this was a fingerprint match that AI said was different
-                                if result.get('fingerprint_match_but_different', False):
-                                    stats['fingerprint_match_but_different'] += 1
-                                
-                                # Add to database
-                                add_to_database(db, result['phash'], result['fingerprint'], result['thumbnail_url'])
-                        except Exception as e:
-                            print(f"  ⚠️ Thread error: {e}")
-                            stats['errors'] += 1
-                    
-                    print(f"   ✅ Batch complete: {batch_unique} unique watches found")
-                    
-                    # Small delay between batches
-                    if batch_num < total_batches - 1:
-                        time.sleep(0.5)
+            unique_watches, stats = deduplicate_watches(model, videos, db)
             
             # Save database
             print(f"\n💾 Saving database...")
@@ -834,7 +869,7 @@ def main():
                     pass
             
             # Close browser after all processing is complete
-            browser.close()
+            close_browser()
             print(f"✅ Browser closed")
             
             return True
@@ -843,7 +878,7 @@ def main():
             print(f"❌ Error during scraping: {e}")
             import traceback
             traceback.print_exc()
-            browser.close()
+            close_browser()
             return False
 
 if __name__ == "__main__":
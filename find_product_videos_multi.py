@@ -8,14 +8,23 @@ import os
 import sys
 import csv
 import time
+import asyncio
 import json
 from pathlib import Path
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+from douyin_extraction import scroll_and_extract_incrementally
+from browser_session import open_browser_context, DOUYIN_CONTEXT_OPTIONS
+from match_cascade import get_match_cascade
+from gemini_client import wrap_model, run_batched
+from gemini_usage import apply_budget_arg
+from reference_cache import reference_context
 import google.generativeai as genai
 from PIL import Image
+from image_pool import decode_image
+from bunny_store import get_thumbnail_backup, with_backup_column
+from csv_append import append_csv_dicts
 import io
 import requests
-from concurrent.futures import ThreadPoolExecutor
 
 def setup_gemini_api():
     """Setup Gemini API with user's API key"""
@@ -33,7 +42,7 @@ def setup_gemini_api():
     try:
         genai.configure(api_key=api_key)
         # Use latest Gemini 2.5 Flash model (September 2025)
-        model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025')
+        model = wrap_model(genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025'))
         print("✅ Gemini API configured successfully (using gemini-2.5-flash-lite-preview-09-2025)")
         return model
     except Exception as e:
@@ -64,7 +73,11 @@ def download_thumbnail(url):
         response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
-        image = Image.open(io.BytesIO(response.content))
+        backup = get_thumbnail_backup()
+        if backup:
+            backup.submit(url, response.content)  # same bytes go to Bunny in the background
+        
+        image, _ = decode_image(response.content)  # decode in the image process pool
         return image
     except Exception as e:
         return None
@@ -80,14 +93,22 @@ def extract_user_id_from_url(url):
     except Exception as e:
         return None
 
-def compare_images_with_gemini(model, reference_image, thumbnail_image):
-    """Compare thumbnail with reference image using Gemini
+async def compare_images_with_gemini(model, reference_image, thumbnail_image):
+    """Compare thumbnail with reference image using Gemini (awaited on the Gemini engine)
     
     Returns:
         tuple: (result, error_type)
         - result: True if match, False if no match, None if error
         - error_type: None if success, 'rate_limit', 'api_error', etc.
     """
+    # Cascade: a cheap screening model rejects confident non-matches, the rest are confirmed below
+    cascade = get_match_cascade()
+    if cascade:
+        if not await cascade.should_escalate_async(reference_image, thumbnail_image):
+            return (False, None)
+        if cascade.confirm_model:
+            model = cascade.confirm_model
+    
     max_retries = 2
     retry_delay = 2
     
@@ -111,7 +132,10 @@ Answer with ONLY ONE WORD:
 
 Be strict - only say MATCH if you're confident it's the same product."""
 
-            response = model.generate_content([prompt, reference_image, thumbnail_image])
+            # Prompt + reference are registered once per run when GEMINI_REFERENCE_CACHE is on
+            async with reference_context(model, prompt, [reference_image], 'match') as context:
+                call_model, contents = context.request([thumbnail_image])
+                response = await call_model.generate_content_async(contents, prompt_type='match')
             
             if response and response.text:
                 answer = response.text.strip().upper()
@@ -126,7 +150,7 @@ Be strict - only say MATCH if you're confident it's the same product."""
             # Handle rate limit errors
             if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
                 else:
@@ -136,16 +160,16 @@ Be strict - only say MATCH if you're confident it's the same product."""
     
     return (None, 'max_retries_exceeded')
 
-def process_single_video(model, reference_image, video, video_num, total_videos):
+async def process_single_video(model, reference_image, video, video_num, total_videos):
     """Process a single video - download and compare"""
     try:
         # Download thumbnail
-        thumbnail = download_thumbnail(video['thumbnail_url'])
+        thumbnail = await asyncio.to_thread(download_thumbnail, video['thumbnail_url'])
         if not thumbnail:
             return (None, 'download_failed')
         
         # Compare with reference image
-        result, error = compare_images_with_gemini(model, reference_image, thumbnail)
+        result, error = await compare_images_with_gemini(model, reference_image, thumbnail)
         
         if error:
             if 'rate_limit' in error:
@@ -165,169 +189,38 @@ def process_single_video(model, reference_image, video, video_num, total_videos)
     except Exception as e:
         return (None, f'processing_error: {str(e)}')
 
-def extract_and_clear_batch(page, page_url, batch_num, total_extracted):
-    """Extract current batch of videos and clear them from DOM"""
-    try:
-        # Extract videos and mark them for removal
-        videos = page.evaluate("""
-            () => {
-                const videoLinks = document.querySelectorAll('a[href*="/video/"]');
-                const videos = [];
-                
-                videoLinks.forEach((link, index) => {
-                    const videoUrl = link.href;
-                    const img = link.querySelector('img');
-                    const thumbnailUrl = img ? (img.src || img.getAttribute('data-src')) : null;
-                    
-                    let likes = '';
-                    const container = link.closest('li') || link.closest('div[class*="video"]');
-                    if (container) {
-                        const likeSelectors = [
-                            'span[class*="count"]',
-                            'span[class*="like"]',
-                            'div[class*="count"]',
-                            'div[class*="digg"]',
-                            'span[class*="digg"]'
-                        ];
-                        
-                        for (const selector of likeSelectors) {
-                            const elements = container.querySelectorAll(selector);
-                            for (const el of elements) {
-                                const text = el.textContent.trim();
-                                if (text && /[\d.]+[wkm万千]?/i.test(text)) {
-                                    likes = text;
-                                    break;
-                                }
-                            }
-                            if (likes) break;
-                        }
-                    }
-                    
-                    if (videoUrl && thumbnailUrl) {
-                        videos.push({
-                            video_url: videoUrl,
-                            thumbnail_url: thumbnailUrl,
-                            likes: likes || 'N/A',
-                            index: index + 1
-                        });
-                    }
-                });
-                
-                // Clear all video links from DOM to free memory
-                videoLinks.forEach(link => {
-                    const container = link.closest('li') || link.closest('div[class*="video"]');
-                    if (container) {
-                        container.remove();
-                    } else {
-                        link.remove();
-                    }
-                });
-                
-                return videos;
-            }
-        """)
-        
-        # Add page_url and adjust index based on total extracted
-        for i, video in enumerate(videos):
-            video['source_page'] = page_url
-            video['index'] = total_extracted + i + 1
-        
-        print(f"  🗑️  Batch {batch_num}: Extracted {len(videos)} videos, cleared from DOM")
-        return videos
-        
-    except Exception as e:
-        print(f"  ⚠️ Error extracting batch: {e}")
-        return []
-
-def scroll_and_extract_with_cleanup(page, page_url, page_num, total_pages, max_duration_minutes=30):
-    """Scroll page, extract videos in batches, and clear DOM periodically"""
-    print(f"\n⏬ Scrolling Page {page_num}/{total_pages} with periodic extraction (max {max_duration_minutes} min)...")
-    
-    start_time = time.time()
-    max_duration_seconds = max_duration_minutes * 60
-    max_scrolls = 300
-    scroll_pause_time = 2  # Back to 2 seconds - 1 second was triggering anti-bot
-    batch_size = 500  # Extract and clear every 500 videos
-    
-    all_videos = []
-    previous_video_count = 0
-    no_new_videos_count = 0
-    scroll_count = 0
-    batch_num = 1
-    
-    scroll_container_selector = "document.querySelector('.route-scroll-container')"
-    
-    while scroll_count < max_scrolls:
-        elapsed = time.time() - start_time
-        if elapsed > max_duration_seconds:
-            print(f"  ⏱️ Reached {max_duration_minutes} minute time limit")
-            break
-        
-        # Scroll to bottom
-        page.evaluate(f"{scroll_container_selector}.scrollTo(0, {scroll_container_selector}.scrollHeight)")
-        time.sleep(scroll_pause_time)
-        
-        # Check current video count
-        current_video_count = page.locator('a[href*="/video/"]').count()
-        
-        # If we've loaded batch_size new videos, extract and clear
-        if current_video_count >= batch_size:
-            batch_videos = extract_and_clear_batch(page, page_url, batch_num, len(all_videos))
-            all_videos.extend(batch_videos)
-            batch_num += 1
-            previous_video_count = 0
-            no_new_videos_count = 0
-            print(f"  📊 Total extracted: {len(all_videos)} videos (elapsed: {int(elapsed)}s)")
-        
-        # Check if no new videos are being loaded
-        elif current_video_count == previous_video_count:
-            no_new_videos_count += 1
-            if no_new_videos_count >= 3:  # No new videos for 3 scrolls
-                # Extract remaining videos
-                if current_video_count > 0:
-                    print(f"  ✅ No more new videos. Extracting final batch...")
-                    batch_videos = extract_and_clear_batch(page, page_url, batch_num, len(all_videos))
-                    all_videos.extend(batch_videos)
-                break
-        else:
-            previous_video_count = current_video_count
-            no_new_videos_count = 0
-            print(f"  📊 Loaded {current_video_count} videos in DOM... (elapsed: {int(elapsed)}s)")
-        
-        scroll_count += 1
-    
-    print(f"✅ Page {page_num}/{total_pages} complete. Total extracted: {len(all_videos)} videos")
-    return all_videos
-
 def save_page_to_research(videos, page_url):
     """Save a single page's raw videos to Research folder immediately"""
     if not videos:
         return
     
-        research_folder = 'Research'
-        if not os.path.exists(research_folder):
-            os.makedirs(research_folder)
-        
-            user_id = extract_user_id_from_url(page_url)
-            if not user_id:
-                user_id = f"unknown_{hash(page_url) % 10000}"
-            
-            research_file = os.path.join(research_folder, f"{user_id}.csv")
-            
+    research_folder = 'Research'
+    if not os.path.exists(research_folder):
+        os.makedirs(research_folder)
+    
+    user_id = extract_user_id_from_url(page_url)
+    if not user_id:
+        user_id = f"unknown_{hash(page_url) % 10000}"
+    
+    research_file = os.path.join(research_folder, f"{user_id}.csv")
+    
     print(f"💾 Saving {len(videos)} raw videos to Research/{user_id}.csv...")
-            with open(research_file, 'w', newline='', encoding='utf-8') as f:
-                f.write(f"# Source Page: {page_url}\n")
+    with open(research_file, 'w', newline='', encoding='utf-8') as f:
+        f.write(f"# Source Page: {page_url}\n")
         f.write(f"# Total Videos: {len(videos)}\n")
-                f.write(f"# Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                
-                writer = csv.DictWriter(f, fieldnames=['video_url', 'thumbnail_url', 'likes', 'index', 'source_page'])
-                writer.writeheader()
-                writer.writerows(videos)
-            
+        f.write(f"# Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        
+        writer = csv.DictWriter(f, fieldnames=with_backup_column(['video_url', 'thumbnail_url', 'likes', 'index', 'source_page'], videos))
+        writer.writeheader()
+        writer.writerows(videos)
+    
     print(f"  ✅ Saved to Research/{user_id}.csv")
 
-def analyze_videos(videos, model, reference_image):
-    """Analyze a list of videos and return matches and non-matches"""
+def analyze_videos(videos, model, reference_image, max_workers=None):
+    """Analyze a list of videos and return matches and non-matches
+
+    max_workers is the number of videos in flight at once (default GEMINI_MAX_IN_FLIGHT).
+    """
     if not videos:
         return [], []
     
@@ -338,53 +231,25 @@ def analyze_videos(videos, model, reference_image):
     error_count = 0
     error_types = {}
     
-    # Process in batches
-    batch_size = 50
-    total_batches = (len(videos) + batch_size - 1) // batch_size
+    async def task(video, video_num, total):
+        return await process_single_video(model, reference_image, video, video_num, total)
     
-    with ThreadPoolExecutor(max_workers=50) as executor:
-        for batch_num in range(total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, len(videos))
-            batch = videos[start_idx:end_idx]
-            
-            print(f"\n📦 Processing batch {batch_num + 1}/{total_batches} ({len(batch)} videos)")
-            print(f"   Videos {start_idx + 1}-{end_idx} of {len(videos)}")
-            
-            # Submit all videos in batch
-            futures = []
-            for i, video in enumerate(batch):
-                video_num = start_idx + i + 1
-                future = executor.submit(
-                    process_single_video,
-                    model, reference_image, video, video_num, len(videos)
-                )
-                futures.append((future, video))
-            
-            # Collect results
-            batch_matches = 0
-            batch_errors = 0
-            for future, video in futures:
-                try:
-                    is_match, error = future.result(timeout=30)
-                    
-                    if error:
-                        error_count += 1
-                        batch_errors += 1
-                        error_types[error] = error_types.get(error, 0) + 1
-                    elif is_match:
-                        matching_videos.append(video)
-                        batch_matches += 1
-                    else:
-                        non_matching_videos.append(video)
-                except Exception as e:
-                    error_count += 1
-                    batch_errors += 1
-            
-            print(f"   ✅ Batch complete: {batch_matches} matches, {batch_errors} errors")
-            
-            if batch_num < total_batches - 1:
-                time.sleep(0.5)
+    def on_result(video, result):
+        nonlocal error_count
+        is_match, error = result if result else (None, 'timeout')
+        if error:
+            error_count += 1
+            error_types[error] = error_types.get(error, 0) + 1
+            return 'errors'
+        elif is_match:
+            matching_videos.append(video)
+            return 'matches'
+        else:
+            non_matching_videos.append(video)
+            return 'non-matches'
+    
+    # Process in batches; timed-out Gemini calls are retried instead of dropped
+    run_batched(videos, task, on_result, batch_size=max_workers)
     
     if error_count > 0:
         print(f"\n⚠️  Analysis errors: {error_count} videos")
@@ -398,8 +263,13 @@ def analyze_videos(videos, model, reference_image):
     
     return matching_videos, non_matching_videos
 
-def save_matches_incrementally(matches, output_csv, page_url, is_first_page, all_page_urls):
-    """Append matches to the Matches CSV file"""
+def save_matches_incrementally(matches, output_csv, page_url, is_first_page, all_page_urls, append=False):
+    """Append matches to the Matches CSV file
+
+    The first page normally starts a fresh file. With append=True (watchlist runs, which
+    match one page per job) the file is never truncated: rows are appended under a lock
+    and the header is written only when the file is new.
+    """
     if not matches:
         return
     
@@ -409,6 +279,12 @@ def save_matches_incrementally(matches, output_csv, page_url, is_first_page, all
     
     matches_file = os.path.join(matches_folder, output_csv)
     
+    if append:
+        print(f"💾 Appending {len(matches)} matches to {matches_file}...")
+        append_csv_dicts(matches_file, with_backup_column(['video_url', 'thumbnail_url', 'likes', 'index', 'source_page'], matches), matches)
+        print(f"  ✅ Saved {len(matches)} matches")
+        return
+    
     # Write mode: 'w' for first page, 'a' for subsequent pages
     mode = 'w' if is_first_page else 'a'
     
@@ -421,10 +297,10 @@ def save_matches_incrementally(matches, output_csv, page_url, is_first_page, all
                 f.write(f"#   {i}. {url}\n")
             f.write(f"# Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             
-            writer = csv.DictWriter(f, fieldnames=['video_url', 'thumbnail_url', 'likes', 'index', 'source_page'])
+            writer = csv.DictWriter(f, fieldnames=with_backup_column(['video_url', 'thumbnail_url', 'likes', 'index', 'source_page'], matches))
             writer.writeheader()
         else:
-            writer = csv.DictWriter(f, fieldnames=['video_url', 'thumbnail_url', 'likes', 'index', 'source_page'])
+            writer = csv.DictWriter(f, fieldnames=with_backup_column(['video_url', 'thumbnail_url', 'likes', 'index', 'source_page'], matches))
         
         writer.writerows(matches)
     
@@ -448,41 +324,12 @@ def find_matching_videos_multi(page_urls, reference_image_path, output_csv='matc
         return False
     
     with sync_playwright() as p:
-        # Launch browser
-        browser = p.chromium.launch(
-            headless=False,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
-        )
-        
-        # Load cookies if available
-        cookies_file = 'douyin_cookies.json'
-        storage_state = None
-        
-        if os.path.exists(cookies_file):
-            print(f"✅ Loading cookies from {cookies_file}")
-            with open(cookies_file, 'r') as f:
-                storage_state = json.load(f)
-        
-        # Create context
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Referer': 'https://www.douyin.com/',
-            },
-            storage_state=storage_state
+        # Open browser context (attaches to a long-lived browser if configured)
+        context, close_browser, session_warm = open_browser_context(
+            p,
+            context_options=DOUYIN_CONTEXT_OPTIONS,
+            storage_state_file='douyin_cookies.json',
+            login_site='douyin'
         )
         
         pages = []
@@ -517,7 +364,7 @@ def find_matching_videos_multi(page_urls, reference_image_path, output_csv='matc
             
             if not pages:
                 print("❌ No pages loaded successfully!")
-                browser.close()
+                close_browser()
                 return False
             
             print(f"\n✅ Successfully loaded {len(pages)} out of {len(page_urls)} pages")
@@ -527,11 +374,14 @@ def find_matching_videos_multi(page_urls, reference_image_path, output_csv='matc
                     print(f"   - {url}")
             
             # Wait for user to complete ALL CAPTCHAs
-            print("\n⏸️  CAPTCHA Check - MULTI-PAGE MODE")
-            print("=" * 50)
-            print(f"Please complete CAPTCHAs in ALL {len(pages)} tabs if needed.")
-            print("When ALL CAPTCHAs are done, press ENTER to start processing...")
-            input()
+            if session_warm:
+                print("\n♻️  Warm browser session - skipping CAPTCHA pause")
+            else:
+                print("\n⏸️  CAPTCHA Check - MULTI-PAGE MODE")
+                print("=" * 50)
+                print(f"Please complete CAPTCHAs in ALL {len(pages)} tabs if needed.")
+                print("When ALL CAPTCHAs are done, press ENTER to start processing...")
+                input()
             
             # Phase 2: Process each page SEQUENTIALLY (scroll → save → analyze → close)
             print("\n🔄 Phase 2: Sequential Processing (scroll → save → analyze → close)")
@@ -554,7 +404,10 @@ def find_matching_videos_multi(page_urls, reference_image_path, output_csv='matc
                 page.bring_to_front()
                 
                 # Step 1: Scroll and extract videos from THIS page
-                videos = scroll_and_extract_with_cleanup(page, current_page_url, i, len(pages), max_duration_minutes)
+                print(f"\n⏬ Scrolling Page {i}/{len(pages)} with incremental extraction...")
+                videos = scroll_and_extract_incrementally(page, max_duration_minutes)
+                for video in videos:
+                    video['source_page'] = current_page_url
                 
                 if not videos:
                     print(f"⚠️  No videos found on page {i}. Skipping...")
@@ -568,6 +421,10 @@ def find_matching_videos_multi(page_urls, reference_image_path, output_csv='matc
                 
                 # Step 3: Analyze videos from THIS page
                 page_matches, page_non_matches = analyze_videos(videos, model, reference_image)
+
+                # Thumbnails are downloaded now - rewrite the Research file with their backup URLs
+                if get_thumbnail_backup():
+                    save_page_to_research(videos, current_page_url)
                 
                 print(f"\n📊 Page {i} Results:")
                 print(f"   ✅ Matches: {len(page_matches)}")
@@ -604,6 +461,8 @@ def find_matching_videos_multi(page_urls, reference_image_path, output_csv='matc
             print(f"   📹 Total videos analyzed: {total_videos_processed}")
             print(f"   ✅ Total matches: {len(total_matching_videos)}")
             print(f"   ❌ Total non-matches: {len(total_non_matching_videos)}")
+            if get_match_cascade():
+                print(get_match_cascade().summary())
             print(f"\n💾 Results saved:")
             print(f"   Matches: Matches/{output_csv}")
             print(f"   Non-matches: Research/ folder (by user ID)")
@@ -618,16 +477,17 @@ def find_matching_videos_multi(page_urls, reference_image_path, output_csv='matc
                 except:
                     pass
             
-            browser.close()
+            close_browser()
             return True
             
         except Exception as e:
             print(f"❌ Error during search: {e}")
-            browser.close()
+            close_browser()
             return False
 
 def main():
     """Main entry point"""
+    apply_budget_arg()
     # Try to load API key from .env file
     if os.path.exists('.env'):
         try:
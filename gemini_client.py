@@ -0,0 +1,628 @@
+#!/usr/bin/env python3
+"""
+Gemini Call Layer
+Deadline-aware, optionally hedged Gemini calls on a shared asyncio engine plus a batch
+runner that sends timed-out/cancelled work back to a retry queue instead of counting it as
+a thread error
+
+- Requests go through the SDK's generate_content_async on one event loop; a semaphore
+  caps requests in flight (hundreds, not one thread each). Async batch tasks run on the
+  same loop, so matching/tagging/scoring/dedup no longer need a thread per video.
+- Every call gets a deadline (request timeout + local wait limit).
+- Once enough latencies are known, a call still running after the observed p95 fires one
+  duplicate request and takes whichever finishes first, limited by a hedging budget
+  (fraction of all calls).
+- Sustained 429/quota errors open a shared circuit breaker: batch runners stop dispatching,
+  checkpoint their pending queue to Checkpoints/ and resume after a cool-down.
+
+Settings (.env or environment):
+  GEMINI_MAX_IN_FLIGHT=200                 max concurrent Gemini requests per process
+  GEMINI_DEADLINE_SECONDS=25               per-call deadline
+  GEMINI_HEDGE_BUDGET=0.05                 max fraction of calls that may be hedged (0 disables)
+  GEMINI_QUOTA_COOLDOWN_SECONDS=60         first cool-down after the quota breaker opens
+  GEMINI_QUOTA_MAX_COOLDOWN_SECONDS=900    cool-down doubles per failed probe up to this
+  GEMINI_QUOTA_MAX_WAIT_MINUTES=0          give up after this much pausing (0 = wait it out)
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from browser_session import read_env_setting
+from gemini_usage import get_usage_tracker, prompt_type_of
+
+DEFAULT_DEADLINE_SECONDS = 25
+DEFAULT_HEDGE_BUDGET = 0.05
+DEFAULT_MAX_IN_FLIGHT = 200
+DEFAULT_QUOTA_COOLDOWN = 60
+DEFAULT_QUOTA_MAX_COOLDOWN = 900
+
+# Rate-limited retries per item while the quota breaker stays closed (sporadic 429s)
+MAX_QUOTA_REQUEUES = 3
+
+# Items sent after a cool-down to check whether the quota is back
+PROBE_BATCH_SIZE = 5
+
+CHECKPOINT_FOLDER = 'Checkpoints'
+
+# Latencies needed before p95 is trusted for hedging
+MIN_LATENCY_SAMPLES = 20
+
+# Threads for blocking work awaited from async tasks (thumbnail downloads)
+DEFAULT_IO_THREADS = 64
+
+class GeminiDeadlineExceeded(TimeoutError):
+    """generate_content did not finish within its deadline"""
+
+
+def read_float_setting(name, default):
+    """Read a float setting from .env/environment"""
+    try:
+        value = read_env_setting(name)
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+def is_retryable_error(error):
+    """True for errors that should go back to the retry queue (deadline/timeout/cancelled)"""
+    if not error:
+        return False
+    error = str(error).lower()
+    return 'deadline' in error or 'timeout' in error or 'timed out' in error or 'cancelled' in error
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window=200):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def p95(self):
+        """95th percentile latency, or None until enough samples exist"""
+        with self.lock:
+            if len(self.samples) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class AsyncGeminiEngine:
+    """Event loop on a background thread that owns every in-flight Gemini request
+
+    A semaphore (not a thread count) limits concurrency, so hundreds of requests can be in
+    flight at once. Coroutines are submitted from any thread; blocking callers wait on the
+    returned future.
+    """
+
+    def __init__(self, max_in_flight=None, io_threads=DEFAULT_IO_THREADS):
+        self.max_in_flight = max_in_flight or int(read_float_setting('GEMINI_MAX_IN_FLIGHT',
+                                                                     DEFAULT_MAX_IN_FLIGHT))
+        self.loop = asyncio.new_event_loop()
+        # Blocking helpers (downloads, SDKs without async support) run here via to_thread
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=io_threads,
+                                                          thread_name_prefix='gemini-io'))
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.thread = threading.Thread(target=self.loop.run_forever, name='gemini-engine', daemon=True)
+        self.thread.start()
+        self.semaphore = self.run(self._create_semaphore())
+
+    async def _create_semaphore(self):
+        return asyncio.Semaphore(self.max_in_flight)
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """Run a coroutine on the engine loop and block until it finishes"""
+        if threading.current_thread() is self.thread:
+            coro.close()
+            raise RuntimeError("AsyncGeminiEngine.run() called from the engine loop - await instead")
+        return self.submit(coro).result()
+
+    async def call(self, function, *args, **kwargs):
+        """Await function(*args, **kwargs) (a coroutine function) within the in-flight limit"""
+        async with self.semaphore:
+            with self.lock:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_gemini_engine():
+    """Return the process-wide AsyncGeminiEngine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncGeminiEngine()
+        return _engine
+
+
+class HedgedModel:
+    """Wraps a GenerativeModel; generate_content gets a deadline and optional hedging
+
+    Requests run on the AsyncGeminiEngine through the SDK's generate_content_async;
+    generate_content is the blocking form for code that is not async yet. Every other
+    attribute is passed through to the wrapped model.
+    """
+
+    def __init__(self, model, deadline=None, hedge_budget=None):
+        self.model = model
+        self.deadline = deadline or read_float_setting('GEMINI_DEADLINE_SECONDS', DEFAULT_DEADLINE_SECONDS)
+        self.hedge_budget = (hedge_budget if hedge_budget is not None
+                             else read_float_setting('GEMINI_HEDGE_BUDGET', DEFAULT_HEDGE_BUDGET))
+        self.latencies = LatencyTracker()
+        self.lock = threading.Lock()
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'deadline_exceeded': 0}
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def try_reserve_hedge(self):
+        """Reserve a hedge if the budget allows it"""
+        with self.lock:
+            if self.hedge_budget <= 0:
+                return False
+            if self.stats['hedged'] + 1 > self.stats['calls'] * self.hedge_budget:
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    async def _request(self, contents, kwargs, prompt_type):
+        """One SDK request (falls back to a thread for models without an async API)
+
+        Runs only once the engine admits it, so every request actually sent is recorded:
+        its real usage, or an estimated charge if it was cancelled, timed out or failed.
+        """
+        usage = get_usage_tracker()
+        model_name = getattr(self.model, 'model_name', None)
+        try:
+            if hasattr(self.model, 'generate_content_async'):
+                response = await self.model.generate_content_async(contents, **kwargs)
+            else:
+                response = await asyncio.to_thread(self.model.generate_content, contents, **kwargs)
+        except BaseException:
+            usage.record_estimate(model_name, prompt_type)
+            raise
+        usage.record(model_name, prompt_type, response)
+        return response
+
+    async def generate_content_async(self, contents, **kwargs):
+        """generate_content_async with a deadline; hedged after p95 latency within budget
+
+        Must be awaited on the engine loop (run_batched does this for async tasks).
+        prompt_type (optional keyword) labels the call in the usage/cost report.
+
+        Raises:
+            GeminiDeadlineExceeded: no response within the deadline
+            Exception: the API error if every attempt failed
+        """
+        engine = get_gemini_engine()
+        self.count('calls')
+        prompt_type = kwargs.pop('prompt_type', None) or prompt_type_of(contents)
+        kwargs.setdefault('request_options', {'timeout': self.deadline})
+
+        start = time.time()
+        primary = asyncio.ensure_future(engine.call(self._request, contents, kwargs, prompt_type))
+        pending = {primary}
+
+        last_error = None
+        try:
+            hedge_after = self.latencies.p95()
+            if hedge_after is not None and hedge_after < self.deadline:
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done and self.try_reserve_hedge():
+                    pending.add(asyncio.ensure_future(engine.call(self._request, contents, kwargs,
+                                                                  prompt_type)))
+
+            while pending:
+                remaining = self.deadline - (time.time() - start)
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    error = future.exception()
+                    if error is None:
+                        self.latencies.add(time.time() - start)
+                        if future is not primary:
+                            self.count('hedge_wins')
+                        return future.result()
+                    last_error = error
+        finally:
+            # Losing hedges, late requests and abandoned calls are really cancelled
+            for future in pending:
+                future.cancel()
+
+        if pending or last_error is None:
+            self.count('deadline_exceeded')
+            raise GeminiDeadlineExceeded(f"Gemini deadline exceeded after {self.deadline:.0f}s")
+        raise last_error
+
+    def generate_content(self, contents, **kwargs):
+        """Blocking generate_content: runs generate_content_async on the engine and waits"""
+        return get_gemini_engine().run(self.generate_content_async(contents, **kwargs))
+
+    def summary(self):
+        """One-line call summary"""
+        with self.lock:
+            stats = dict(self.stats)
+        engine = get_gemini_engine()
+        return (f"⏱️ Gemini calls: {stats['calls']}, hedged {stats['hedged']} "
+                f"(won {stats['hedge_wins']}), deadline exceeded {stats['deadline_exceeded']}, "
+                f"peak in flight {engine.peak_in_flight}/{engine.max_in_flight}")
+
+
+def wrap_model(model):
+    """Wrap a GenerativeModel in HedgedModel (no-op if already wrapped or None)"""
+    if model is None or isinstance(model, HedgedModel):
+        return model
+    return HedgedModel(model)
+
+
+class QuotaBreaker:
+    """Circuit breaker for sustained 429/quota errors, shared by every batch runner
+
+    Opens when most recent results are rate-limited, stays open for a cool-down that
+    doubles on every failed probe (up to max_cooldown), then lets a small probe batch
+    through; one success closes it again.
+    """
+
+    def __init__(self, cooldown=None, max_cooldown=None, window=20, min_errors=5, ratio=0.5):
+        self.base_cooldown = cooldown or read_float_setting('GEMINI_QUOTA_COOLDOWN_SECONDS',
+                                                            DEFAULT_QUOTA_COOLDOWN)
+        self.max_cooldown = max_cooldown or read_float_setting('GEMINI_QUOTA_MAX_COOLDOWN_SECONDS',
+                                                               DEFAULT_QUOTA_MAX_COOLDOWN)
+        self.min_errors = min_errors
+        self.ratio = ratio
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=window)
+        self.cooldown = self.base_cooldown
+        self.open_until = 0
+        self.half_open = False
+        self.trips = 0
+
+    def record(self, rate_limited):
+        """Record one finished call; returns True if this opened the breaker"""
+        with self.lock:
+            if self.open_until > time.time():
+                return False
+
+            if self.half_open:
+                if rate_limited:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    self._trip()
+                    return True
+                self.half_open = False
+                self.cooldown = self.base_cooldown
+                self.recent.clear()
+                return False
+
+            self.recent.append(rate_limited)
+            errors = sum(self.recent)
+            if errors >= self.min_errors and errors >= len(self.recent) * self.ratio:
+                self._trip()
+                return True
+            return False
+
+    def _trip(self):
+        self.open_until = time.time() + self.cooldown
+        self.half_open = True
+        self.trips += 1
+        self.recent.clear()
+
+    def seconds_until_closed(self):
+        """Seconds left in the current cool-down (0 if calls may be dispatched)"""
+        with self.lock:
+            return max(0, self.open_until - time.time())
+
+    def is_probing(self):
+        """True after a cool-down until the first probe result arrives"""
+        with self.lock:
+            return self.half_open and self.open_until <= time.time()
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_quota_breaker():
+    """Return the process-wide QuotaBreaker (the quota belongs to the API key, not the run)"""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = QuotaBreaker()
+        return _breaker
+
+
+def is_rate_limit_error(error):
+    """True for 429/quota errors"""
+    return bool(error) and 'rate_limit' in str(error)
+
+
+def checkpoint_path(name):
+    """Checkpoints/<name>.json with the name made filesystem-safe"""
+    safe_name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+    return os.path.join(CHECKPOINT_FOLDER, f"{safe_name}.json")
+
+
+def save_checkpoint(path, label, pending, state=None, resume_at=None, key=None):
+    """Write the pending queue (and caller state) so an interrupted run can resume
+
+    key identifies the run's inputs (e.g. a hash of the page URL and references);
+    load_checkpoint ignores the checkpoint when asked for a different key.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    checkpoint = {
+        'label': label,
+        'key': key,
+        'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'resume_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(resume_at)) if resume_at else None,
+        'pending': pending,
+        'state': state or {},
+    }
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path, key=None):
+    """Load a checkpoint written by run_batched
+
+    With a key, a checkpoint saved for different inputs is discarded instead of resumed.
+
+    Returns:
+        tuple: (pending items, state dict) or (None, None) if there is no usable checkpoint
+    """
+    if not path or not os.path.exists(path):
+        return (None, None)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if key is not None and checkpoint.get('key') != key:
+            print(f"⚠️ Discarding checkpoint {path}: it was saved for a different run")
+            clear_checkpoint(path)
+            return (None, None)
+        return (checkpoint.get('pending') or [], checkpoint.get('state') or {})
+    except Exception as e:
+        print(f"⚠️ Could not read checkpoint {path}: {e}")
+        return (None, None)
+
+
+def clear_checkpoint(path):
+    """Remove a checkpoint once its run has finished"""
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _run_thread_batch(executor, task, batch, total, deadline):
+    """Run one batch of a blocking task on the thread pool
+
+    Returns:
+        list: (num, item, result, exception) per item; result and exception are None if
+        the item did not finish before the deadline
+    """
+    futures = [(executor.submit(task, item, num, total), num, item) for num, item in batch]
+    wait([f for f, _, _ in futures], timeout=deadline)
+
+    finished = []
+    for future, num, item in futures:
+        if future.done() and not future.cancelled():
+            finished.append((num, item, None, future.exception()) if future.exception()
+                            else (num, item, future.result(), None))
+        else:
+            future.cancel()
+            finished.append((num, item, None, None))
+    return finished
+
+
+async def _run_async_batch(task, batch, total, deadline):
+    """Run one batch of an async task on the engine loop (same return shape as _run_thread_batch)"""
+    tasks = [asyncio.ensure_future(task(item, num, total)) for num, item in batch]
+    await asyncio.wait(tasks, timeout=deadline)
+
+    finished = []
+    for future, (num, item) in zip(tasks, batch):
+        if future.done() and not future.cancelled():
+            finished.append((num, item, None, future.exception()) if future.exception()
+                            else (num, item, future.result(), None))
+        else:
+            future.cancel()
+            finished.append((num, item, None, None))
+    return finished
+
+
+def run_batched(items, task, on_result, max_workers=50, batch_size=None, label='videos',
+                retry_rounds=1, batch_pause=0.5, checkpoint=None, checkpoint_state=None,
+                checkpoint_key=None):
+    """Run task(item, item_num, total) for all items in batches
+
+    task may be a coroutine function: its batches then run on the AsyncGeminiEngine loop,
+    limited only by GEMINI_MAX_IN_FLIGHT (batch_size defaults to that limit). Plain
+    functions run on a pool of max_workers threads in batches of 50.
+
+    on_result(item, result) is called on this thread for every finished item and returns a
+    short outcome key (e.g. 'matches', 'errors') that is counted per batch. result is None
+    if the item never finished.
+
+    Items that did not finish before the batch deadline, or whose error is retryable
+    (deadline/timeout/cancelled, see is_retryable_error), go to a retry queue and get
+    retry_rounds more passes before being reported as failures.
+
+    Rate-limited items go back to the front of the queue. When the shared QuotaBreaker
+    opens, dispatching stops: the pending queue (plus checkpoint_state(), if given) is
+    written to the checkpoint file, the runner sleeps out the cool-down and resumes with a
+    small probe batch. Items still rate-limited after MAX_QUOTA_REQUEUES are reported to
+    on_result but stay pending in the checkpoint, so a re-run picks them up; otherwise the
+    checkpoint is removed once every item has a result. checkpoint_key is stored with it
+    (see load_checkpoint).
+
+    Once the Gemini budget (gemini_usage) is reached, no further batches are dispatched;
+    the remaining items are checkpointed and left without a result.
+
+    Returns:
+        dict: outcome counts across all items, plus 'retried', 'quota_requeued', 'quota_pauses',
+        'quota_exhausted' and 'skipped (budget)' if the budget stopped the run
+    """
+    totals = {'retried': 0, 'quota_requeued': 0, 'quota_pauses': 0, 'quota_exhausted': 0}
+    total = len(items)
+    if not items:
+        clear_checkpoint(checkpoint)
+        return totals
+
+    # Worst case per item: download + two Gemini attempts, each bounded by the call deadline
+    call_deadline = read_float_setting('GEMINI_DEADLINE_SECONDS', DEFAULT_DEADLINE_SECONDS)
+    batch_deadline = call_deadline * 3 + 30
+    max_wait = read_float_setting('GEMINI_QUOTA_MAX_WAIT_MINUTES', 0) * 60
+
+    is_async = asyncio.iscoroutinefunction(task)
+    engine = get_gemini_engine() if is_async else None
+    if not batch_size:
+        batch_size = engine.max_in_flight if is_async else 50
+
+    breaker = get_quota_breaker()
+    usage = get_usage_tracker()
+    queue = deque((num, item) for num, item in enumerate(items, 1))
+    timeout_retries = {}
+    quota_retries = {}
+    quota_exhausted = []
+    last_results = {}
+    paused_seconds = 0
+    batch_num = 0
+
+    def record(outcome, counts):
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    def save_pending(resume_at=None):
+        # Quota-exhausted items already have a result but still need a real one next run
+        pending = [item for _, item in queue] + quota_exhausted
+        save_checkpoint(checkpoint, label, pending, checkpoint_state() if checkpoint_state else None,
+                        resume_at=resume_at, key=checkpoint_key)
+
+    # Threads start on first submit, so async runs never create any
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while queue:
+            if usage.budget_exceeded():
+                totals['skipped (budget)'] = len(queue)
+                print(f"   ⏭️ {len(queue)} {label} not dispatched (budget reached)")
+                if checkpoint:
+                    save_pending()
+                    print(f"   💾 Pending {label} kept in {checkpoint} - re-run to resume")
+                return totals
+
+            pause = breaker.seconds_until_closed()
+            if pause > 0:
+                if max_wait and paused_seconds + pause > max_wait:
+                    print(f"\n🛑 Gemini quota still exhausted after {paused_seconds / 60:.0f} min - "
+                          f"giving up on {len(queue)} {label}")
+                    if checkpoint:
+                        save_pending()
+                        print(f"   💾 Pending {label} kept in {checkpoint} - re-run to resume")
+                    while queue:
+                        num, item = queue.popleft()
+                        record(on_result(item, last_results.get(num)), totals)
+                    return totals
+
+                totals['quota_pauses'] += 1
+                print(f"\n⏸️ Gemini quota exhausted - pausing {len(queue)} {label} for {pause:.0f}s")
+                if checkpoint:
+                    save_pending(resume_at=time.time() + pause)
+                    print(f"   💾 Pending queue checkpointed to {checkpoint}")
+                time.sleep(pause)
+                paused_seconds += pause
+                print(f"▶️ Resuming with a probe batch")
+                continue
+
+            size = min(PROBE_BATCH_SIZE, batch_size) if breaker.is_probing() else batch_size
+            batch = [queue.popleft() for _ in range(min(size, len(queue)))]
+            batch_num += 1
+
+            print(f"\n📦 Processing batch {batch_num} ({len(batch)} {label}, {len(queue)} still queued)")
+            print(f"   {label.capitalize()} {batch[0][0]}-{batch[-1][0]} of {total}")
+
+            if is_async:
+                finished = engine.run(_run_async_batch(task, batch, total, batch_deadline))
+            else:
+                finished = _run_thread_batch(executor, task, batch, total, batch_deadline)
+
+            batch_counts = {}
+            deferred = []
+            for num, item, result, error in finished:
+                if error is not None:
+                    print(f"  ⚠️ Thread error: {error}")
+                    record(on_result(item, None), batch_counts)
+                    continue
+
+                unfinished = result is None
+                rate_limited = isinstance(result, tuple) and is_rate_limit_error(result[-1])
+                if not unfinished:
+                    breaker.record(rate_limited)
+
+                if rate_limited:
+                    # Quota errors never count against the item while the breaker is handling them
+                    last_results[num] = result
+                    breaker_open = breaker.seconds_until_closed() > 0 or breaker.is_probing()
+                    if breaker_open or quota_retries.get(num, 0) < MAX_QUOTA_REQUEUES:
+                        if not breaker_open:
+                            quota_retries[num] = quota_retries.get(num, 0) + 1
+                        deferred.append((num, item))
+                        record('deferred (quota)', batch_counts)
+                        continue
+                    quota_exhausted.append(item)
+
+                retryable = unfinished or (isinstance(result, tuple) and is_retryable_error(result[-1]))
+                if retryable and timeout_retries.get(num, 0) < retry_rounds:
+                    timeout_retries[num] = timeout_retries.get(num, 0) + 1
+                    queue.append((num, item))
+                    totals['retried'] += 1
+                    record('queued for retry', batch_counts)
+                    continue
+
+                record(on_result(item, result), batch_counts)
+
+            # Rate-limited items go first once dispatching resumes, keeping their order
+            queue.extendleft(reversed(deferred))
+            totals['quota_requeued'] += len(deferred)
+
+            for outcome, count in batch_counts.items():
+                if outcome not in ('queued for retry', 'deferred (quota)'):
+                    totals[outcome] = totals.get(outcome, 0) + count
+            summary = ', '.join(f"{count} {outcome}" for outcome, count in batch_counts.items())
+            print(f"   ✅ Batch complete: {summary or 'nothing to report'}")
+
+            if queue:
+                time.sleep(batch_pause)
+
+    totals['quota_exhausted'] = len(quota_exhausted)
+    if quota_exhausted and checkpoint:
+        save_pending()
+        print(f"   💾 {len(quota_exhausted)} rate-limited {label} kept in {checkpoint} - re-run to retry them")
+    else:
+        clear_checkpoint(checkpoint)
+    return totals
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Gemini Usage and Cost Accounting
+Records input/output/cached token counts from every response's usage_metadata, grouped
+by script, stage and prompt type, estimates cost from a per-model price table and
+enforces an optional budget. A cost report is written to Reports/ when the run ends.
+
+Requests that were sent but returned no response (cancelled hedges, timeouts, errors)
+are charged at the average cost of that prompt type's completed calls, since Gemini may
+still bill them.
+
+Settings (.env or environment):
+  GEMINI_BUDGET_USD=5.00              stop dispatching new work once this is spent
+                                      (scripts also accept --budget 5.00)
+  GEMINI_PRICE_INPUT_PER_M=0.10       override input price (USD per 1M tokens)
+  GEMINI_PRICE_OUTPUT_PER_M=0.40      override output price (USD per 1M tokens)
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from browser_session import read_env_setting
+
+# USD per 1M tokens: (input, output, cached input). Longest matching prefix wins.
+MODEL_PRICES = {
+    'gemini-2.5-pro': (1.25, 10.00, 0.31),
+    'gemini-2.5-flash': (0.30, 2.50, 0.075),
+    'gemini-2.5-flash-lite': (0.10, 0.40, 0.025),
+    'gemini-2.0-flash': (0.10, 0.40, 0.025),
+    'gemini-2.0-flash-lite': (0.075, 0.30, 0.01875),
+    'gemini-1.5-flash': (0.075, 0.30, 0.01875),
+    'gemini-1.5-pro': (1.25, 5.00, 0.3125),
+}
+DEFAULT_PRICES = MODEL_PRICES['gemini-2.5-flash-lite']
+
+# Tokens charged for a request without a response before any call of its kind completed
+ESTIMATED_INPUT_TOKENS = 1500
+ESTIMATED_OUTPUT_TOKENS = 200
+
+REPORT_FOLDER = 'Reports'
+
+
+def read_usd_setting(name):
+    """Read a dollar amount from .env/environment (None if unset or invalid)"""
+    try:
+        value = read_env_setting(name)
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+_price_cache = {}
+
+
+def model_prices(model_name):
+    """(input, output, cached input) USD per 1M tokens for a model name"""
+    if model_name in _price_cache:
+        return _price_cache[model_name]
+
+    name = (model_name or '').split('/')[-1]
+    matches = [prefix for prefix in MODEL_PRICES if name.startswith(prefix)]
+    input_price, output_price, cached_price = (MODEL_PRICES[max(matches, key=len)] if matches
+                                               else DEFAULT_PRICES)
+
+    input_override = read_usd_setting('GEMINI_PRICE_INPUT_PER_M')
+    output_override = read_usd_setting('GEMINI_PRICE_OUTPUT_PER_M')
+    if input_override is not None:
+        cached_price = cached_price * input_override / input_price if input_price else cached_price
+        input_price = input_override
+    if output_override is not None:
+        output_price = output_override
+
+    _price_cache[model_name] = (input_price, output_price, cached_price)
+    return _price_cache[model_name]
+
+
+def prompt_type_of(contents):
+    """Fallback prompt label: first line of the first text part"""
+    for part in contents if isinstance(contents, (list, tuple)) else [contents]:
+        if isinstance(part, str) and part.strip():
+            return part.strip().split('\n')[0][:40]
+    return 'unlabeled'
+
+
+class UsageTracker:
+    """Thread-safe token/cost totals per (script, stage, prompt type, model)"""
+
+    def __init__(self, budget=None):
+        self.lock = threading.Lock()
+        self.script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+        self.stage = 'main'
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.budget = budget if budget is not None else read_usd_setting('GEMINI_BUDGET_USD')
+        self.groups = {}
+        self.cost = 0.0
+        self.budget_warned = False
+
+    def set_stage(self, stage):
+        with self.lock:
+            self.stage = stage
+
+    def reset(self):
+        """Start a new run's accounting (keeps the budget)"""
+        with self.lock:
+            self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+            self.groups = {}
+            self.cost = 0.0
+            self.budget_warned = False
+
+    def set_budget(self, budget):
+        with self.lock:
+            self.budget = budget
+            self.budget_warned = False
+
+    def _group(self, model_name, prompt_type):
+        # Caller holds self.lock
+        model = (model_name or 'unknown').split('/')[-1]
+        key = (self.script, self.stage, prompt_type, model)
+        return self.groups.setdefault(key, {'calls': 0, 'estimated_calls': 0, 'input_tokens': 0,
+                                            'output_tokens': 0, 'cached_tokens': 0,
+                                            'cost_usd': 0.0, 'estimated_cost_usd': 0.0})
+
+    def record(self, model_name, prompt_type, response):
+        """Add one response's usage_metadata (responses without it count as a call only)"""
+        usage = getattr(response, 'usage_metadata', None)
+        input_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+        cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+
+        input_price, output_price, cached_price = model_prices(model_name)
+        cost = ((input_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+                + output_tokens * output_price) / 1_000_000
+
+        with self.lock:
+            group = self._group(model_name, prompt_type)
+            group['calls'] += 1
+            group['input_tokens'] += input_tokens
+            group['output_tokens'] += output_tokens
+            group['cached_tokens'] += cached_tokens
+            group['cost_usd'] += cost
+            self.cost += cost
+
+    def record_estimate(self, model_name, prompt_type):
+        """Charge a request that was sent but returned no response (cancelled, timed out, failed)
+
+        Uses the average cost of this group's completed calls, or ESTIMATED_*_TOKENS if none
+        has completed yet.
+        """
+        input_price, output_price, _ = model_prices(model_name)
+        with self.lock:
+            group = self._group(model_name, prompt_type)
+            completed = group['calls'] - group['estimated_calls']
+            if completed:
+                cost = (group['cost_usd'] - group['estimated_cost_usd']) / completed
+            else:
+                cost = (ESTIMATED_INPUT_TOKENS * input_price
+                        + ESTIMATED_OUTPUT_TOKENS * output_price) / 1_000_000
+            group['calls'] += 1
+            group['estimated_calls'] += 1
+            group['cost_usd'] += cost
+            group['estimated_cost_usd'] += cost
+            self.cost += cost
+
+    def budget_exceeded(self):
+        """True once the estimated spend has reached the budget"""
+        with self.lock:
+            exceeded = self.budget is not None and self.cost >= self.budget
+            if exceeded and not self.budget_warned:
+                self.budget_warned = True
+                print(f"\n💸 Budget reached: ${self.cost:.4f} of ${self.budget:.2f} - no new Gemini work will be dispatched")
+            return exceeded
+
+    def report(self):
+        """Cost report as a dict (groups sorted by cost)"""
+        with self.lock:
+            groups = [dict(zip(('script', 'stage', 'prompt_type', 'model'), key), **values)
+                      for key, values in self.groups.items()]
+            budget, cost = self.budget, self.cost
+
+        groups.sort(key=lambda g: g['cost_usd'], reverse=True)
+        totals = {field: sum(g[field] for g in groups)
+                  for field in ('calls', 'estimated_calls', 'input_tokens', 'output_tokens', 'cached_tokens')}
+        totals['cost_usd'] = round(cost, 6)
+        for group in groups:
+            group['cost_usd'] = round(group['cost_usd'], 6)
+            group['estimated_cost_usd'] = round(group['estimated_cost_usd'], 6)
+        return {
+            'script': self.script,
+            'started': self.started,
+            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'budget_usd': budget,
+            'budget_reached': budget is not None and cost >= budget,
+            'total': totals,
+            'groups': groups,
+        }
+
+    def summary(self):
+        """Printable cost summary"""
+        report = self.report()
+        total = report['total']
+        estimated = (f" ({total['estimated_calls']} without a response, cost estimated)"
+                     if total['estimated_calls'] else "")
+        lines = [f"💰 Gemini usage: {total['calls']} calls{estimated}, {total['input_tokens']:,} in / "
+                 f"{total['output_tokens']:,} out tokens ({total['cached_tokens']:,} cached), "
+                 f"~${total['cost_usd']:.4f}"
+                 + (f" of ${report['budget_usd']:.2f} budget" if report['budget_usd'] is not None else "")]
+        for group in report['groups']:
+            lines.append(f"   {group['stage']} / {group['prompt_type']} ({group['model']}): "
+                         f"{group['calls']} calls, {group['input_tokens']:,} in / "
+                         f"{group['output_tokens']:,} out, ~${group['cost_usd']:.4f}")
+        return '\n'.join(lines)
+
+    def write_report(self, folder=REPORT_FOLDER):
+        """Write Reports/cost_<script>_<timestamp>.json; returns its path (None if no calls)"""
+        report = self.report()
+        if not report['total']['calls']:
+            return None
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"cost_{self.script}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return path
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_usage_tracker():
+    """Return the process-wide UsageTracker"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = UsageTracker()
+        return _tracker
+
+
+def apply_budget_arg(argv=None):
+    """Take --budget <usd> / --budget=<usd> out of argv (sys.argv by default) and apply it
+
+    Removing the flag keeps the scripts' positional argument handling unchanged.
+    """
+    argv = sys.argv if argv is None else argv
+    budget = None
+    index = 1
+    while index < len(argv):
+        arg = argv[index]
+        if arg == '--budget' and index + 1 < len(argv):
+            budget = argv[index + 1]
+            del argv[index:index + 2]
+        elif arg.startswith('--budget='):
+            budget = arg.split('=', 1)[1]
+            del argv[index]
+        else:
+            index += 1
+
+    if budget is not None:
+        try:
+            get_usage_tracker().set_budget(float(budget))
+            print(f"💸 Gemini budget: ${float(budget):.2f}")
+        except ValueError:
+            print(f"⚠️ Invalid --budget '{budget}' - running without a budget")
+
+
+def _write_report_at_exit():
+    if _tracker is None:
+        return
+    try:
+        path = _tracker.write_report()
+        if path:
+            print(f"\n{_tracker.summary()}")
+            print(f"📄 Cost report: {path}")
+    except Exception as e:
+        print(f"⚠️ Could not write cost report: {e}")
+
+
+atexit.register(_write_report_at_exit)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Image Decode Pool
+Process pool for the CPU-bound part of thumbnail handling (PIL decode, composite hashing
+and, if the caller asks, mode conversion and resizing) so it no longer competes for the
+GIL with the 50 downloader/Gemini threads.
+
+Downloader threads hand raw bytes to decode_image(); bytes go to the worker and decoded
+pixels come back through a small set of reusable shared-memory slots, so whole images
+are never pickled and no segment is created per image. Images keep their original mode
+and size unless the caller passes mode/max_dim.
+
+Settings (.env or environment):
+  IMAGE_POOL_WORKERS=0     disable the pool (decode in the calling thread)
+  IMAGE_POOL_WORKERS=8     worker processes (default: CPU count)
+"""
+
+import os
+import io
+import queue
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from PIL import Image
+from image_signature import compute_signature
+from browser_session import read_env_setting
+
+# Bytes per shared-memory slot: holds the downloaded bytes in and the decoded pixels out.
+# Images that don't fit (rare for thumbnails) travel pickled instead.
+SLOT_SIZE = 4 * 1024 * 1024
+
+# Slots per worker process (one being decoded, one waiting)
+SLOTS_PER_WORKER = 2
+
+# Slots this worker process has attached to, by name (attached once, reused)
+_attached = {}
+
+
+def _decode(raw_bytes, mode=None, max_dim=None):
+    """Decode bytes, converting to mode and downscaling to max_dim only if asked"""
+    image = Image.open(io.BytesIO(raw_bytes))
+    if mode and image.mode != mode:
+        image = image.convert(mode)
+    if max_dim and max(image.size) > max_dim:
+        image.thumbnail((max_dim, max_dim), Image.LANCZOS)
+    return image
+
+
+def _attach(name):
+    slot = _attached.get(name)
+    if slot is None:
+        slot = _attached[name] = shared_memory.SharedMemory(name=name)
+    return slot
+
+
+def _pool_worker(slot_name, in_size, raw_bytes, mode, max_dim, with_signature, crop_resistant):
+    """Runs in a worker process: decode/hash the slot's bytes and write the pixels back
+
+    raw_bytes is only set when the input did not fit in the slot.
+
+    Returns:
+        tuple: (image header, pixel byte count, pixels if they did not fit else None,
+        signature or None)
+    """
+    slot = _attach(slot_name)
+    image = _decode(bytes(slot.buf[:in_size]) if raw_bytes is None else raw_bytes, mode, max_dim)
+    signature = compute_signature(image, crop_resistant) if with_signature else None
+    header = (image.mode, image.size,
+              image.getpalette() if image.mode in ('P', 'PA') else None,
+              image.info.get('transparency'))
+    pixels = image.tobytes()
+    if len(pixels) > slot.size:
+        return (header, len(pixels), pixels, signature)
+    slot.buf[:len(pixels)] = pixels
+    return (header, len(pixels), None, signature)
+
+
+def _rebuild(header, pixels):
+    """PIL image from a worker's header and raw pixels"""
+    image_mode, size, palette, transparency = header
+    image = Image.frombytes(image_mode, size, pixels)
+    if palette:
+        image.putpalette(palette)
+    if transparency is not None:
+        image.info['transparency'] = transparency
+    return image
+
+
+class ImageDecodePool:
+    """Shared process pool; decode() is safe to call from many threads"""
+
+    def __init__(self, max_workers=None, slot_size=SLOT_SIZE):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.slot_size = slot_size
+        self.max_slots = (max_workers or os.cpu_count() or 1) * SLOTS_PER_WORKER
+        self.lock = threading.Lock()
+        self.slots = []
+        self.free_slots = queue.LifoQueue()
+
+    def acquire_slot(self):
+        """A free slot, creating one while under max_slots (otherwise waits for one)"""
+        try:
+            return self.free_slots.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.slots) < self.max_slots:
+                slot = shared_memory.SharedMemory(create=True, size=self.slot_size)
+                self.slots.append(slot)
+                return slot
+        return self.free_slots.get()
+
+    def decode(self, raw_bytes, with_signature=False, crop_resistant=False, mode=None, max_dim=None):
+        """Decode (and optionally hash, convert and downscale) raw image bytes in a worker
+
+        Returns:
+            tuple: (PIL.Image, signature or None)
+        """
+        slot = self.acquire_slot()
+        try:
+            fits = len(raw_bytes) <= slot.size
+            if fits:
+                slot.buf[:len(raw_bytes)] = raw_bytes
+            future = self.executor.submit(
+                _pool_worker, slot.name, len(raw_bytes), None if fits else raw_bytes,
+                mode, max_dim, with_signature, crop_resistant
+            )
+            header, size, pixels, signature = future.result()
+            return (_rebuild(header, bytes(slot.buf[:size]) if pixels is None else pixels), signature)
+        finally:
+            self.free_slots.put(slot)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            slots, self.slots = self.slots, []
+        for slot in slots:
+            slot.close()
+            slot.unlink()
+
+
+_pool = None
+_pool_disabled = False
+_pool_lock = threading.Lock()
+
+
+def get_image_pool():
+    """Return the shared ImageDecodePool, or None if disabled/unavailable"""
+    global _pool, _pool_disabled
+
+    with _pool_lock:
+        if _pool or _pool_disabled:
+            return _pool
+
+        workers_setting = read_env_setting('IMAGE_POOL_WORKERS')
+        try:
+            max_workers = int(workers_setting) if workers_setting else (os.cpu_count() or 1)
+        except ValueError:
+            max_workers = os.cpu_count() or 1
+
+        if max_workers <= 0:
+            _pool_disabled = True
+            return None
+
+        try:
+            _pool = ImageDecodePool(max_workers=max_workers)
+            atexit.register(_pool.shutdown)
+            print(f"🧮 Image decode pool: {max_workers} worker processes")
+        except Exception as e:
+            print(f"⚠️ Image decode pool unavailable ({e}) - decoding in threads")
+            _pool_disabled = True
+        return _pool
+
+
+def decode_image(raw_bytes, with_signature=False, crop_resistant=False, mode=None, max_dim=None):
+    """Decode (and optionally hash) raw image bytes, preferring the process pool
+
+    The image keeps its original mode and size unless mode (e.g. 'RGB') or max_dim
+    (longest side in pixels) is given. Falls back to decoding in the calling thread if
+    the pool is disabled or broken.
+
+    Returns:
+        tuple: (PIL.Image or None, signature or None)
+    """
+    global _pool, _pool_disabled
+
+    pool = get_image_pool()
+    if pool:
+        try:
+            return pool.decode(raw_bytes, with_signature, crop_resistant, mode, max_dim)
+        except Exception as e:
+            if 'BrokenProcessPool' in type(e).__name__ or 'shutdown' in str(e):
+                print(f"⚠️ Image decode pool failed ({e}) - decoding in threads")
+                with _pool_lock:
+                    _pool, _pool_disabled = None, True
+            else:
+                return (None, None)
+
+    try:
+        image = _decode(raw_bytes, mode, max_dim)
+        image.load()
+        signature = compute_signature(image, crop_resistant) if with_signature else None
+        return (image, signature)
+    except Exception:
+        return (None, None)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Composite Image Signature
+pHash + dHash + colorhash (+ optional crop-resistant hash) computed once per image and
+stored as plain integers, matched with per-component Hamming thresholds. Catches crops,
+watermarks and text overlays that a single hash misses.
+"""
+
+import threading
+import imagehash
+
+# Max differing bits per component (phash/dhash are 64-bit, colorhash 42-bit)
+DEFAULT_THRESHOLDS = {
+    'phash': 8,
+    'dhash': 10,
+    'colorhash': 4,
+}
+
+# Components that must agree for a match (an identical phash always matches)
+MIN_AGREEING_COMPONENTS = 2
+
+# Component that must be among the agreeing ones: dHash and colorhash alone also agree for
+# different products shot the same way in the same colours
+REQUIRED_COMPONENT = 'phash'
+
+# Crop-resistant hash: segments that must match, and bits allowed per segment
+CROP_MIN_SEGMENT_MATCHES = 2
+CROP_SEGMENT_THRESHOLD = 8
+
+
+def hash_to_int(image_hash):
+    """Convert an imagehash.ImageHash to an int"""
+    return int(str(image_hash), 16)
+
+
+def hamming(a, b):
+    """Number of differing bits between two int hashes"""
+    return bin(a ^ b).count('1')
+
+
+def compute_signature(image, crop_resistant=False):
+    """Compute the composite signature of a PIL image
+
+    Returns:
+        dict: {'phash': int, 'dhash': int, 'colorhash': int[, 'crop': [int, ...]]} or None on error
+    """
+    try:
+        signature = {
+            'phash': hash_to_int(imagehash.phash(image, hash_size=8)),
+            'dhash': hash_to_int(imagehash.dhash(image, hash_size=8)),
+            'colorhash': hash_to_int(imagehash.colorhash(image, binbits=3)),
+        }
+        if crop_resistant:
+            multi_hash = imagehash.crop_resistant_hash(image)
+            signature['crop'] = [hash_to_int(segment) for segment in multi_hash.segment_hashes]
+        return signature
+    except Exception:
+        return None
+
+
+def phash_hex(signature):
+    """64-bit phash as the 16-char hex string used by older databases"""
+    return f"{signature['phash']:016x}"
+
+
+def crop_segments_match(segments_a, segments_b):
+    """True if enough crop-resistant segments of a have a close segment in b"""
+    matches = 0
+    for segment in segments_a:
+        if any(hamming(segment, other) <= CROP_SEGMENT_THRESHOLD for other in segments_b):
+            matches += 1
+            if matches >= CROP_MIN_SEGMENT_MATCHES:
+                return True
+    return False
+
+
+def compare_signatures(a, b, thresholds=None):
+    """Compare two signatures component by component
+
+    pHash plus at least one other component must be within their thresholds.
+    Components missing from either side (e.g. phash-only legacy entries) are ignored.
+
+    Returns:
+        tuple: (is_match, distances dict)
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    distances = {}
+    agreeing = set()
+
+    for component, threshold in thresholds.items():
+        if a.get(component) is None or b.get(component) is None:
+            continue
+        distance = hamming(a[component], b[component])
+        distances[component] = distance
+        if distance <= threshold:
+            agreeing.add(component)
+
+    if distances.get('phash') == 0 or (REQUIRED_COMPONENT in agreeing and len(agreeing) >= MIN_AGREEING_COMPONENTS):
+        return (True, distances)
+
+    if a.get('crop') and b.get('crop') and crop_segments_match(a['crop'], b['crop']):
+        distances['crop'] = 'segments'
+        return (True, distances)
+
+    return (False, distances)
+
+
+def exact_key(signature):
+    """The hash components that must all be identical in exact mode"""
+    return tuple(signature.get(component) for component in DEFAULT_THRESHOLDS)
+
+
+class SignatureIndex:
+    """Signatures seen so far, with their payload (e.g. URLs); thread-safe
+
+    With exact=True only signatures whose pHash, dHash and colorhash are all identical
+    match (plus crop-resistant segments, if both sides have them).
+    """
+
+    def __init__(self, thresholds=None, exact=False):
+        self.thresholds = thresholds or DEFAULT_THRESHOLDS
+        self.exact = exact
+        self.lock = threading.Lock()
+        self.entries = []
+        self.by_phash = {}
+        self.by_exact = {}
+
+    def add(self, signature, payload=None):
+        """Add a signature; returns its entry index"""
+        with self.lock:
+            self.entries.append((signature, payload))
+            self.by_phash.setdefault(signature['phash'], len(self.entries) - 1)
+            self.by_exact.setdefault(exact_key(signature), len(self.entries) - 1)
+            return len(self.entries) - 1
+
+    def find(self, signature):
+        """Return (payload, distances) of the first matching signature, or (None, None)"""
+        if self.exact:
+            return self.find_exact(signature)
+
+        with self.lock:
+            # Identical phash first (cheap dict hit), then the full scan
+            exact = self.by_phash.get(signature['phash'])
+            if exact is not None:
+                return (self.entries[exact][1], {'phash': 0})
+            entries = list(self.entries)
+
+        for other, payload in entries:
+            is_match, distances = compare_signatures(signature, other, self.thresholds)
+            if is_match:
+                return (payload, distances)
+        return (None, None)
+
+    def find_exact(self, signature):
+        with self.lock:
+            exact = self.by_exact.get(exact_key(signature))
+            if exact is not None:
+                return (self.entries[exact][1], {component: 0 for component in DEFAULT_THRESHOLDS})
+            entries = list(self.entries) if signature.get('crop') else []
+
+        for other, payload in entries:
+            if other.get('crop') and crop_segments_match(signature['crop'], other['crop']):
+                return (payload, {'crop': 'segments'})
+        return (None, None)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Batch Job Runner
+Runs the scraping, matching, tagging, backup and price-search stages unattended from a
+job spec file (JSON, or YAML if PyYAML is installed) and writes a run report
+
+Usage:
+  python3 job_runner.py job.json [--budget 5.00]
+
+Example spec (see job_example.json):
+{
+  "name": "nightly",
+  "pages": ["https://www.douyin.com/user/MS4wLjABAAAA..."],
+  "stages": ["extract", "match", "tag", "backup"],
+  "reference_image": "Products/GAMEBOY.png",
+  "reference_folder": "Products",
+  "price_inputs": "Watches.csv",
+  "price_search_mode": "cheapest",
+  "max_duration_minutes": 30,
+  "captcha_wait_seconds": 0,
+  "stop_when_caught_up": false,
+  "concurrency": {"gemini": 200, "backup": 20, "aliprice_tabs": 3},
+  "budget_usd": 5.00,
+  "output": {"pages_folder": "Research", "matches_csv": "nightly.csv", "report_folder": "Reports"}
+}
+
+Stages (run in the order listed):
+  extract       scroll every page and save its videos to pages_folder/{user_id}.csv
+  match         match extracted videos against reference_image (Matches/{matches_csv})
+  match_multi   match extracted videos against every image in reference_folder
+  watch_scrape  deduplicate extracted watch videos (watch_sources.csv + processed_watches_db.json)
+  tag           tag each extracted page CSV with the product taxonomy
+  backup        back up tagged JSON (or page CSVs) thumbnails to Bunny.net
+  watch_prices  search AliPrice/1688 for every image in price_inputs (list or CSV path)
+
+Matches CSVs are rewritten by each run unless the spec sets "append_matches": true
+(the watchlist scheduler does, so page runs add to the same file).
+"""
+
+import os
+import sys
+import json
+import time
+from pathlib import Path
+from gemini_usage import get_usage_tracker, apply_budget_arg
+
+KNOWN_STAGES = ['extract', 'match', 'match_multi', 'watch_scrape', 'tag', 'backup', 'watch_prices']
+GEMINI_STAGES = {'match', 'match_multi', 'watch_scrape', 'tag', 'watch_prices'}
+
+
+def load_env():
+    """Load environment variables from .env file"""
+    if os.path.exists('.env'):
+        with open('.env', 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ.setdefault(key.strip(), value.strip())
+
+
+def load_job_spec(spec_path):
+    """Load a job spec from JSON or YAML"""
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        if spec_path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML is not installed - use a JSON spec or 'pip3 install pyyaml'")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    if not isinstance(spec, dict):
+        raise ValueError("Job spec must be a JSON/YAML object")
+
+    stages = spec.get('stages') or []
+    unknown = [s for s in stages if s not in KNOWN_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(unknown)} (known: {', '.join(KNOWN_STAGES)})")
+    if not stages:
+        raise ValueError("Job spec has no stages")
+
+    return spec
+
+
+def run_extract_stage(spec, state):
+    """Scroll every page and save its videos to CSV"""
+    from playwright.sync_api import sync_playwright
+    from browser_session import open_browser_context, DOUYIN_CONTEXT_OPTIONS
+    from douyin_extraction import scroll_and_extract_incrementally
+    from douyin_page_extractor import save_to_csv
+
+    page_urls = spec.get('pages') or []
+    if not page_urls:
+        raise ValueError("'extract' stage needs 'pages'")
+
+    output_folder = spec.get('output', {}).get('pages_folder', 'Research')
+    max_duration_minutes = spec.get('max_duration_minutes', 30)
+    captcha_wait_seconds = spec.get('captcha_wait_seconds', 0)
+
+    details = {'pages': {}}
+
+    with sync_playwright() as p:
+        context, close_browser, session_warm = open_browser_context(
+            p,
+            context_options=DOUYIN_CONTEXT_OPTIONS,
+            storage_state_file='douyin_cookies.json',
+            login_site='douyin'
+        )
+
+        try:
+            for i, url in enumerate(page_urls, 1):
+                print(f"\n📄 Extracting page {i}/{len(page_urls)}: {url[:60]}...")
+                page = context.new_page()
+                page.add_init_script("""
+                    Object.defineProperty(navigator, 'webdriver', {
+                        get: () => undefined
+                    });
+                """)
+
+                try:
+                    page.goto(url, wait_until='domcontentloaded', timeout=120000)
+
+                    # No one is there to press ENTER - optionally give a CAPTCHA solver time
+                    if not session_warm and captcha_wait_seconds:
+                        print(f"  ⏳ Waiting {captcha_wait_seconds}s for CAPTCHA...")
+                        time.sleep(captcha_wait_seconds)
+
+                    videos = scroll_and_extract_incrementally(
+                        page, max_duration_minutes,
+                        seen_ids=state.get('seen_ids', {}).get(url),
+                        stop_when_caught_up=spec.get('stop_when_caught_up', False)
+                    )
+                    for video in videos:
+                        video['source_page'] = url
+
+                    csv_file = None
+                    if videos:
+                        csv_file = save_to_csv(
+                            [{k: v for k, v in video.items() if k != 'source_page'} for video in videos],
+                            url, output_folder
+                        )
+
+                    state['pages'][url] = {'videos': videos, 'csv': csv_file}
+                    details['pages'][url] = {'videos': len(videos), 'csv': csv_file}
+                except Exception as e:
+                    print(f"  ❌ Error extracting page: {e}")
+                    details['pages'][url] = {'error': str(e)[:200]}
+                finally:
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
+        finally:
+            close_browser()
+
+    if not state['pages']:
+        raise RuntimeError("No pages extracted")
+
+    details['total_videos'] = sum(len(p['videos']) for p in state['pages'].values())
+    return details
+
+
+def run_match_stage(spec, state):
+    """Match extracted videos against a single reference image"""
+    import find_product_videos_multi as matcher
+
+    reference_path = spec.get('reference_image')
+    if not reference_path:
+        raise ValueError("'match' stage needs 'reference_image'")
+    if not state['pages']:
+        raise RuntimeError("No extracted pages to match (run 'extract' first)")
+
+    model = matcher.setup_gemini_api()
+    reference_image = matcher.load_reference_image(reference_path)
+    if not model or not reference_image:
+        raise RuntimeError("Could not set up Gemini or load reference image")
+
+    output_csv = spec.get('output', {}).get('matches_csv') or f"{Path(reference_path).stem}.csv"
+    max_workers = spec.get('concurrency', {}).get('gemini')
+    page_urls = list(state['pages'].keys())
+
+    details = {'matches_csv': os.path.join('Matches', output_csv), 'pages': {}}
+    is_first_page = True
+    for url in page_urls:
+        videos = state['pages'][url]['videos']
+        matches, non_matches = matcher.analyze_videos(videos, model, reference_image, max_workers=max_workers)
+        if matches:
+            matcher.save_matches_incrementally(matches, output_csv, url, is_first_page, page_urls,
+                                               append=spec.get('append_matches', False))
+            is_first_page = False
+        details['pages'][url] = {
+            'matches': len(matches),
+            'non_matches': len(non_matches),
+            'errors': len(videos) - len(matches) - len(non_matches)
+        }
+
+    details['total_matches'] = sum(p['matches'] for p in details['pages'].values())
+    return details
+
+
+def run_match_multi_stage(spec, state):
+    """Match extracted videos against every product in a reference folder (one sharded pass)"""
+    import find_product_videos_multi as matcher
+    import Find_Multiple_Products as multi
+    from reference_shards import ReferenceShards
+
+    reference_folder = spec.get('reference_folder')
+    if not reference_folder:
+        raise ValueError("'match_multi' stage needs 'reference_folder'")
+    if not state['pages']:
+        raise RuntimeError("No extracted pages to match (run 'extract' first)")
+
+    model = multi.setup_gemini_api()
+    reference_images = multi.load_reference_images_from_folder(reference_folder)
+    if not model or not reference_images:
+        raise RuntimeError("Could not set up Gemini or load reference images")
+
+    max_workers = spec.get('concurrency', {}).get('gemini')
+    page_urls = list(state['pages'].keys())
+
+    # Built once for the whole stage: each thumbnail is sent only to the shards the
+    # prefilter picks, instead of one full pass over the videos per product
+    shards = ReferenceShards(reference_images)
+    print(shards.describe())
+
+    details = {'products': {name: {'matches': 0, 'matches_csv': None} for name in reference_images},
+               'pages': {}}
+    first_page = {name: True for name in reference_images}
+    for url in page_urls:
+        videos = state['pages'][url]['videos']
+        product_matches, matched_urls, error_types = multi.analyze_videos_multi_product(
+            videos, model, reference_images, shards, max_workers=max_workers)
+
+        for product_name, matches in product_matches.items():
+            if not matches:
+                continue
+            output_csv = f"{os.path.splitext(product_name)[0]}.csv"
+            matcher.save_matches_incrementally(matches, output_csv, url, first_page[product_name], page_urls,
+                                               append=spec.get('append_matches', False))
+            first_page[product_name] = False
+            product = details['products'][product_name]
+            product['matches'] += len(matches)
+            product['matches_csv'] = os.path.join('Matches', output_csv)
+
+        details['pages'][url] = {
+            'matched_videos': len(matched_urls),
+            'errors': sum(error_types.values())
+        }
+
+    print(shards.summary())
+    return details
+
+
+def run_watch_scrape_stage(spec, state):
+    """Deduplicate extracted watch videos against the watch database"""
+    import douyin_watch_scraper as scraper
+
+    if not state['pages']:
+        raise RuntimeError("No extracted pages to deduplicate (run 'extract' first)")
+
+    model = scraper.setup_gemini_api()
+    if not model:
+        raise RuntimeError("Could not set up Gemini")
+
+    max_workers = spec.get('concurrency', {}).get('gemini')
+    db = scraper.load_database()
+
+    details = {'pages': {}}
+    try:
+        for url, page_data in state['pages'].items():
+            unique_watches, stats = scraper.deduplicate_watches(model, page_data['videos'], db, max_workers=max_workers)
+            csv_file = scraper.save_to_csv(unique_watches, url) if unique_watches else None
+            details['pages'][url] = dict(stats, csv=csv_file)
+    finally:
+        scraper.save_database(db)
+
+    return details
+
+
+def run_tag_stage(spec, state):
+    """Tag every extracted page CSV with the product taxonomy"""
+    from tag_research_videos import tag_research_videos
+
+    csv_files = [p['csv'] for p in state['pages'].values() if p.get('csv')]
+    if not csv_files:
+        raise RuntimeError("No page CSVs to tag (run 'extract' first)")
+
+    max_workers = spec.get('concurrency', {}).get('gemini')
+
+    details = {'files': {}}
+    for csv_file in csv_files:
+        output_json = str(Path(csv_file).with_name(f"{Path(csv_file).stem}_tagged.json"))
+        success = tag_research_videos(csv_file, output_json, max_workers=max_workers)
+        if success:
+            state['tagged_json'].append(output_json)
+        details['files'][csv_file] = {'success': success, 'output': output_json if success else None}
+
+    if not state['tagged_json']:
+        raise RuntimeError("Tagging failed for every file")
+    return details
+
+
+def run_backup_stage(spec, state):
+    """Back up thumbnails of tagged JSON files (or page CSVs) to Bunny.net"""
+    import backup_json_thumbnails
+    import backup_thumbnails
+
+    bunny_config = backup_json_thumbnails.setup_bunny()
+    if not bunny_config:
+        raise RuntimeError("Bunny.net credentials not configured")
+
+    max_workers = spec.get('concurrency', {}).get('backup', 20)
+
+    details = {'files': {}}
+    if state['tagged_json']:
+        for json_path in state['tagged_json']:
+            success = backup_json_thumbnails.backup_json_thumbnails(json_path, bunny_config, max_workers=max_workers)
+            details['files'][json_path] = {'success': success}
+    else:
+        csv_files = [p['csv'] for p in state['pages'].values() if p.get('csv')]
+        if not csv_files:
+            raise RuntimeError("Nothing to back up (run 'extract' or 'tag' first)")
+        for csv_file in csv_files:
+            success = backup_thumbnails.backup_thumbnails(csv_file, bunny_config)
+            details['files'][csv_file] = {'success': success}
+
+    if not any(f['success'] for f in details['files'].values()):
+        raise RuntimeError("Backup failed for every file")
+    return details
+
+
+def run_watch_prices_stage(spec, state):
+    """Search AliPrice/1688 for every reference image in price_inputs"""
+    import watch_prices
+
+    price_inputs = spec.get('price_inputs')
+    if not price_inputs:
+        raise ValueError("'watch_prices' stage needs 'price_inputs'")
+
+    if isinstance(price_inputs, str):
+        image_inputs = watch_prices.load_image_inputs_from_csv(watch_prices.normalize_file_path(price_inputs))
+        if not image_inputs:
+            raise RuntimeError(f"No image URLs loaded from {price_inputs}")
+    else:
+        image_inputs = list(price_inputs)
+
+    model = watch_prices.setup_gemini_api()
+    if not model:
+        raise RuntimeError("Could not set up Gemini")
+
+    max_workers = spec.get('concurrency', {}).get('gemini')
+    search_tabs = spec.get('concurrency', {}).get('aliprice_tabs')
+    price_search_mode = spec.get('price_search_mode')
+    cheapest_only = price_search_mode == 'cheapest' if price_search_mode else None
+    success = watch_prices.run_price_search(model, image_inputs, interactive=False, max_workers=max_workers,
+                                            search_tabs=search_tabs, cheapest_only=cheapest_only)
+    if not success:
+        raise RuntimeError("Price search failed")
+
+    return {'inputs': len(image_inputs)}
+
+
+STAGE_FUNCTIONS = {
+    'extract': run_extract_stage,
+    'match': run_match_stage,
+    'match_multi': run_match_multi_stage,
+    'watch_scrape': run_watch_scrape_stage,
+    'tag': run_tag_stage,
+    'backup': run_backup_stage,
+    'watch_prices': run_watch_prices_stage,
+}
+
+
+def write_run_report(report, report_folder):
+    """Write the run report JSON and return its path"""
+    if not os.path.exists(report_folder):
+        os.makedirs(report_folder)
+
+    safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in report['name'])
+    report_file = os.path.join(report_folder, f"run_{safe_name}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report_file
+
+
+def run_job(spec, state=None):
+    """Run all stages of a job spec unattended
+
+    Args:
+        spec: job spec dict
+        state: Optional shared stage state ({'pages': {}, 'tagged_json': [], 'seen_ids': {}})
+            - pass one in to run stages against already-extracted pages or to skip
+              video IDs seen in earlier runs
+
+    Returns:
+        dict: run report (name, timing, per-stage status/details)
+    """
+    load_env()
+
+    name = spec.get('name') or 'job'
+    report = {
+        'name': name,
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'spec': spec,
+        'stages': [],
+        'success': True
+    }
+
+    # Shared between stages: extracted videos per page and tagged JSON outputs
+    if state is None:
+        state = {'pages': {}, 'tagged_json': []}
+    run_start = time.time()
+
+    # Cost and budget are per run, also when a scheduler runs many jobs in one process.
+    # Only jobs with Gemini stages touch the shared tracker: the watchlist scheduler runs
+    # those one at a time, while extract-only jobs run beside them and must not reset
+    # or relabel their totals.
+    uses_gemini = any(stage in GEMINI_STAGES for stage in spec['stages'])
+    usage = get_usage_tracker()
+    default_budget = usage.budget
+    if uses_gemini:
+        usage.reset()
+        if spec.get('budget_usd') is not None and default_budget is None:
+            # --budget / GEMINI_BUDGET_USD win; otherwise each job gets its own spec budget
+            usage.set_budget(float(spec['budget_usd']))
+
+    try:
+        for stage in spec['stages']:
+            print(f"\n{'=' * 60}")
+            print(f"🚀 STAGE: {stage}")
+            print(f"{'=' * 60}")
+
+            stage_start = time.time()
+            entry = {'stage': stage, 'started': time.strftime('%Y-%m-%d %H:%M:%S')}
+            if uses_gemini:
+                usage.set_stage(stage)
+
+            if stage in GEMINI_STAGES and not os.getenv('GEMINI_API_KEY'):
+                entry.update(status='failed', error='GEMINI_API_KEY not set (add it to .env)')
+            elif stage in GEMINI_STAGES and usage.budget_exceeded():
+                entry.update(status='skipped', error='Gemini budget reached')
+            else:
+                try:
+                    details = STAGE_FUNCTIONS[stage](spec, state)
+                    entry.update(status='success', details=details)
+                except Exception as e:
+                    print(f"❌ Stage '{stage}' failed: {e}")
+                    entry.update(status='failed', error=str(e)[:500])
+
+            entry['duration_seconds'] = round(time.time() - stage_start, 1)
+            if entry['status'] == 'success' and stage in GEMINI_STAGES and usage.budget_exceeded():
+                # Work was left undispatched (checkpointed where supported)
+                entry['status'] = 'partial'
+            if entry['status'] != 'success':
+                report['success'] = False
+            report['stages'].append(entry)
+
+            print(f"\n{'✅' if entry['status'] == 'success' else '❌'} Stage '{stage}' "
+                  f"{entry['status']} in {entry['duration_seconds']}s")
+    finally:
+        report['cost'] = usage.report() if uses_gemini else None
+        if uses_gemini and usage.budget != default_budget:
+            usage.set_budget(default_budget)
+
+    report['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    report['duration_seconds'] = round(time.time() - run_start, 1)
+    return report
+
+
+def main():
+    """Main entry point"""
+    print("🗂️  Batch Job Runner")
+    print("=" * 50)
+
+    apply_budget_arg()
+    if len(sys.argv) < 2:
+        print("Usage: python3 job_runner.py <job_spec.json|yaml> [--budget USD]")
+        sys.exit(1)
+
+    spec_path = sys.argv[1]
+    try:
+        spec = load_job_spec(spec_path)
+    except Exception as e:
+        print(f"❌ Invalid job spec {spec_path}: {e}")
+        sys.exit(1)
+
+    print(f"📄 Job: {spec.get('name', 'job')}")
+    print(f"   Stages: {' → '.join(spec['stages'])}")
+    print(f"   Pages: {len(spec.get('pages') or [])}")
+
+    # Unattended: any leftover input() prompt fails fast instead of blocking the run
+    sys.stdin = open(os.devnull, 'r')
+
+    report = run_job(spec)
+    report_folder = spec.get('output', {}).get('report_folder', 'Reports')
+    report_file = write_run_report(report, report_folder)
+
+    print(f"\n{'=' * 60}")
+    print(f"{'🎉 Job complete!' if report['success'] else '⚠️  Job finished with failures'}")
+    print(f"{'=' * 60}")
+    for entry in report['stages']:
+        icon = '✅' if entry['status'] == 'success' else '❌'
+        print(f"   {icon} {entry['stage']}: {entry['status']} ({entry['duration_seconds']}s)")
+        if entry.get('error'):
+            print(f"      → {entry['error']}")
+    print(f"\n📄 Run report: {report_file}")
+
+    if not report['success']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Product Match Cascade
+Two-stage matching for compare_images_with_gemini: a cheaper/faster model screens every
+thumbnail first and answers with a confidence; only uncertain or positive answers are
+escalated to the stronger model, whose verdict is what gets written to Matches/
+
+Settings (.env or environment):
+  MATCH_SCREEN_MODEL=gemini-2.0-flash-lite   enables the cascade (screening model)
+  MATCH_SCREEN_CONFIDENCE=90                 min confidence for a screening "NO" to be final
+  MATCH_CONFIRM_MODEL=gemini-2.5-flash       optional stronger model for confirmation
+                                             (defaults to the script's own model)
+"""
+
+import re
+import asyncio
+import threading
+import google.generativeai as genai
+from browser_session import read_env_setting
+from gemini_client import wrap_model
+
+DEFAULT_SCREEN_CONFIDENCE = 90
+
+SCREEN_PROMPT = """Compare these two images.
+
+The FIRST image is the reference product I'm looking for.
+The SECOND image is a video thumbnail.
+
+Does the video thumbnail contain the EXACT SAME product as shown in the reference image?
+
+Respond in EXACTLY this format:
+VERDICT: MATCH or NO
+CONFIDENCE: [0-100]
+
+CONFIDENCE is how sure you are of your VERDICT. Use a low confidence whenever the product
+is small, partly hidden, blurry, or only similar."""
+
+
+class MatchCascade:
+    """Screening model + optional confirmation model with per-run counters"""
+
+    def __init__(self, screen_model, screen_model_name, confidence_threshold, confirm_model=None,
+                 confirm_model_name=None):
+        self.screen_model = screen_model
+        self.screen_model_name = screen_model_name
+        self.confidence_threshold = confidence_threshold
+        self.confirm_model = confirm_model
+        self.confirm_model_name = confirm_model_name
+        self.lock = threading.Lock()
+        self.stats = {'screened': 0, 'rejected': 0, 'escalated': 0, 'screen_errors': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    async def screen(self, reference_image, thumbnail_image):
+        """Ask the screening model for a verdict and confidence
+
+        Returns:
+            tuple: (verdict, confidence, error_type)
+            - verdict: True (match), False (no match) or None on error
+            - confidence: 0-100 (0 if unparseable)
+        """
+        max_retries = 2
+        retry_delay = 2
+
+        for attempt in range(max_retries):
+            try:
+                response = await self.screen_model.generate_content_async(
+                    [SCREEN_PROMPT, reference_image, thumbnail_image], prompt_type='match_screen')
+
+                if not response or not response.text:
+                    return (None, 0, 'empty_response')
+
+                text = response.text.strip().upper()
+                verdict_match = re.search(r'VERDICT:\s*(MATCH|NO)', text)
+                confidence_match = re.search(r'CONFIDENCE:\s*(\d+)', text)
+                if not verdict_match:
+                    return (None, 0, 'unparseable_response')
+
+                confidence = min(100, int(confidence_match.group(1))) if confidence_match else 0
+                return (verdict_match.group(1) == 'MATCH', confidence, None)
+
+            except Exception as e:
+                error_msg = str(e).lower()
+
+                if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(retry_delay)
+                        retry_delay *= 2
+                        continue
+                    return (None, 0, 'rate_limit')
+                return (None, 0, f'api_error: {str(e)[:100]}')
+
+        return (None, 0, 'max_retries_exceeded')
+
+    async def should_escalate_async(self, reference_image, thumbnail_image):
+        """Screen a thumbnail; False means it is a confident non-match and needs no further call"""
+        self.count('screened')
+        verdict, confidence, error = await self.screen(reference_image, thumbnail_image)
+
+        if error:
+            # Screening failed - let the stronger model decide rather than drop the thumbnail
+            self.count('screen_errors')
+            self.count('escalated')
+            return True
+
+        if verdict is False and confidence >= self.confidence_threshold:
+            self.count('rejected')
+            return False
+
+        self.count('escalated')
+        return True
+
+    def summary(self):
+        """One-line cascade summary for end-of-run output"""
+        with self.lock:
+            stats = dict(self.stats)
+        saved = (stats['rejected'] / stats['screened'] * 100) if stats['screened'] else 0
+        return (f"🪜 Cascade ({self.screen_model_name} → {self.confirm_model_name or 'main model'}): "
+                f"{stats['screened']} screened, {stats['rejected']} rejected early ({saved:.0f}% fewer "
+                f"strong-model calls), {stats['escalated']} escalated, {stats['screen_errors']} screen errors")
+
+
+_cascade = None
+_cascade_loaded = False
+_cascade_lock = threading.Lock()
+
+
+def get_match_cascade():
+    """Return the configured MatchCascade, or None if MATCH_SCREEN_MODEL is not set
+
+    Requires genai.configure() to have been called (setup_gemini_api does this).
+    """
+    global _cascade, _cascade_loaded
+
+    with _cascade_lock:
+        if _cascade_loaded:
+            return _cascade
+        _cascade_loaded = True
+
+        screen_model_name = read_env_setting('MATCH_SCREEN_MODEL')
+        if not screen_model_name:
+            return None
+
+        try:
+            threshold = int(read_env_setting('MATCH_SCREEN_CONFIDENCE') or DEFAULT_SCREEN_CONFIDENCE)
+        except ValueError:
+            threshold = DEFAULT_SCREEN_CONFIDENCE
+
+        confirm_model_name = read_env_setting('MATCH_CONFIRM_MODEL') or None
+
+        try:
+            screen_model = wrap_model(genai.GenerativeModel(screen_model_name))
+            confirm_model = wrap_model(genai.GenerativeModel(confirm_model_name)) if confirm_model_name else None
+        except Exception as e:
+            print(f"⚠️ Could not set up match cascade ({e}) - using single model")
+            return None
+
+        _cascade = MatchCascade(screen_model, screen_model_name, threshold, confirm_model, confirm_model_name)
+        print(f"🪜 Match cascade enabled: {screen_model_name} screens (NO ≥ {threshold}% is final), "
+              f"{confirm_model_name or 'main model'} confirms")
+        return _cascade
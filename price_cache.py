@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+AliPrice Result Cache
+Keeps each reference image's AliPrice search results and Gemini scores on disk, keyed by
+a hash of the image content, so re-running watch_prices.py on overlapping inputs skips
+the browser search and the scoring for references it has already seen.
+
+- The product list (1688 URL, image URL, price) is reused while it is younger than the
+  TTL; after that AliPrice is searched again to refresh prices.
+- Score breakdowns are keyed by the product image URL and never expire: a product that
+  shows up again in a refreshed search is not re-scored.
+
+One JSON file per reference in AliPrice Cache/<sha256>.json.
+
+Settings (.env or environment):
+  ALIPRICE_CACHE=off                 disable the cache
+  ALIPRICE_CACHE_TTL_HOURS=24        how long cached prices count as fresh
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from browser_session import read_env_setting
+from gemini_client import read_float_setting
+
+CACHE_FOLDER = 'AliPrice Cache'
+DEFAULT_TTL_HOURS = 24
+
+
+def content_hash(path):
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PriceCache:
+    """Per-reference search results and scores, stored as one JSON file per content hash"""
+
+    def __init__(self, folder=CACHE_FOLDER, ttl_hours=None):
+        self.folder = folder
+        self.ttl_hours = (ttl_hours if ttl_hours is not None
+                          else read_float_setting('ALIPRICE_CACHE_TTL_HOURS', DEFAULT_TTL_HOURS))
+        self.lock = threading.Lock()
+        self.stats = {'searches_reused': 0, 'scores_reused': 0}
+
+    def path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def load(self, key):
+        """Cached entry for a reference hash (None if missing or unreadable)"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read cache entry {path}: {e}")
+            return None
+
+    def save(self, key, entry):
+        """Write an entry (temp file first so a crash can't corrupt it)"""
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(key)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def fresh_products(self, key):
+        """Cached product list if it is younger than the TTL, else None"""
+        entry = self.load(key)
+        if not entry or not entry.get('products') or not entry.get('searched_at'):
+            return None
+        age_hours = (time.time() - entry['searched_at']) / 3600
+        if age_hours >= self.ttl_hours:
+            return None
+        with self.lock:
+            self.stats['searches_reused'] += 1
+        return entry['products']
+
+    def scores(self, key):
+        """Known score breakdowns {product_image_url: score_data} for a reference"""
+        entry = self.load(key)
+        return dict(entry.get('scores') or {}) if entry else {}
+
+    def count_reused_scores(self, count):
+        with self.lock:
+            self.stats['scores_reused'] += count
+
+    def store_search(self, key, reference_image_url, products):
+        """Record a live search's product list (resets the price TTL)"""
+        with self.lock:
+            entry = self.load(key) or {'scores': {}}
+            entry.update({
+                'reference_image_url': reference_image_url,
+                'searched_at': time.time(),
+                'searched': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'products': products,
+            })
+            self.save(key, entry)
+
+    def store_scores(self, key, scores):
+        """Merge newly computed score breakdowns into a reference's entry"""
+        if not scores:
+            return
+        with self.lock:
+            entry = self.load(key) or {}
+            entry.setdefault('scores', {}).update(scores)
+            self.save(key, entry)
+
+    def summary(self):
+        """One-line cache usage summary for end-of-run output"""
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"♻️  AliPrice cache: {stats['searches_reused']} searches and "
+                f"{stats['scores_reused']} product scores reused")
+
+
+_cache = None
+_cache_loaded = False
+_cache_lock = threading.Lock()
+
+
+def get_price_cache():
+    """Return the process-wide PriceCache, or None if ALIPRICE_CACHE=off"""
+    global _cache, _cache_loaded
+    with _cache_lock:
+        if not _cache_loaded:
+            _cache_loaded = True
+            if (read_env_setting('ALIPRICE_CACHE') or '').lower() not in ('off', '0', 'false', 'no'):
+                _cache = PriceCache()
+        return _cache
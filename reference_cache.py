@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Reference Cache
+Registers a comparison prompt and its reference image(s) once per run, so each Gemini
+request only carries the thumbnail instead of re-uploading the same references every time.
+
+Modes:
+- off:   prompt + references inline in every request (previous behaviour)
+- files: references uploaded once through the File API, requests send file handles
+- cache: prompt + uploaded references stored as a context cache, requests send only
+         the thumbnail (falls back to files if the model/size can't be cached)
+
+A local stand-in provider keeps everything in memory for tests and dry runs.
+
+Registered contexts are keyed by model name, prompt and a hash of each reference's
+pixels, and kept in a small LRU: the least recently used idle one is released (uploads
+and cache deleted) once more than GEMINI_REFERENCE_CACHE_MAX contexts are registered.
+Callers that know a reference is finished (e.g. one watch_prices search) release it
+with release_references(). Requests hold their context with `async with
+reference_context(...)`, and a context is never released while requests still use it
+or before its registration has finished.
+
+Settings (.env or environment):
+  GEMINI_REFERENCE_CACHE=off|files|cache     default off
+  GEMINI_REFERENCE_CACHE_TTL_MINUTES=60      context cache lifetime
+  GEMINI_REFERENCE_CACHE_MAX=32              registered contexts kept at once
+  GEMINI_REFERENCE_PROVIDER=local            use the in-memory stand-in instead of Gemini
+"""
+
+import io
+import atexit
+import asyncio
+import hashlib
+import datetime
+import contextlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from browser_session import read_env_setting
+from gemini_client import wrap_model, read_float_setting
+
+REFERENCE_MODES = ('off', 'files', 'cache')
+DEFAULT_TTL_MINUTES = 60
+DEFAULT_MAX_CONTEXTS = 32
+
+
+class GeminiReferenceProvider:
+    """File API uploads and context caches through google.generativeai"""
+
+    name = 'gemini'
+
+    def upload_image(self, image, display_name):
+        import google.generativeai as genai
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, format='PNG')
+        buffer.seek(0)
+        return genai.upload_file(buffer, mime_type='image/png', display_name=display_name[:100])
+
+    def create_cached_model(self, model, prompt, handles, ttl_minutes):
+        import google.generativeai as genai
+        cache = genai.caching.CachedContent.create(
+            model=model.model_name,
+            system_instruction=prompt,
+            contents=[{'role': 'user', 'parts': list(handles)}],
+            ttl=datetime.timedelta(minutes=ttl_minutes),
+        )
+        return (wrap_model(genai.GenerativeModel.from_cached_content(cached_content=cache)), cache)
+
+    def release(self, handles, cache):
+        for resource in ([cache] if cache else []) + list(handles):
+            try:
+                resource.delete()
+            except Exception:
+                pass
+
+
+class LocalCachedModel:
+    """Stand-in for a context-cached model: prepends the stored prompt/references"""
+
+    def __init__(self, model, prompt, handles):
+        self.model = model
+        self.prefix = [prompt] + list(handles)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate_content(self, contents, **kwargs):
+        return self.model.generate_content(self.prefix + list(contents), **kwargs)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return await self.model.generate_content_async(self.prefix + list(contents), **kwargs)
+
+
+class LocalReferenceProvider:
+    """In-memory stand-in provider (no network); counts what would have been uploaded"""
+
+    name = 'local'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uploads = 0
+        self.caches = 0
+
+    def upload_image(self, image, display_name):
+        with self.lock:
+            self.uploads += 1
+        return image
+
+    def create_cached_model(self, model, prompt, handles, ttl_minutes):
+        with self.lock:
+            self.caches += 1
+        return (LocalCachedModel(model, prompt, handles), None)
+
+    def release(self, handles, cache):
+        pass
+
+
+class ReferenceContext:
+    """Prompt + references registered once; request() builds each call's contents"""
+
+    def __init__(self, model, prompt, references, mode, provider, label=''):
+        self.model = model
+        self.prompt = prompt
+        self.references = list(references)
+        self.mode = mode
+        self.provider = provider
+        self.handles = []
+        self.cache = None
+        self.call_model = model
+
+        if mode == 'off':
+            return
+
+        self.handles = [provider.upload_image(image, f"{label or 'reference'}-{idx}")
+                        for idx, image in enumerate(self.references, 1)]
+
+        if mode == 'cache':
+            ttl = read_float_setting('GEMINI_REFERENCE_CACHE_TTL_MINUTES', DEFAULT_TTL_MINUTES)
+            try:
+                self.call_model, self.cache = provider.create_cached_model(model, prompt, self.handles, ttl)
+            except Exception as e:
+                # Usually the model doesn't support caching or the content is below its minimum size
+                print(f"  ⚠️ Context cache unavailable ({str(e)[:80]}) - using uploaded files")
+                self.mode = 'files'
+
+    def request(self, per_call_images):
+        """Model to call and contents for one request
+
+        Returns:
+            tuple: (model, contents)
+        """
+        if self.mode == 'cache':
+            return (self.call_model, list(per_call_images))
+        references = self.handles if self.mode == 'files' else self.references
+        return (self.model, [self.prompt] + list(references) + list(per_call_images))
+
+    def release(self):
+        if self.handles or self.cache:
+            self.provider.release(self.handles, self.cache)
+            self.handles, self.cache = [], None
+
+
+_provider = None
+_contexts = OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def image_digest(image):
+    """SHA-1 of an image's mode, size and pixels (computed once per image object)"""
+    digest = getattr(image, '_reference_digest', None)
+    if digest is None:
+        hasher = hashlib.sha1(f"{image.mode}:{image.size}".encode())
+        hasher.update(image.tobytes())
+        digest = hasher.hexdigest()
+        try:
+            image._reference_digest = digest
+        except AttributeError:
+            pass
+    return digest
+
+
+def context_key(model, prompt, references, mode):
+    """Registry key: model name, prompt and reference content (never object ids)"""
+    model_name = getattr(model, 'model_name', None) or type(model).__name__
+    prompt_digest = hashlib.sha1(prompt.encode()).hexdigest()
+    return (model_name, prompt_digest, tuple(image_digest(image) for image in references), mode)
+
+
+def get_reference_mode():
+    """Configured reference mode (off, files or cache)"""
+    mode = (read_env_setting('GEMINI_REFERENCE_CACHE') or 'off').lower()
+    return mode if mode in REFERENCE_MODES else 'off'
+
+
+def get_reference_provider():
+    """The provider used for uploads/caches (local stand-in if GEMINI_REFERENCE_PROVIDER=local)"""
+    global _provider
+    with _contexts_lock:
+        if _provider is None:
+            local = (read_env_setting('GEMINI_REFERENCE_PROVIDER') or '').lower() == 'local'
+            _provider = LocalReferenceProvider() if local else GeminiReferenceProvider()
+        return _provider
+
+
+def set_reference_provider(provider):
+    """Replace the provider (e.g. LocalReferenceProvider() in tests); drops registered contexts"""
+    global _provider
+    release_all()
+    with _contexts_lock:
+        _provider = provider
+
+
+class _Registration:
+    """A registry entry: the context (once registered) and the requests using it"""
+
+    def __init__(self):
+        self.future = Future()
+        self.users = 0
+        self.retired = False
+
+
+@contextlib.asynccontextmanager
+async def reference_context(model, prompt, references, label=''):
+    """Hold the ReferenceContext for (model, prompt, references), registering it on first use
+
+    Concurrent callers for the same references wait for one registration; uploads run off
+    the event loop. The context stays registered (not evicted or released) until every
+    caller has left its `async with` block.
+    """
+    mode = get_reference_mode()
+    provider = get_reference_provider()
+    if mode == 'off':
+        # Nothing is uploaded - build the inline context per call instead of keeping references alive
+        yield ReferenceContext(model, prompt, references, mode, provider, label)
+        return
+
+    key = await asyncio.to_thread(context_key, model, prompt, references, mode)
+
+    evicted = []
+    with _contexts_lock:
+        entry = _contexts.get(key)
+        owner = entry is None
+        if owner:
+            entry = _contexts[key] = _Registration()
+            max_contexts = max(1, int(read_float_setting('GEMINI_REFERENCE_CACHE_MAX', DEFAULT_MAX_CONTEXTS)))
+            idle = [idle_key for idle_key, other in _contexts.items() if not other.users and other is not entry]
+            while len(_contexts) > max_contexts and idle:
+                evicted.append(_contexts.pop(idle.pop(0)))
+        else:
+            _contexts.move_to_end(key)
+        entry.users += 1
+    release_registrations(evicted)
+
+    try:
+        if owner:
+            try:
+                context = await asyncio.to_thread(ReferenceContext, model, prompt, references, mode, provider, label)
+                entry.future.set_result(context)
+                print(f"  📌 Registered {len(references)} reference image(s) ({context.mode} mode, {provider.name})")
+            except Exception as e:
+                print(f"  ⚠️ Could not register references ({str(e)[:80]}) - sending them inline")
+                entry.future.set_result(ReferenceContext(model, prompt, references, 'off', provider, label))
+
+        yield await asyncio.wrap_future(entry.future)
+    finally:
+        with _contexts_lock:
+            entry.users -= 1
+            finished = entry.retired and not entry.users
+        if finished:
+            release_registrations([entry])
+
+
+def _release_resolved(future):
+    if not future.cancelled() and not future.exception():
+        future.result().release()
+
+
+def release_registrations(entries):
+    """Release removed registry entries: now if idle, otherwise when their last user leaves
+
+    Entries still being registered are released once their registration resolves.
+    """
+    with _contexts_lock:
+        idle = []
+        for entry in entries:
+            entry.retired = True
+            if not entry.users:
+                idle.append(entry)
+    for entry in idle:
+        entry.future.add_done_callback(_release_resolved)
+
+
+def release_references(references):
+    """Release every registered context that uses any of these reference images"""
+    with _contexts_lock:
+        if not _contexts:
+            return
+    digests = {image_digest(image) for image in references}
+    with _contexts_lock:
+        keys = [key for key in _contexts if digests.intersection(key[2])]
+        entries = [_contexts.pop(key) for key in keys]
+    release_registrations(entries)
+
+
+def release_all():
+    """Delete every uploaded file/cache registered in this run"""
+    with _contexts_lock:
+        entries = list(_contexts.values())
+        _contexts.clear()
+    release_registrations(entries)
+
+
+atexit.register(release_all)
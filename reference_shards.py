@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Reference Shards
+Splits the Products/ reference set into groups of K for multi-product matching, plus a
+local colour prefilter that picks which groups a thumbnail is sent to at all. Every Gemini
+request carries at most K references, so latency stays flat as the folder grows.
+
+Settings (.env or environment):
+  MULTI_MATCH_SHARD_SIZE=4          references per Gemini request (1 = one product per call)
+  MULTI_MATCH_PREFILTER_MIN=0.3     min colour presence for a shard to be asked (0 = ask all)
+"""
+
+import threading
+from gemini_client import read_float_setting
+
+DEFAULT_SHARD_SIZE = 4
+DEFAULT_PREFILTER_MIN = 0.3
+
+# Histogram: 4 levels per RGB channel on a small resize
+COLOR_LEVELS = 4
+HISTOGRAM_SIZE = 48
+
+# A colour counts as present in the thumbnail above this share of its pixels
+PRESENCE_SHARE = 0.005
+
+# Border colour covering this share of the border is treated as product-photo background
+BACKGROUND_SHARE = 0.6
+
+
+def color_bin(pixel):
+    """Histogram bin of an RGB pixel"""
+    r, g, b = (channel * COLOR_LEVELS // 256 for channel in pixel[:3])
+    return (r * COLOR_LEVELS + g) * COLOR_LEVELS + b
+
+
+def color_histogram(image, drop_background=False):
+    """Normalised colour histogram {bin: share}
+
+    With drop_background, the dominant border colour (studio background of a product
+    photo) is left out so only the product's own colours count.
+    """
+    small = image.convert('RGB').resize((HISTOGRAM_SIZE, HISTOGRAM_SIZE))
+    pixels = list(small.getdata())
+
+    counts = {}
+    for pixel in pixels:
+        bin_id = color_bin(pixel)
+        counts[bin_id] = counts.get(bin_id, 0) + 1
+
+    if drop_background:
+        last = HISTOGRAM_SIZE - 1
+        border = [color_bin(small.getpixel((x, y)))
+                  for x in range(HISTOGRAM_SIZE) for y in range(HISTOGRAM_SIZE)
+                  if x in (0, last) or y in (0, last)]
+        background = max(set(border), key=border.count)
+        if border.count(background) >= len(border) * BACKGROUND_SHARE and len(counts) > 1:
+            counts.pop(background, None)
+
+    total = sum(counts.values()) or 1
+    return {bin_id: count / total for bin_id, count in counts.items()}
+
+
+def color_presence(reference_histogram, thumbnail_histogram):
+    """Share of the reference's colours that appear anywhere in the thumbnail (0-1)
+
+    Unlike histogram overlap this does not penalise a product that fills only a small
+    part of the thumbnail.
+    """
+    return sum(share for bin_id, share in reference_histogram.items()
+               if thumbnail_histogram.get(bin_id, 0) >= PRESENCE_SHARE)
+
+
+class ReferenceShards:
+    """Reference products split into shards of shard_size, with a per-thumbnail prefilter
+
+    References with the same dominant colour are grouped together, so a thumbnail
+    usually passes the prefilter for few shards.
+    """
+
+    def __init__(self, reference_images_dict, shard_size=None, prefilter_min=None):
+        self.images = reference_images_dict
+        self.shard_size = max(1, shard_size or int(read_float_setting('MULTI_MATCH_SHARD_SIZE',
+                                                                      DEFAULT_SHARD_SIZE)))
+        self.prefilter_min = (prefilter_min if prefilter_min is not None
+                              else read_float_setting('MULTI_MATCH_PREFILTER_MIN', DEFAULT_PREFILTER_MIN))
+
+        self.histograms = {}
+        for name, image in reference_images_dict.items():
+            try:
+                self.histograms[name] = color_histogram(image, drop_background=True)
+            except Exception:
+                # No histogram: the prefilter always lets this reference through
+                self.histograms[name] = None
+
+        def dominant_bin(name):
+            histogram = self.histograms[name]
+            return max(histogram, key=histogram.get) if histogram else -1
+
+        ordered = sorted(reference_images_dict, key=lambda name: (dominant_bin(name), name))
+        self.shards = [ordered[i:i + self.shard_size] for i in range(0, len(ordered), self.shard_size)]
+
+        self.lock = threading.Lock()
+        self.stats = {'thumbnails': 0, 'shard_calls': 0, 'skipped_thumbnails': 0}
+
+    def select(self, thumbnail_image):
+        """Shards worth asking about this thumbnail
+
+        Returns:
+            list: [{product_name: PIL.Image}, ...] (may be empty)
+        """
+        if self.prefilter_min <= 0:
+            selected = self.shards
+        else:
+            try:
+                thumbnail_histogram = color_histogram(thumbnail_image)
+            except Exception:
+                thumbnail_histogram = None
+
+            selected = []
+            for shard in self.shards:
+                if thumbnail_histogram is None or any(
+                        self.histograms[name] is None
+                        or color_presence(self.histograms[name], thumbnail_histogram) >= self.prefilter_min
+                        for name in shard):
+                    selected.append(shard)
+
+        with self.lock:
+            self.stats['thumbnails'] += 1
+            self.stats['shard_calls'] += len(selected)
+            if not selected:
+                self.stats['skipped_thumbnails'] += 1
+
+        return [{name: self.images[name] for name in shard} for shard in selected]
+
+    def describe(self):
+        """One-line setup description"""
+        prefilter = f"prefilter ≥ {self.prefilter_min:g}" if self.prefilter_min > 0 else "no prefilter"
+        return (f"🧩 {len(self.images)} products in {len(self.shards)} shards of ≤{self.shard_size} "
+                f"({prefilter})")
+
+    def summary(self):
+        """One-line shard usage summary for end-of-run output"""
+        with self.lock:
+            stats = dict(self.stats)
+        possible = stats['thumbnails'] * len(self.shards)
+        saved = (1 - stats['shard_calls'] / possible) * 100 if possible else 0
+        return (f"🧩 Shards: {stats['shard_calls']} shard calls for {stats['thumbnails']} thumbnails "
+                f"({saved:.0f}% skipped by prefilter, {stats['skipped_thumbnails']} thumbnails not sent at all)")
+
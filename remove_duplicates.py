@@ -2,7 +2,8 @@
 """
 Remove Duplicate Videos from CSV
 Removes duplicate videos based on visual similarity of thumbnails
-Uses perceptual hashing to detect visually identical images
+Uses a composite image signature (pHash + dHash + colorhash) to detect visually identical
+images, including crops, watermarks and text overlays
 Keeps the first occurrence of each unique thumbnail
 """
 
@@ -12,7 +13,7 @@ from pathlib import Path
 import requests
 from PIL import Image
 from io import BytesIO
-import imagehash
+from image_signature import compute_signature, SignatureIndex, DEFAULT_THRESHOLDS
 
 def download_thumbnail(url):
     """Download thumbnail image from URL"""
@@ -27,21 +28,39 @@ def download_thumbnail(url):
     except Exception as e:
         return None
 
-def get_image_hash(image):
-    """Get perceptual hash of image for similarity detection"""
-    try:
-        # Use average hash (fast and good for exact duplicates)
-        return str(imagehash.average_hash(image, hash_size=8))
-    except:
+def get_image_hash(image, crop_resistant=False):
+    """Get composite image signature for similarity detection (None on error)"""
+    return compute_signature(image, crop_resistant)
+
+def get_thresholds(similarity_threshold):
+    """Per-component thresholds; 0 means exact on every component, a positive value
+    overrides the pHash/dHash bits and None keeps the defaults"""
+    if similarity_threshold == 0:
+        return {component: 0 for component in DEFAULT_THRESHOLDS}
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if similarity_threshold is not None:
+        thresholds['phash'] = similarity_threshold
+        thresholds['dhash'] = similarity_threshold
+    return thresholds
+
+def parse_threshold(value):
+    """CLI threshold: an int, 'auto' for the per-component defaults, anything else exact"""
+    if value.lower() == 'auto':
         return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
 
-def remove_duplicates(input_csv, output_csv=None, similarity_threshold=0):
+def remove_duplicates(input_csv, output_csv=None, similarity_threshold=0, crop_resistant=False):
     """Remove duplicate videos from CSV based on visual similarity of thumbnails
     
     Args:
         input_csv: Path to input CSV file
         output_csv: Path to output CSV file (optional, defaults to input_unique.csv)
-        similarity_threshold: How many bits can differ (0=exact, 5=very similar, 10=similar)
+        similarity_threshold: How many pHash/dHash bits can differ (0=exact on every
+            component (default), 5=very similar, 10=similar; None=per-component defaults)
+        crop_resistant: Also compare crop-resistant segment hashes (slower)
     
     Returns:
         tuple: (original_count, unique_count, duplicates_removed)
@@ -52,7 +71,8 @@ def remove_duplicates(input_csv, output_csv=None, similarity_threshold=0):
         input_path = Path(input_csv)
         output_csv = input_path.parent / f"{input_path.stem}_unique{input_path.suffix}"
     
-    seen_hashes = {}  # hash -> first video with this hash
+    seen_hashes = SignatureIndex(get_thresholds(similarity_threshold),
+                                 exact=similarity_threshold == 0)  # signature -> first video
     unique_videos = []
     duplicate_count = 0
     download_errors = 0
@@ -101,29 +121,23 @@ def remove_duplicates(input_csv, output_csv=None, similarity_threshold=0):
                     unique_videos.append(row)
                     continue
                 
-                image_hash = get_image_hash(image)
+                image_hash = get_image_hash(image, crop_resistant)
                 
                 if not image_hash:
                     # Can't hash - keep it to be safe
                     unique_videos.append(row)
                     continue
                 
-                # Check if we've seen a similar hash
-                is_duplicate = False
-                for seen_hash in seen_hashes.keys():
-                    # Calculate Hamming distance (number of differing bits)
-                    hash_diff = imagehash.hex_to_hash(image_hash) - imagehash.hex_to_hash(seen_hash)
-                    
-                    if hash_diff <= similarity_threshold:
-                        # Duplicate found!
-                        is_duplicate = True
-                        duplicate_count += 1
-                        print(f"  [{total_rows}] 🔍 Duplicate found (diff={hash_diff})    ")
-                        break
-                
-                if not is_duplicate:
+                # Check if we've seen a similar signature (per-component Hamming thresholds)
+                first_video, distances = seen_hashes.find(image_hash)
+                if first_video is not None:
+                    # Duplicate found!
+                    duplicate_count += 1
+                    diff = ', '.join(f"{k}={v}" for k, v in distances.items())
+                    print(f"  [{total_rows}] 🔍 Duplicate found ({diff})    ")
+                else:
                     # First time seeing this image - keep it
-                    seen_hashes[image_hash] = row
+                    seen_hashes.add(image_hash, row)
                     unique_videos.append(row)
         
         original_count = len(unique_videos) + duplicate_count
@@ -174,9 +188,11 @@ def main():
     print("🧹 CSV Duplicate Remover (Visual Similarity)")
     print("=" * 50)
     
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    
     # Get input file
-    if len(sys.argv) > 1:
-        input_csv = sys.argv[1]
+    if len(args) > 0:
+        input_csv = args[0]
     else:
         input_csv = input("\n📄 Enter CSV file path: ").strip()
         # Handle drag-and-drop escaped spaces
@@ -193,33 +209,31 @@ def main():
     
     # Get output file (optional)
     output_csv = None
-    if len(sys.argv) > 2:
-        output_csv = sys.argv[2]
+    if len(args) > 1:
+        output_csv = args[1]
     else:
         custom_output = input("💾 Output file (press Enter for auto-name): ").strip()
         if custom_output:
             output_csv = custom_output.replace('\\', '')
     
     # Get similarity threshold
-    similarity_threshold = 0  # Default: exact match only
-    if len(sys.argv) > 3:
-        try:
-            similarity_threshold = int(sys.argv[3])
-        except:
-            similarity_threshold = 0
+    similarity_threshold = 0  # Default: exact duplicates only
+    if len(args) > 2:
+        similarity_threshold = parse_threshold(args[2])
     else:
-        threshold_input = input("🎯 Similarity threshold (0=exact, 5=very similar, press Enter=0): ").strip()
+        threshold_input = input("🎯 Similarity threshold (0=exact, 5=very similar, auto=per-component, press Enter=0): ").strip()
         if threshold_input:
-            try:
-                similarity_threshold = int(threshold_input)
-            except:
-                similarity_threshold = 0
+            similarity_threshold = parse_threshold(threshold_input)
+    
+    crop_resistant = '--crop-resistant' in sys.argv
     
-    print(f"\n🔍 Detecting duplicates (threshold: {similarity_threshold})")
+    thresholds = get_thresholds(similarity_threshold)
+    print(f"\n🔍 Detecting duplicates (thresholds: {', '.join(f'{k}={v}' for k, v in thresholds.items())}"
+          f"{', crop-resistant' if crop_resistant else ''})")
     print()
     
     # Process file
-    result = remove_duplicates(input_csv, output_csv, similarity_threshold)
+    result = remove_duplicates(input_csv, output_csv, similarity_threshold, crop_resistant)
     
     if result:
         original_count, unique_count, duplicates_removed, download_errors = result
@@ -9,13 +9,15 @@ import sys
 import csv
 import json
 import time
+import asyncio
 from pathlib import Path
 import google.generativeai as genai
 from PIL import Image
+from image_pool import decode_image
+from gemini_client import wrap_model, run_batched
+from gemini_usage import apply_budget_arg
 import io
 import requests
-from concurrent.futures import ThreadPoolExecutor
-import threading
 
 def setup_gemini_api():
     """Setup Gemini API"""
@@ -41,7 +43,7 @@ def setup_gemini_api():
     
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025')
+        model = wrap_model(genai.GenerativeModel('gemini-2.5-flash-lite-preview-09-2025'))
         print("✅ Gemini API configured successfully (using gemini-2.5-flash-lite-preview-09-2025)")
         return model
     except Exception as e:
@@ -56,7 +58,7 @@ def download_thumbnail(url):
         }
         response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
-        image = Image.open(io.BytesIO(response.content))
+        image, _ = decode_image(response.content)  # decode in the image process pool
         return image
     except Exception as e:
         return None
@@ -104,19 +106,19 @@ Return ONLY valid JSON, no explanations."""
 
     return prompt
 
-def tag_single_video(model, video, video_num, total_videos, prompt):
-    """Tag a single video using Gemini AI"""
+async def tag_single_video(model, video, video_num, total_videos, prompt):
+    """Tag a single video using Gemini AI (awaited on the Gemini engine)"""
     
     try:
         # Download thumbnail
-        thumbnail = download_thumbnail(video['thumbnail_url'])
+        thumbnail = await asyncio.to_thread(download_thumbnail, video['thumbnail_url'])
         if not thumbnail:
             print(f"  [{video_num}/{total_videos}] ⚠️ Failed to download thumbnail")
             return (video, None, 'download_failed')
         
         # Call Gemini API
         try:
-            response = model.generate_content([prompt, thumbnail])
+            response = await model.generate_content_async([prompt, thumbnail], prompt_type='tag')
             
             if response and response.text:
                 # Parse JSON response
@@ -225,8 +227,11 @@ def save_tagged_csv(tagged_videos, output_csv):
         print(f"❌ Error saving CSV: {e}")
         return False
 
-def tag_watch_pages(csv_path, output_json, output_csv, max_videos=None, batch_size=50):
-    """Main function to tag watch pages"""
+def tag_watch_pages(csv_path, output_json, output_csv, max_videos=None, batch_size=None):
+    """Main function to tag watch pages
+
+    batch_size is the number of videos in flight at once (default GEMINI_MAX_IN_FLIGHT).
+    """
     
     print("🏷️ AI Watch Tagging System")
     print("=" * 50)
@@ -265,54 +270,24 @@ def tag_watch_pages(csv_path, output_json, output_csv, max_videos=None, batch_si
     error_count = 0
     error_types = {}
     
-    total_batches = (len(videos) + batch_size - 1) // batch_size
-    
-    with ThreadPoolExecutor(max_workers=50) as executor:
-        for batch_num in range(total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, len(videos))
-            batch = videos[start_idx:end_idx]
-            
-            print(f"\n📦 Processing batch {batch_num + 1}/{total_batches} ({len(batch)} videos)")
-            print(f"   Videos {start_idx + 1}-{end_idx} of {len(videos)}")
-            
-            # Submit batch to thread pool
-            futures = []
-            for i, video in enumerate(batch):
-                video_num = start_idx + i + 1
-                future = executor.submit(
-                    tag_single_video,
-                    model, video, video_num, len(videos), prompt
-                )
-                futures.append(future)
-            
-            # Collect results
-            batch_success = 0
-            batch_errors = 0
-            for future in futures:
-                try:
-                    video, tags, error = future.result(timeout=30)
-                    
-                    if error:
-                        error_count += 1
-                        batch_errors += 1
-                        error_types[error] = error_types.get(error, 0) + 1
-                    else:
-                        # Add tags to video data
-                        video_with_tags = video.copy()
-                        video_with_tags['tags'] = tags
-                        tagged_videos.append(video_with_tags)
-                        batch_success += 1
-                except Exception as e:
-                    print(f"  ⚠️ Thread error: {e}")
-                    error_count += 1
-                    batch_errors += 1
-            
-            print(f"   ✅ Batch complete: {batch_success} tagged, {batch_errors} errors")
-            
-            # Small delay between batches
-            if batch_num < total_batches - 1:
-                time.sleep(0.5)
+    async def task(video, video_num, total):
+        return await tag_single_video(model, video, video_num, total, prompt)
+    
+    def on_result(video, result):
+        nonlocal error_count
+        video, tags, error = result if result else (video, None, 'timeout')
+        if error:
+            error_count += 1
+            error_types[error] = error_types.get(error, 0) + 1
+            return 'errors'
+        # Add tags to video data
+        video_with_tags = video.copy()
+        video_with_tags['tags'] = tags
+        tagged_videos.append(video_with_tags)
+        return 'tagged'
+    
+    # Timed-out/cancelled Gemini calls go back to a retry queue instead of being dropped
+    run_batched(videos, task, on_result, batch_size=batch_size)
     
     # Save results
     print(f"\n💾 Saving tagged data...")
@@ -353,6 +328,7 @@ def tag_watch_pages(csv_path, output_json, output_csv, max_videos=None, batch_si
 
 def main():
     """Main entry point"""
+    apply_budget_arg()
     
     # Get CSV file
     if len(sys.argv) > 1:
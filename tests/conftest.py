@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# Scripts live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """Run every test in its own directory so .env, Checkpoints/ and caches never leak in"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip('requests')
+
+from bunny_store import url_key, BunnyStore
+
+SIGNED = ('https://p3-sign.douyinpic.com/tos-cn-i-0813/abc~tplv-dy-360p.jpeg'
+          '?biz_tag=aweme_images&from=327834062&x-expires=1760000000&x-signature=AbC%2Fd%3D')
+RESIGNED = ('https://p3-sign.douyinpic.com/tos-cn-i-0813/abc~tplv-dy-360p.jpeg'
+            '?x-signature=ZzZ%3D&from=327834062&x-expires=1770000000&biz_tag=aweme_images')
+
+CONFIG = {'api_key': 'key', 'storage_zone': 'zone', 'storage_endpoint': 'https://storage/zone',
+          'cdn_url': 'https://zone.b-cdn.net'}
+
+
+def test_url_key_ignores_signing_parameters():
+    assert url_key(SIGNED) == url_key(RESIGNED)
+    assert url_key(SIGNED) == ('p3-sign.douyinpic.com/tos-cn-i-0813/abc~tplv-dy-360p.jpeg'
+                               '?biz_tag=aweme_images&from=327834062')
+
+
+def test_url_key_keeps_host_and_other_parameters():
+    other_host = SIGNED.replace('p3-sign.douyinpic.com', 'p9-sign.example.com')
+    other_size = SIGNED.replace('from=327834062', 'from=1')
+    assert url_key(other_host) != url_key(SIGNED)
+    assert url_key(other_size) != url_key(SIGNED)
+    assert url_key(SIGNED.replace('/abc~', '/ABC~')) != url_key(SIGNED)  # paths are case-sensitive
+
+
+def test_url_key_host_is_case_insensitive():
+    assert url_key(SIGNED.replace('p3-sign.douyinpic.com', 'P3-Sign.DouyinPic.com')) == url_key(SIGNED)
+
+
+def test_url_key_without_host_is_unchanged():
+    assert url_key('not a url') == 'not a url'
+
+
+def test_known_url_answers_resigned_url_from_manifest(tmp_path):
+    store = BunnyStore(CONFIG, manifest_path=str(tmp_path / 'manifest.json'), head_probe=False)
+    store.record(SIGNED, 'digest', 'https://zone.b-cdn.net/douyin_thumbnails/digest.jpg', 'uploaded')
+    store.save()
+
+    reloaded = BunnyStore(CONFIG, manifest_path=str(tmp_path / 'manifest.json'), head_probe=False)
+    assert reloaded.known_url(RESIGNED) == 'https://zone.b-cdn.net/douyin_thumbnails/digest.jpg'
+    assert reloaded.known_url(SIGNED.replace('p3-sign.douyinpic.com', 'other.cdn.com')) is None
@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+
+from consolidate_watch_prices import process_watch_csvs, manifest_path_for, MANIFEST_VERSION
+
+HEADER = 'reference_image_url,final_score,price,1688_product_image_url,1688_url\n'
+
+
+def write_detailed(folder, suffix, rows):
+    path = folder / f"Watched_prices_detailed{suffix}.csv"
+    path.write_text(HEADER + ''.join(f"https://ref/{suffix}.jpg,{score},¥{price},https://img/{n}.jpg,"
+                                     f"https://1688/{n}\n" for n, (score, price) in enumerate(rows)),
+                    encoding='utf-8')
+    return path
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_master_keeps_cheapest_three_above_threshold(tmp_path):
+    write_detailed(tmp_path, '1', [(95, 30), (91, 10), (80, 1), (99, 20), (92, 40)])
+    master = tmp_path / 'master.csv'
+    process_watch_csvs(str(tmp_path), str(master))
+
+    lines = master.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 2
+    assert lines[1].startswith('https://ref/1.jpg,¥10,¥20,¥30,91,99,95,')
+
+
+def test_manifest_records_processed_files(tmp_path):
+    write_detailed(tmp_path, '1', [(95, 10)])
+    master = tmp_path / 'master.csv'
+    process_watch_csvs(str(tmp_path), str(master))
+
+    with open(manifest_path_for(str(master)), encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['version'] == MANIFEST_VERSION
+    assert manifest['output_file'] == 'master.csv'
+    entry = manifest['files']['Watched_prices_detailed1.csv']
+    assert entry['row']['ref_img_url'] == 'https://ref/1.jpg'
+    assert {'mtime', 'size', 'sha1'} <= set(entry)
+
+
+def test_unchanged_files_are_not_reread(tmp_path, monkeypatch, capsys):
+    write_detailed(tmp_path, '1', [(95, 10)])
+    master = tmp_path / 'master.csv'
+    process_watch_csvs(str(tmp_path), str(master))
+    capsys.readouterr()
+
+    process_watch_csvs(str(tmp_path), str(master))
+    output = capsys.readouterr().out
+    assert 'Processing' not in output
+    assert 'already up to date' in output
+
+
+def test_incremental_matches_rebuild_byte_for_byte(tmp_path):
+    master = tmp_path / 'master.csv'
+    write_detailed(tmp_path, 'B', [(95, 10)])
+    process_watch_csvs(str(tmp_path), str(master))
+    write_detailed(tmp_path, 'A', [(96, 5)])   # sorts first: rewrite
+    process_watch_csvs(str(tmp_path), str(master))
+    write_detailed(tmp_path, 'C', [(97, 7)])   # sorts last: append
+    process_watch_csvs(str(tmp_path), str(master))
+    changed = write_detailed(tmp_path, 'B', [(98, 3)])
+    os.utime(changed, (1, 1))
+    process_watch_csvs(str(tmp_path), str(master))
+    (tmp_path / 'Watched_prices_detailedA.csv').unlink()
+    process_watch_csvs(str(tmp_path), str(master))
+    incremental = read(master)
+
+    shutil.copy(master, tmp_path / 'incremental.csv')
+    process_watch_csvs(str(tmp_path), str(master), rebuild=True)
+    assert read(master) == incremental
+    assert incremental.decode('utf-8').count('https://ref/') == 2
+
+
+def test_manifest_for_other_output_is_ignored(tmp_path, capsys):
+    write_detailed(tmp_path, '1', [(95, 10)])
+    process_watch_csvs(str(tmp_path), str(tmp_path / 'master.csv'))
+    shutil.copy(tmp_path / 'master.csv', tmp_path / 'other.csv')
+    os.replace(manifest_path_for(str(tmp_path / 'master.csv')), manifest_path_for(str(tmp_path / 'other.csv')))
+    capsys.readouterr()
+
+    process_watch_csvs(str(tmp_path), str(tmp_path / 'other.csv'))
+    assert 'Processing Watched_prices_detailed1.csv' in capsys.readouterr().out
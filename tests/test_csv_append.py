@@ -0,0 +1,96 @@
+import csv
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from csv_append import append_csv_dicts, append_csv_rows, create_numbered_csv
+
+HEADER = ['lane', 'row', 'payload']
+PAYLOAD = 'x' * 2000  # long rows so unlocked writes would interleave
+
+
+def append_many(path, lane, count):
+    for row in range(count):
+        append_csv_rows(path, HEADER, [[lane, row, PAYLOAD], [lane, f"{row}b", PAYLOAD]])
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def check(path, lanes, count):
+    rows = read_rows(path)
+    assert rows[0] == HEADER
+    assert HEADER not in rows[1:]
+    body = rows[1:]
+    assert len(body) == lanes * count * 2
+    assert all(len(row) == 3 and row[2] == PAYLOAD for row in body)
+    # Each append's two rows stay together
+    for first, second in zip(body[::2], body[1::2]):
+        assert second[0] == first[0] and second[1] == f"{first[1]}b"
+
+
+def test_header_written_once_for_new_or_empty_file(tmp_path):
+    path = tmp_path / 'results.csv'
+    path.touch()
+    append_csv_rows(path, HEADER, [[1, 1, 'a']])
+    append_csv_rows(path, HEADER, [[1, 2, 'b']])
+    assert read_rows(path) == [HEADER, ['1', '1', 'a'], ['1', '2', 'b']]
+
+
+def test_dict_rows_follow_existing_header(tmp_path):
+    path = tmp_path / 'Matches.csv'
+    append_csv_dicts(path, ['video_url', 'likes'], [{'video_url': 'a', 'likes': 1}])
+    assert read_rows(path) == [['video_url', 'likes'], ['a', '1']]
+
+    # A file started with comment lines and other columns keeps its header
+    path.write_text('# Source Pages:\n#   1. page\nlikes,video_url\n5,b\n', encoding='utf-8')
+    append_csv_dicts(path, ['video_url', 'likes', 'backup_thumbnail_url'],
+                     [{'video_url': 'c', 'likes': 7, 'backup_thumbnail_url': 'x'}])
+    assert read_rows(path)[2:] == [['likes', 'video_url'], ['5', 'b'], ['7', 'c']]
+
+
+def test_concurrent_threads_never_interleave(tmp_path):
+    path = str(tmp_path / 'threads.csv')
+    threads = [threading.Thread(target=append_many, args=(path, lane, 50)) for lane in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    check(path, 8, 50)
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='cross-process locking needs fcntl')
+def test_concurrent_processes_never_interleave(tmp_path):
+    path = str(tmp_path / 'processes.csv')
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=append_many, args=(path, lane, 30)) for lane in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    check(path, 4, 30)
+
+
+def test_numbered_csv_names_are_claimed_once(tmp_path):
+    claimed = []
+    lock = threading.Lock()
+
+    def claim():
+        path, f = create_numbered_csv(str(tmp_path), 'Watched_prices_detailed')
+        f.close()
+        with lock:
+            claimed.append(os.path.basename(path))
+
+    threads = [threading.Thread(target=claim) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(['Watched_prices_detailed.csv'] +
+                                     [f"Watched_prices_detailed{n}.csv" for n in range(1, 10)])
@@ -0,0 +1,162 @@
+import json
+import time
+
+import pytest
+
+import gemini_client
+from gemini_client import (QuotaBreaker, run_batched, checkpoint_path, save_checkpoint, load_checkpoint,
+                           MAX_QUOTA_REQUEUES)
+
+RATE_LIMITED = (None, 'rate_limit: 429 quota exceeded')
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """Fresh process-wide breaker with a short cool-down"""
+    breaker = QuotaBreaker(cooldown=0.05, max_cooldown=0.2, window=10, min_errors=3, ratio=0.5)
+    monkeypatch.setattr(gemini_client, '_breaker', breaker)
+    return breaker
+
+
+def run(items, task, **kwargs):
+    results = {}
+
+    def on_result(item, result):
+        results[item] = result
+        return 'errors' if result is None or result[-1] else 'ok'
+
+    totals = run_batched(items, task, on_result, max_workers=4, batch_size=4, batch_pause=0, **kwargs)
+    return totals, results
+
+
+def test_breaker_opens_on_sustained_rate_limits(breaker):
+    assert not breaker.record(True)
+    assert not breaker.record(True)
+    assert breaker.record(True)  # 3 of 3 rate-limited
+    assert breaker.seconds_until_closed() > 0
+    assert breaker.trips == 1
+
+
+def test_breaker_ignores_sporadic_rate_limits(breaker):
+    for _ in range(3):
+        breaker.record(False)
+        breaker.record(False)
+        assert not breaker.record(True)
+    assert breaker.seconds_until_closed() == 0
+
+
+def test_breaker_probe_closes_or_doubles_cooldown(breaker):
+    for _ in range(3):
+        breaker.record(True)
+    time.sleep(0.06)
+    assert breaker.is_probing()
+
+    # Failed probe: open again for twice as long
+    assert breaker.record(True)
+    assert breaker.cooldown == pytest.approx(0.1)
+    time.sleep(0.11)
+
+    # Successful probe: closed, cool-down back to base
+    assert not breaker.record(False)
+    assert not breaker.is_probing()
+    assert breaker.cooldown == pytest.approx(0.05)
+
+
+def test_retryable_errors_and_unfinished_items_are_retried(breaker):
+    attempts = {}
+
+    def task(item, num, total):
+        attempts[item] = attempts.get(item, 0) + 1
+        if item == 'slow' and attempts[item] == 1:
+            return (None, 'deadline exceeded')
+        return (True, None)
+
+    totals, results = run(['a', 'slow', 'b'], task)
+    assert attempts == {'a': 1, 'slow': 2, 'b': 1}
+    assert totals['retried'] == 1
+    assert totals['ok'] == 3
+    assert results['slow'] == (True, None)
+
+
+def test_sporadic_rate_limits_are_requeued(breaker):
+    attempts = {}
+
+    def task(item, num, total):
+        attempts[item] = attempts.get(item, 0) + 1
+        return RATE_LIMITED if attempts[item] <= 2 and item == 'x' else (True, None)
+
+    totals, results = run(['x'] + [f"ok{n}" for n in range(7)], task)
+    assert attempts['x'] == 3
+    assert totals['quota_requeued'] == 2
+    assert results['x'] == (True, None)
+    assert totals['quota_exhausted'] == 0
+
+
+def test_quota_exhausted_items_stay_in_checkpoint(breaker):
+    checkpoint = checkpoint_path('match_test.csv')
+
+    finished = []
+
+    def task(item, num, total):
+        finished.append(item)
+        return RATE_LIMITED if item == 'stuck' else (True, None)
+
+    totals, results = run(['stuck'] + [f"ok{n}" for n in range(11)], task,
+                          checkpoint=checkpoint, checkpoint_state=lambda: {'calls': len(finished)},
+                          checkpoint_key='run-1')
+
+    assert totals['quota_requeued'] == MAX_QUOTA_REQUEUES
+    assert totals['quota_exhausted'] == 1
+    assert results['stuck'] == RATE_LIMITED  # still reported
+    pending, state = load_checkpoint(checkpoint, key='run-1')
+    assert pending == ['stuck']
+    assert state == {'calls': 11 + 1 + MAX_QUOTA_REQUEUES}
+
+
+def test_finished_run_removes_checkpoint(breaker):
+    checkpoint = checkpoint_path('match_done.csv')
+    save_checkpoint(checkpoint, 'videos', ['old'])
+
+    run(['a', 'b'], lambda item, num, total: (True, None), checkpoint=checkpoint)
+    assert load_checkpoint(checkpoint) == (None, None)
+
+
+def test_open_breaker_pauses_and_checkpoints_queue(breaker, monkeypatch):
+    checkpoint = checkpoint_path('match_pause.csv')
+    saved = []
+    real_save = gemini_client.save_checkpoint
+
+    def spy_save(path, label, pending, state=None, resume_at=None, key=None):
+        saved.append((list(pending), resume_at is not None))
+        real_save(path, label, pending, state, resume_at, key)
+
+    monkeypatch.setattr(gemini_client, 'save_checkpoint', spy_save)
+    calls = {'n': 0}
+
+    def task(item, num, total):
+        calls['n'] += 1
+        return RATE_LIMITED if calls['n'] <= 4 else (True, None)
+
+    items = [f"v{n}" for n in range(8)]
+    totals, results = run(items, task, checkpoint=checkpoint)
+
+    assert totals['quota_pauses'] >= 1
+    assert saved and saved[0][1]  # paused with a resume time
+    assert sorted(saved[0][0]) == items  # nothing had a result yet
+    assert all(results[item] == (True, None) for item in items)
+    assert load_checkpoint(checkpoint) == (None, None)
+
+
+def test_checkpoint_for_other_run_is_discarded():
+    checkpoint = checkpoint_path('match_page.csv')
+    save_checkpoint(checkpoint, 'videos', ['v1', 'v2'], {'matches': []}, key='page-a')
+
+    with open(checkpoint, encoding='utf-8') as f:
+        assert json.load(f)['key'] == 'page-a'
+    assert load_checkpoint(checkpoint, key='page-a') == (['v1', 'v2'], {'matches': []})
+    assert load_checkpoint(checkpoint, key='page-b') == (None, None)
+    assert load_checkpoint(checkpoint) == (None, None)  # discarded, not just skipped
+
+
+def test_checkpoint_path_is_filesystem_safe():
+    assert checkpoint_path('match_Matches/my file?.csv') == checkpoint_path('match_Matches_my_file_.csv')
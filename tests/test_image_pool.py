@@ -0,0 +1,110 @@
+import io
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+pytest.importorskip('PIL')
+pytest.importorskip('imagehash')
+
+from PIL import Image
+
+import image_pool
+from image_pool import ImageDecodePool, decode_image
+
+
+def encode(image, format='PNG'):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def noise(mode, size):
+    """Incompressible image, so its PNG is about as large as its pixels"""
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+
+
+def palette_image():
+    image = Image.new('P', (16, 8))
+    image.putpalette([value for i in range(256) for value in (i, 255 - i, i // 2)])
+    image.putdata([i % 16 for i in range(16 * 8)])
+    image.info['transparency'] = 3
+    return image
+
+
+@pytest.fixture
+def pool():
+    pool = ImageDecodePool(max_workers=1, slot_size=64 * 1024)
+    yield pool
+    pool.shutdown()
+
+
+def assert_same(decoded, original):
+    assert decoded.mode == original.mode
+    assert decoded.size == original.size
+    assert decoded.tobytes() == original.tobytes()
+
+
+@pytest.mark.parametrize('original', [
+    noise('RGB', (40, 30)),
+    noise('RGBA', (40, 30)),
+    palette_image(),
+], ids=['RGB', 'RGBA', 'P'])
+def test_round_trip_through_slots(pool, original):
+    for _ in range(3):  # slots are reused between decodes
+        decoded, signature = pool.decode(encode(original))
+        assert_same(decoded, original)
+        assert signature is None
+
+    if original.mode == 'P':
+        assert decoded.getpalette() == original.getpalette()
+        assert decoded.info['transparency'] == 3
+
+
+def test_mode_and_max_dim_are_applied_in_the_worker(pool):
+    decoded, _ = pool.decode(encode(noise('RGBA', (80, 40))), mode='RGB', max_dim=20)
+    assert decoded.mode == 'RGB'
+    assert decoded.size == (20, 10)
+
+
+def test_input_larger_than_slot_is_pickled(pool):
+    original = noise('RGB', (200, 200))
+    raw = encode(original)
+    assert len(raw) > pool.slot_size
+
+    decoded, _ = pool.decode(raw)
+    assert_same(decoded, original)
+
+
+def test_pixels_larger_than_slot_are_pickled(pool):
+    original = Image.new('RGB', (200, 200), (10, 20, 30))
+    raw = encode(original)
+    assert len(raw) < pool.slot_size < len(original.tobytes())
+
+    decoded, _ = pool.decode(raw)
+    assert_same(decoded, original)
+
+
+class BrokenPool:
+    def decode(self, *args):
+        raise BrokenProcessPool('a worker process died')
+
+
+def test_broken_pool_falls_back_to_thread_decode(monkeypatch):
+    monkeypatch.setattr(image_pool, '_pool', BrokenPool())
+    monkeypatch.setattr(image_pool, '_pool_disabled', False)
+    original = noise('RGB', (12, 12))
+
+    decoded, _ = decode_image(encode(original))
+
+    assert_same(decoded, original)
+    assert image_pool._pool is None
+    assert image_pool._pool_disabled
+    # Later calls decode in the thread without trying the pool again
+    assert_same(decode_image(encode(original))[0], original)
+
+
+def test_undecodable_bytes_return_none(pool, monkeypatch):
+    monkeypatch.setattr(image_pool, '_pool', pool)
+    assert decode_image(b'not an image') == (None, None)
+    assert image_pool._pool is pool
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip('imagehash')
+
+from image_signature import (SignatureIndex, compare_signatures, hamming, DEFAULT_THRESHOLDS,
+                             CROP_SEGMENT_THRESHOLD)
+
+
+def flip(value, bits):
+    """value with its lowest `bits` bits inverted"""
+    return value ^ ((1 << bits) - 1)
+
+
+BASE = {'phash': 0x0F0F0F0F0F0F0F0F, 'dhash': 0x123456789ABCDEF0, 'colorhash': 0x2AAAAAAAAAA}
+
+
+def test_hamming():
+    assert hamming(0b1010, 0b0101) == 4
+    assert hamming(BASE['phash'], flip(BASE['phash'], 7)) == 7
+
+
+def test_identical_phash_always_matches():
+    other = {'phash': BASE['phash'], 'dhash': flip(BASE['dhash'], 40), 'colorhash': flip(BASE['colorhash'], 30)}
+    assert compare_signatures(BASE, other)[0]
+
+
+def test_two_components_within_threshold_match():
+    other = {'phash': flip(BASE['phash'], DEFAULT_THRESHOLDS['phash']),
+             'dhash': flip(BASE['dhash'], DEFAULT_THRESHOLDS['dhash']),
+             'colorhash': flip(BASE['colorhash'], 30)}
+    is_match, distances = compare_signatures(BASE, other)
+    assert is_match
+    assert distances == {'phash': 8, 'dhash': 10, 'colorhash': 30}
+
+
+def test_one_component_within_threshold_does_not_match():
+    other = {'phash': flip(BASE['phash'], DEFAULT_THRESHOLDS['phash'] + 1),
+             'dhash': flip(BASE['dhash'], DEFAULT_THRESHOLDS['dhash'] + 1),
+             'colorhash': BASE['colorhash']}
+    assert not compare_signatures(BASE, other)[0]
+
+
+def test_different_product_with_same_palette_does_not_match():
+    # Same colours and a similar edge layout, but pHash is far apart
+    other = {'phash': flip(BASE['phash'], 30),
+             'dhash': flip(BASE['dhash'], DEFAULT_THRESHOLDS['dhash']),
+             'colorhash': BASE['colorhash']}
+    is_match, distances = compare_signatures(BASE, other)
+    assert not is_match
+    assert distances == {'phash': 30, 'dhash': 10, 'colorhash': 0}
+
+
+def test_phash_and_colorhash_match():
+    other = {'phash': flip(BASE['phash'], DEFAULT_THRESHOLDS['phash']),
+             'dhash': flip(BASE['dhash'], 40),
+             'colorhash': flip(BASE['colorhash'], DEFAULT_THRESHOLDS['colorhash'])}
+    assert compare_signatures(BASE, other)[0]
+
+
+def test_custom_thresholds_tighten_matching():
+    other = dict(BASE, phash=flip(BASE['phash'], 3), dhash=flip(BASE['dhash'], 3))
+    assert compare_signatures(BASE, other)[0]
+    # Only colorhash agrees under the tighter pHash/dHash limits
+    assert not compare_signatures(BASE, other, {'phash': 2, 'dhash': 2, 'colorhash': 0})[0]
+
+
+def test_legacy_phash_only_entries():
+    legacy = {'phash': flip(BASE['phash'], 2)}
+    # Only one comparable component, and it is not identical
+    assert not compare_signatures(BASE, legacy)[0]
+    assert compare_signatures(BASE, {'phash': BASE['phash']})[0]
+
+
+def test_crop_segments_match():
+    a = dict(BASE, dhash=flip(BASE['dhash'], 40), colorhash=flip(BASE['colorhash'], 30),
+             crop=[1, 2, 3])
+    b = dict(BASE, phash=flip(BASE['phash'], 30), crop=[1, flip(2, CROP_SEGMENT_THRESHOLD), 0xFFFF])
+    is_match, distances = compare_signatures(a, b)
+    assert is_match
+    assert distances['crop'] == 'segments'
+
+
+def test_index_returns_first_payload():
+    index = SignatureIndex()
+    index.add(BASE, 'first')
+    index.add(dict(BASE), 'second')
+    near = dict(BASE, phash=flip(BASE['phash'], 4), dhash=flip(BASE['dhash'], 4))
+
+    assert index.find(BASE) == ('first', {'phash': 0})
+    assert index.find(near)[0] == 'first'
+    assert index.find({'phash': 0, 'dhash': 0, 'colorhash': 0}) == (None, None)
+    assert len(index) == 2
+
+
+def test_exact_index_requires_every_component():
+    index = SignatureIndex({component: 0 for component in DEFAULT_THRESHOLDS}, exact=True)
+    index.add(BASE, 'first')
+
+    assert index.find(dict(BASE))[0] == 'first'
+    # Identical phash alone is not enough in exact mode
+    assert index.find(dict(BASE, dhash=flip(BASE['dhash'], 1))) == (None, None)
+    assert index.find(dict(BASE, colorhash=flip(BASE['colorhash'], 1))) == (None, None)
@@ -0,0 +1,59 @@
+import time
+
+from price_cache import PriceCache, content_hash
+
+PRODUCTS = [{'1688_url': 'https://detail.1688.com/1.html', 'image_url': 'https://img/1.jpg', 'price': '¥12.00'}]
+
+
+def test_content_hash_ignores_file_name(tmp_path):
+    (tmp_path / 'a.png').write_bytes(b'same bytes')
+    (tmp_path / 'b.png').write_bytes(b'same bytes')
+    (tmp_path / 'c.png').write_bytes(b'other bytes')
+
+    assert content_hash(tmp_path / 'a.png') == content_hash(tmp_path / 'b.png')
+    assert content_hash(tmp_path / 'a.png') != content_hash(tmp_path / 'c.png')
+
+
+def test_products_fresh_within_ttl():
+    cache = PriceCache(ttl_hours=1)
+    cache.store_search('ref', 'https://ref.jpg', PRODUCTS)
+
+    assert cache.fresh_products('ref') == PRODUCTS
+    assert cache.stats['searches_reused'] == 1
+    assert cache.fresh_products('missing') is None
+
+
+def test_products_expire_after_ttl(monkeypatch):
+    cache = PriceCache(ttl_hours=1)
+    cache.store_search('ref', 'https://ref.jpg', PRODUCTS)
+
+    real_time = time.time
+    monkeypatch.setattr(time, 'time', lambda: real_time() + 3601)
+    assert cache.fresh_products('ref') is None
+    assert cache.stats['searches_reused'] == 0
+
+
+def test_ttl_from_settings(monkeypatch):
+    monkeypatch.setenv('ALIPRICE_CACHE_TTL_HOURS', '0.5')
+    assert PriceCache().ttl_hours == 0.5
+
+
+def test_scores_survive_refreshed_search():
+    cache = PriceCache(ttl_hours=0)
+    cache.store_search('ref', 'https://ref.jpg', PRODUCTS)
+    cache.store_scores('ref', {'https://img/1.jpg': {'final_score': 95}})
+
+    # Expired prices, but a new search keeps the known scores
+    assert cache.fresh_products('ref') is None
+    cache.store_search('ref', 'https://ref.jpg', PRODUCTS)
+    assert cache.scores('ref') == {'https://img/1.jpg': {'final_score': 95}}
+
+
+def test_unreadable_entry_is_a_miss(isolated_cwd):
+    cache = PriceCache()
+    cache.store_search('ref', 'https://ref.jpg', PRODUCTS)
+    with open(cache.path('ref'), 'w', encoding='utf-8') as f:
+        f.write('{not json')
+
+    assert cache.load('ref') is None
+    assert cache.fresh_products('ref') is None
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+
+import pytest
+
+import reference_cache
+from reference_cache import (LocalReferenceProvider, reference_context, set_reference_provider,
+                             release_references, image_digest, context_key)
+
+
+class FakeImage:
+    """Just enough of PIL.Image for image_digest"""
+
+    def __init__(self, pixels, mode='RGB', size=(2, 2)):
+        self.pixels = pixels
+        self.mode = mode
+        self.size = size
+
+    def tobytes(self):
+        return self.pixels
+
+
+class FakeModel:
+    model_name = 'models/gemini-test'
+
+    def __init__(self):
+        self.calls = []
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.calls.append(list(contents))
+        return 'response'
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setenv('GEMINI_REFERENCE_CACHE', 'cache')
+    provider = LocalReferenceProvider()
+    set_reference_provider(provider)
+    yield provider
+    set_reference_provider(None)
+
+
+async def hold(model, references, prompt='Same product?'):
+    async with reference_context(model, prompt, references, 'match') as context:
+        return context
+
+
+def register(model, references, prompt='Same product?'):
+    return asyncio.run(hold(model, references, prompt))
+
+
+@pytest.fixture
+def released(provider, monkeypatch):
+    released = []
+    monkeypatch.setattr(provider, 'release', lambda handles, cache: released.append(list(handles)))
+    return released
+
+
+def test_digest_depends_on_content_not_identity():
+    assert image_digest(FakeImage(b'abc')) == image_digest(FakeImage(b'abc'))
+    assert image_digest(FakeImage(b'abc')) != image_digest(FakeImage(b'abd'))
+    assert image_digest(FakeImage(b'abc', mode='L')) != image_digest(FakeImage(b'abc'))
+
+
+def test_same_references_register_once(provider):
+    model = FakeModel()
+    first = register(model, [FakeImage(b'ref')])
+    second = register(model, [FakeImage(b'ref')])  # equal content, different object
+
+    assert first is second
+    assert provider.uploads == 1
+    assert provider.caches == 1
+
+
+def test_cached_request_sends_only_the_thumbnail(provider):
+    model = FakeModel()
+    reference = FakeImage(b'ref')
+    context = register(model, [reference])
+
+    call_model, contents = context.request(['thumbnail'])
+    assert contents == ['thumbnail']
+    asyncio.run(call_model.generate_content_async(contents))
+    assert model.calls == [['Same product?', reference, 'thumbnail']]
+
+
+def test_files_mode_sends_handles(provider, monkeypatch):
+    monkeypatch.setenv('GEMINI_REFERENCE_CACHE', 'files')
+    reference = FakeImage(b'ref')
+    context = register(FakeModel(), [reference])
+
+    assert context.request(['thumbnail'])[1] == ['Same product?', reference, 'thumbnail']
+    assert provider.caches == 0
+
+
+def test_off_mode_is_inline_and_not_registered(provider, monkeypatch):
+    monkeypatch.setenv('GEMINI_REFERENCE_CACHE', 'off')
+    reference = FakeImage(b'ref')
+    context = register(FakeModel(), [reference])
+
+    assert context.request(['thumbnail'])[1] == ['Same product?', reference, 'thumbnail']
+    assert provider.uploads == 0
+    assert not reference_cache._contexts
+
+
+def test_lru_releases_least_recently_used(released, monkeypatch):
+    monkeypatch.setenv('GEMINI_REFERENCE_CACHE_MAX', '2')
+    model = FakeModel()
+    a, b, c = FakeImage(b'a'), FakeImage(b'b'), FakeImage(b'c')
+
+    register(model, [a])
+    register(model, [b])
+    register(model, [a])  # a is now the most recent
+    register(model, [c])  # evicts b
+
+    assert released == [[b]]
+    assert len(reference_cache._contexts) == 2
+
+
+def test_release_references_drops_matching_contexts(provider):
+    model = FakeModel()
+    a, b = FakeImage(b'a'), FakeImage(b'b')
+    register(model, [a])
+    register(model, [b])
+
+    release_references([FakeImage(b'a')])
+    keys = list(reference_cache._contexts)
+    assert keys == [context_key(model, 'Same product?', [b], 'cache')]
+
+
+def test_context_in_use_is_not_released(released, monkeypatch):
+    monkeypatch.setenv('GEMINI_REFERENCE_CACHE_MAX', '1')
+    model = FakeModel()
+    a, b, c = FakeImage(b'a'), FakeImage(b'b'), FakeImage(b'c')
+
+    async def scenario():
+        async with reference_context(model, 'Same product?', [a], 'match'):
+            await hold(model, [b])  # over the limit, but a has a request in flight
+            release_references([a])
+            assert released == []
+        assert released == [[a]]
+
+    asyncio.run(scenario())
+    register(model, [c])  # b is idle now and gets evicted
+    assert released == [[a], [b]]
+
+
+def test_pending_registration_is_released_once_it_resolves(provider, released, monkeypatch):
+    uploading = threading.Event()
+    finish_upload = threading.Event()
+
+    def slow_upload(image, display_name):
+        uploading.set()
+        finish_upload.wait(5)
+        return image
+
+    monkeypatch.setattr(provider, 'upload_image', slow_upload)
+    reference = FakeImage(b'a')
+
+    async def scenario():
+        request = asyncio.create_task(hold(FakeModel(), [reference]))
+        await asyncio.to_thread(uploading.wait, 5)
+        release_references([reference])
+        assert not reference_cache._contexts
+        finish_upload.set()
+        await request
+
+    asyncio.run(scenario())
+    assert released == [[reference]]
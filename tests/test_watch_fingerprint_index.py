@@ -0,0 +1,68 @@
+from watch_fingerprint_index import FingerprintIndex, FINGERPRINT_FIELDS, parse_fingerprint
+
+BASE = {
+    'CASE_SHAPE': 'round',
+    'CASE_COLOR': 'gold',
+    'DIAL_COLOR': 'white',
+    'DIAL_MARKERS': 'roman',
+    'DIAL_MARKERS_COLOR': 'black',
+    'STRAP_TYPE': 'leather',
+    'STRAP_COLOR': 'brown',
+}
+
+
+def fingerprint(**changes):
+    attributes = dict(BASE, **changes)
+    return '|'.join(attributes[field] for field in FINGERPRINT_FIELDS)
+
+
+def build_index(*fingerprints):
+    db = {'fingerprints': {fp: {'thumbnail_url': f"https://img/{n}.jpg"} for n, fp in enumerate(fingerprints)}}
+    return FingerprintIndex(db)
+
+
+def test_parse_fingerprint_rejects_malformed():
+    assert parse_fingerprint(fingerprint()) == BASE
+    assert parse_fingerprint('round|gold') is None
+
+
+def test_exact_fingerprint_is_distance_zero():
+    index = build_index(fingerprint())
+    assert index.nearest(BASE) == [(fingerprint(), 0, 'https://img/0.jpg')]
+
+
+def test_weighted_distance_and_order():
+    close = fingerprint(DIAL_MARKERS_COLOR='gold')   # weight 1
+    farther = fingerprint(STRAP_COLOR='black')       # weight 2
+    too_far = fingerprint(CASE_SHAPE='square', DIAL_COLOR='black')
+    index = build_index(farther, too_far, close)
+
+    result = index.nearest(BASE)
+    assert [(fp, distance) for fp, distance, _ in result] == [(close, 1), (farther, 2)]
+
+
+def test_other_half_matches():
+    index = build_index(fingerprint(STRAP_COLOR='other'))
+    [(_, distance, _)] = index.nearest(BASE)
+    assert distance == 1  # half of STRAP_COLOR's weight of 2
+
+    [(_, distance, _)] = index.nearest(dict(BASE, CASE_COLOR='other'), max_distance=5)
+    assert distance == 1 + 1  # CASE_COLOR 'other' vs 'gold' plus STRAP_COLOR 'brown' vs 'other'
+
+
+def test_max_distance_zero_and_top_n():
+    fingerprints = [fingerprint(), fingerprint(DIAL_MARKERS_COLOR='gold'), fingerprint(DIAL_MARKERS_COLOR='blue')]
+    index = build_index(*fingerprints)
+
+    assert [fp for fp, _, _ in index.nearest(BASE, max_distance=0)] == [fingerprint()]
+    assert len(index.nearest(BASE, top_n=2)) == 2
+
+
+def test_add_keeps_first_thumbnail():
+    index = FingerprintIndex()
+    index.add(fingerprint(), 'https://img/first.jpg')
+    index.add(fingerprint(), 'https://img/second.jpg')
+    index.add('malformed', 'https://img/bad.jpg')
+
+    assert len(index) == 1
+    assert index.nearest(BASE)[0][2] == 'https://img/first.jpg'
@@ -0,0 +1,61 @@
+import csv
+
+import pytest
+
+pytest.importorskip('playwright')
+pytest.importorskip('google.generativeai')
+pytest.importorskip('PIL')
+pytest.importorskip('imagehash')
+pytest.importorskip('requests')
+
+import find_product_videos_multi as matcher
+from watchlist_scheduler import WatchlistScheduler, build_page_spec
+
+PAGES = ['https://www.douyin.com/user/seller_a', 'https://www.douyin.com/user/seller_b']
+
+
+def page_videos(url, run):
+    return [
+        {'video_url': f"{url}/video/{run}{i}", 'thumbnail_url': f"{url}/thumb/{run}{i}.jpg",
+         'likes': i, 'index': i, 'source_page': url}
+        for i in range(2)
+    ]
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test')
+    monkeypatch.setattr(matcher, 'setup_gemini_api', lambda: object())
+    monkeypatch.setattr(matcher, 'load_reference_image', lambda path: object())
+    # Every video matches
+    monkeypatch.setattr(matcher, 'analyze_videos',
+                        lambda videos, model, reference, max_workers=None: (videos, []))
+
+    watchlist = {'stages': ['match'], 'reference_image': 'Products/GAMEBOY.png',
+                 'pages': [{'url': url} for url in PAGES]}
+    scheduler = WatchlistScheduler(watchlist, stagger_first_runs=False)
+    yield scheduler
+    scheduler.extract_pool.shutdown()
+    scheduler.process_pool.shutdown()
+
+
+def run_page(scheduler, entry, videos):
+    spec = build_page_spec(scheduler.watchlist, entry)
+    job_state = {'pages': {entry['url']: {'videos': videos}}, 'tagged_json': [], 'seen_ids': {}}
+    extract_report = {'name': spec['name'], 'success': True, 'stages': []}
+    scheduler.process_page(entry, spec, job_state, extract_report, {v['video_url'] for v in videos})
+    assert scheduler.state[entry['url']]['last_status'] == 'success'
+
+
+def test_page_runs_keep_each_others_matches(scheduler):
+    expected = []
+    for run in range(2):
+        for entry in scheduler.watchlist['pages']:
+            videos = page_videos(entry['url'], run)
+            run_page(scheduler, entry, videos)
+            expected += [v['video_url'] for v in videos]
+
+    with open('Matches/GAMEBOY.csv', newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['video_url'] for row in rows] == expected
+    assert {row['source_page'] for row in rows} == set(PAGES)
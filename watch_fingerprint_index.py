@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Watch Fingerprint Index
+Attribute-level index over processed_watches_db.json fingerprints so a new watch is checked
+against its nearest prior watches (weighted per-field distance) instead of only an exact
+fingerprint string match
+"""
+
+import threading
+
+# Order matches generate_watch_fingerprint: CASE_SHAPE|CASE_COLOR|DIAL_COLOR|...
+FINGERPRINT_FIELDS = ['CASE_SHAPE', 'CASE_COLOR', 'DIAL_COLOR', 'DIAL_MARKERS',
+                      'DIAL_MARKERS_COLOR', 'STRAP_TYPE', 'STRAP_COLOR']
+
+# Fields the model labels most reliably weigh most
+FIELD_WEIGHTS = {
+    'CASE_SHAPE': 3,
+    'CASE_COLOR': 2,
+    'DIAL_COLOR': 3,
+    'DIAL_MARKERS': 2,
+    'DIAL_MARKERS_COLOR': 1,
+    'STRAP_TYPE': 2,
+    'STRAP_COLOR': 2,
+}
+
+# 'other' is the model's fallback label, so it half-matches any value
+OTHER_VALUE = 'other'
+
+DEFAULT_TOP_N = 3
+DEFAULT_MAX_DISTANCE = 3
+
+
+def parse_fingerprint(fingerprint):
+    """Split a fingerprint string back into {field: value} (None if malformed)"""
+    values = fingerprint.split('|')
+    if len(values) != len(FINGERPRINT_FIELDS):
+        return None
+    return dict(zip(FINGERPRINT_FIELDS, values))
+
+
+class FingerprintIndex:
+    """Per-field posting lists (field -> value -> fingerprints) with weighted distance
+
+    Thread-safe: worker threads query while the main thread adds new watches.
+    """
+
+    def __init__(self, db=None):
+        self.lock = threading.Lock()
+        self.postings = {field: {} for field in FINGERPRINT_FIELDS}
+        self.thumbnails = {}
+        self.total_weight = sum(FIELD_WEIGHTS.values())
+
+        for fingerprint, entry in (db or {}).get('fingerprints', {}).items():
+            self.add(fingerprint, entry.get('thumbnail_url'))
+
+    def add(self, fingerprint, thumbnail_url):
+        """Index a fingerprint (keeps the first thumbnail seen, like the database)"""
+        attributes = parse_fingerprint(fingerprint)
+        if not attributes:
+            return
+
+        with self.lock:
+            if fingerprint in self.thumbnails:
+                return
+            self.thumbnails[fingerprint] = thumbnail_url
+            for field, value in attributes.items():
+                self.postings[field].setdefault(value, set()).add(fingerprint)
+
+    def nearest(self, attributes, top_n=DEFAULT_TOP_N, max_distance=DEFAULT_MAX_DISTANCE):
+        """Return up to top_n prior watches within max_distance, closest first
+
+        Args:
+            attributes: {field: value} from extract_watch_attributes
+            top_n: max candidates to return
+            max_distance: max weighted distance (0 = exact fingerprint)
+
+        Returns:
+            list: [(fingerprint, distance, thumbnail_url), ...]
+        """
+        min_score = self.total_weight - max_distance
+        scores = {}
+
+        with self.lock:
+            for field in FINGERPRINT_FIELDS:
+                value = attributes.get(field)
+                weight = FIELD_WEIGHTS[field]
+                field_postings = self.postings[field]
+
+                for fingerprint in field_postings.get(value, ()):
+                    scores[fingerprint] = scores.get(fingerprint, 0) + weight
+
+                if value == OTHER_VALUE:
+                    for other_value, fingerprints in field_postings.items():
+                        if other_value == OTHER_VALUE:
+                            continue
+                        for fingerprint in fingerprints:
+                            scores[fingerprint] = scores.get(fingerprint, 0) + weight / 2
+                else:
+                    for fingerprint in field_postings.get(OTHER_VALUE, ()):
+                        scores[fingerprint] = scores.get(fingerprint, 0) + weight / 2
+
+            candidates = [
+                (fingerprint, self.total_weight - score, self.thumbnails[fingerprint])
+                for fingerprint, score in scores.items()
+                if score >= min_score
+            ]
+
+        candidates.sort(key=lambda c: (c[1], c[0]))
+        return candidates[:top_n]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.thumbnails)
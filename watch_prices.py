@@ -2,26 +2,62 @@
 """
 Watch Prices - 1688 Product Finder
 Finds similar products on 1688 using image search and AI comparison
+
+Settings (.env or environment):
+  ALIPRICE_SEARCH_TABS=3     AliPrice searches run at once, each on its own browser lane
+                             (default 1; scoring always overlaps the next search)
+  PRICE_SEARCH_MODE=cheapest score cheapest-first and stop at the cheapest ≥95 match
+                             (default full: score every product for the detailed CSV)
+  PRICE_SCORE_WAVE_SIZE=10   products per cheapest-first wave
+  ALIPRICE_WAIT_SECONDS=60   timeout budget for AliPrice results to load
 """
 
 import os
 import sys
 import csv
 import time
+import asyncio
 import json
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+from browser_session import open_browser_context, get_session_mode, read_env_setting, DEFAULT_USER_AGENT
 import google.generativeai as genai
 from PIL import Image
+from image_pool import decode_image
+from gemini_client import wrap_model, run_batched, read_float_setting
+from gemini_usage import apply_budget_arg, get_usage_tracker
+from reference_cache import reference_context, release_references
+from price_cache import get_price_cache, content_hash
+from csv_append import append_csv_rows, create_numbered_csv
 import io
 import requests
-from concurrent.futures import ThreadPoolExecutor
 import re
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+DEFAULT_SEARCH_TABS = 1
+
+# Watches.csv keeps the cheapest product scoring at least this
+HIGH_QUALITY_SCORE = 95.0
+
+# Products per wave when scoring cheapest-first (PRICE_SEARCH_MODE=cheapest)
+DEFAULT_WAVE_SIZE = 10
+
+# Timeout budget for AliPrice results to appear and finish lazy-loading
+DEFAULT_WAIT_SECONDS = 60
+
+# A scroll that adds no products within this long means the list is complete
+SCROLL_SETTLE_MS = 3000
+
+# AliPrice rejects uploaded files over 2000KB
+ALIPRICE_MAX_UPLOAD_BYTES = 1900 * 1024
+
 def setup_gemini_api():
     """Setup Gemini API with user's API key"""
     api_key = os.getenv('GEMINI_API_KEY')
@@ -37,7 +73,7 @@ def setup_gemini_api():
     
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash-preview-09-2025')
+        model = wrap_model(genai.GenerativeModel('gemini-2.5-flash-preview-09-2025'))
         print("✅ Gemini API configured successfully (using gemini-2.5-flash-preview-09-2025)")
         return model
     except Exception as e:
@@ -60,7 +96,11 @@ def load_reference_image(image_path):
         return None
 
 def download_product_image(url):
-    """Download product image from URL"""
+    """Download product image from URL
+    
+    Returns:
+        tuple: (PIL.Image, SHA-1 of the downloaded bytes) or (None, None) on error
+    """
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
@@ -68,54 +108,143 @@ def download_product_image(url):
         response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
-        image = Image.open(io.BytesIO(response.content))
-        return image
+        image, _ = decode_image(response.content)  # decode in the image process pool
+        if not image:
+            return (None, None)
+        return (image, hashlib.sha1(response.content).hexdigest())
     except Exception as e:
         print(f"  ⚠️ Error downloading product image: {e}")
-        return None
+        return (None, None)
 
-def upload_image_to_aliprice(context, page, image_url, is_first_url=False):
-    """Upload image URL to aliprice.com and wait for results"""
+def submit_image_file(page, image_path):
+    """Upload a local image through AliPrice's file input and return the results page
+    
+    The upload button creates a hidden file input and opens a file chooser; the page then
+    posts the image and navigates to the results (in this tab, or a new one).
+    """
+    popups = []
+    page.on('popup', popups.append)
+    start_url = page.url
+    
+    print(f"📤 Uploading local file: {os.path.basename(image_path)}")
+    upload_button = page.locator('.js-btn-upload').first
+    try:
+        page.locator('.js-btn-upload, input[type="file"]').first.wait_for(state='attached', timeout=10000)
+    except PlaywrightTimeout:
+        pass
+    if upload_button.count() > 0:
+        with page.expect_file_chooser(timeout=10000) as chooser_info:
+            upload_button.click()
+        chooser_info.value.set_files(image_path)
+    else:
+        page.set_input_files('input[type="file"]', image_path)
+    
+    print("⏳ Waiting for search results...")
+    deadline = time.time() + read_float_setting('ALIPRICE_WAIT_SECONDS', DEFAULT_WAIT_SECONDS)
+    while time.time() < deadline:
+        if popups:
+            popups[0].wait_for_load_state('domcontentloaded')
+            print(f"✅ New tab captured! URL: {popups[0].url[:80]}")
+            return popups[0]
+        if page.url != start_url:
+            page.wait_for_load_state('domcontentloaded')
+            print(f"✅ Results loaded: {page.url[:80]}")
+            return page
+        page.wait_for_timeout(250)
+    
+    print("❌ AliPrice did not open results for the uploaded file")
+    save_debug_screenshot(page, 'debug_upload_failed.png')
+    return None
+
+def save_debug_screenshot(page, path):
+    """Screenshot a page that failed, for troubleshooting"""
+    try:
+        page.screenshot(path=path)
+        print(f"📸 Screenshot saved to {path}")
+    except Exception:
+        pass
+
+def wait_for_products(page, timeout=None):
+    """Scroll the results page until the product list stops growing
+    
+    Waits for the first li.image_li, then keeps scrolling to the bottom while each scroll
+    lazy-loads more products (network idle between scrolls). Stops as soon as a scroll
+    adds nothing within SCROLL_SETTLE_MS, or when the timeout budget is spent.
+    
+    Returns:
+        int: number of product containers (0 if none appeared within the budget)
+    """
+    budget = timeout or read_float_setting('ALIPRICE_WAIT_SECONDS', DEFAULT_WAIT_SECONDS)
+    deadline = time.time() + budget
+    products = page.locator('li.image_li')
+    
+    def remaining_ms(cap=None):
+        left = int((deadline - time.time()) * 1000)
+        return max(1, min(left, cap) if cap else left)
+    
+    try:
+        products.first.wait_for(state='attached', timeout=remaining_ms())
+    except PlaywrightTimeout:
+        return 0
+    
+    count = products.count()
+    while time.time() < deadline:
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            page.wait_for_function("n => document.querySelectorAll('li.image_li').length > n",
+                                   arg=count, timeout=remaining_ms(SCROLL_SETTLE_MS))
+        except PlaywrightTimeout:
+            break  # Nothing more to lazy-load
+        try:
+            page.wait_for_load_state('networkidle', timeout=remaining_ms(SCROLL_SETTLE_MS))
+        except PlaywrightTimeout:
+            pass
+        count = products.count()
+    
+    return products.count()
+
+def upload_image_to_aliprice(context, page, image_url, is_first_url=False, local_file=False):
+    """Submit an image URL (or, with local_file, a local image path) to aliprice.com and
+    wait for results"""
     try:
         print(f"📤 Navigating to aliprice.com...")
         page.goto('https://www.aliprice.com/independent/1688.html', wait_until='domcontentloaded', timeout=30000)
         
-        print("⏳ Waiting for page to fully load...")
-        time.sleep(5)
-        
-        print("🔍 Looking for input field...")
-        try:
-            input_field = page.locator('input[placeholder*="image url"], input[placeholder*="product url"]').first
-            input_field.wait_for(state='visible', timeout=10000)
-            print("✅ Found input field")
-            
-            print("🖱️  Clicking on input field...")
-            input_field.click()
-            time.sleep(0.5)
-            
-            input_field.fill('')
-            time.sleep(0.3)
-            
-            print(f"📋 Pasting URL: {image_url[:60]}...")
-            input_field.fill(image_url)
-            time.sleep(1)
-            
-            print("⏳ Pressing Enter to submit and waiting for new tab...")
-            
-            # Use context.expect_page() to properly capture the new tab
-            with context.expect_page() as new_page_info:
-                input_field.press('Enter')
-            
-            # Get the new page that was opened
-            new_page = new_page_info.value
-            print(f"✅ New tab captured! URL: {new_page.url[:80]}")
-            
-            # Store it for later use
-            results_page = new_page
-            
-        except Exception as e:
-            print(f"⚠️ Could not interact with input field: {e}")
-            results_page = None
+        if local_file:
+            try:
+                results_page = submit_image_file(page, image_url)
+            except Exception as e:
+                print(f"⚠️ Could not upload local file: {e}")
+                results_page = None
+        else:
+            print("🔍 Looking for input field...")
+            try:
+                input_field = page.locator('input[placeholder*="image url"], input[placeholder*="product url"]').first
+                input_field.wait_for(state='visible', timeout=10000)
+                print("✅ Found input field")
+                
+                print("🖱️  Clicking on input field...")
+                input_field.click()
+                
+                print(f"📋 Pasting URL: {image_url[:60]}...")
+                input_field.fill(image_url)
+                
+                print("⏳ Pressing Enter to submit and waiting for new tab...")
+                
+                # Capture the tab opened by this page (other search lanes may open tabs in the same context)
+                with page.expect_popup() as new_page_info:
+                    input_field.press('Enter')
+                
+                # Get the new page that was opened
+                new_page = new_page_info.value
+                print(f"✅ New tab captured! URL: {new_page.url[:80]}")
+                
+                # Store it for later use
+                results_page = new_page
+                
+            except Exception as e:
+                print(f"⚠️ Could not interact with input field: {e}")
+                results_page = None
         
         # Check if we successfully captured the results page
         if not results_page:
@@ -150,8 +279,6 @@ def upload_image_to_aliprice(context, page, image_url, is_first_url=False):
             try:
                 input("Press ENTER when ready: ")
                 print("✅ Continuing...", flush=True)
-                time.sleep(2)
-                
             except KeyboardInterrupt:
                 print("\n⚠️ Interrupted by user", flush=True)
                 return None
@@ -160,38 +287,18 @@ def upload_image_to_aliprice(context, page, image_url, is_first_url=False):
         page = results_page
         print(f"\n📍 Using captured search results page: {page.url[:80]}...")
         
-        # Scroll to load products
+        # Scroll until the lazy-loaded product list stops growing
         print("📜 Scrolling to load products...")
-        for i in range(3):
-            try:
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(2)
-            except:
-                pass
-        
-        # Check for products
-        product_count = page.locator('li.image_li').count()
+        product_count = wait_for_products(page)
         print(f"📊 Detected {product_count} product containers")
         
         if product_count > 0:
             print("✅ Products found!")
             return page
         else:
-            print("⚠️ No products detected, waiting 10 seconds...")
-            time.sleep(10)
-            
-            for i in range(3):
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(3)
-            
-            product_count = page.locator('li.image_li').count()
-            if product_count > 0:
-                print(f"✅ Found {product_count} products after extended wait!")
-                return page
-            else:
-                print("❌ Still no products found")
-                page.screenshot(path='debug_no_products.png')
-                return None
+            print("❌ No products found")
+            save_debug_screenshot(page, 'debug_no_products.png')
+            return None
             
     except Exception as e:
         print(f"❌ Error submitting image URL: {e}")
@@ -204,13 +311,6 @@ def extract_products_from_results(page):
     print("🔍 Extracting products from results page...")
     
     try:
-        print("📜 Final scroll to bottom...")
-        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        time.sleep(3)
-        
-        page.screenshot(path='temp_screenshot.png')
-        print("📸 Screenshot saved to temp_screenshot.png")
-        
         products = page.evaluate("""
             () => {
                 const products = [];
@@ -266,7 +366,8 @@ def extract_products_from_results(page):
                 print(f"      Image: {prod['image_url'][:60]}...")
                 print(f"      Price: {prod['price']}")
         else:
-            print("⚠️ No products extracted - check temp_screenshot.png")
+            print("⚠️ No products extracted")
+            save_debug_screenshot(page, 'debug_no_products.png')
         
         return products
         
@@ -276,8 +377,8 @@ def extract_products_from_results(page):
         traceback.print_exc()
         return []
 
-def compare_image_with_gemini_score(model, reference_image, product_image, product_num=None):
-    """Compare product image with reference image using structured attribute scoring"""
+async def compare_image_with_gemini_score(model, reference_image, product_image, product_num=None):
+    """Compare product image with reference image using structured attribute scoring (awaited on the Gemini engine)"""
     max_retries = 2
     retry_delay = 2
     
@@ -326,7 +427,10 @@ STRAP: [0-100]
 DIAL: [0-100]
 COLOR: [0-100]"""
 
-            response = model.generate_content([prompt, reference_image, product_image])
+            # Prompt + reference are registered once per search when GEMINI_REFERENCE_CACHE is on
+            async with reference_context(model, prompt, [reference_image], 'watch-reference') as context:
+                call_model, contents = context.request([product_image])
+                response = await call_model.generate_content_async(contents, prompt_type='price_score')
             
             if response and response.text:
                 answer = response.text.strip()
@@ -381,7 +485,7 @@ COLOR: [0-100]"""
             if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
                 if attempt < max_retries - 1:
                     print(f"  ⚠️ Rate limit hit, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
                 else:
@@ -391,15 +495,42 @@ COLOR: [0-100]"""
     
     return (None, 'max_retries_exceeded')
 
-def process_single_product(model, reference_image, product, product_num, total_products):
-    """Process a single product - download and compare"""
+async def process_single_product(model, reference_image, product, product_num, total_products,
+                                 scored_photos=None):
+    """Process a single product - download and compare
+    
+    scored_photos maps photo hash -> Future of its (score_data, error) for one search.
+    Sellers often list the exact same photo, so only the first product with a given photo
+    is sent to Gemini; the others wait for and copy its score.
+    """
     try:
-        product_image = download_product_image(product['image_url'])
+        product_image, photo_hash = await asyncio.to_thread(download_product_image, product['image_url'])
         if not product_image:
             print(f"  [{product_num}/{total_products}] ⚠️ Failed to download image")
             return (None, 'download_failed')
         
-        score_data, error = compare_image_with_gemini_score(model, reference_image, product_image, product_num)
+        shared = scored_photos.get(photo_hash) if scored_photos is not None else None
+        if shared is not None:
+            # Shielded so a timed-out copy can't cancel the product doing the scoring
+            score_data, error = await asyncio.shield(shared)
+            if not error:
+                print(f"  [{product_num}/{total_products}] 🧬 Same photo as an earlier seller - "
+                      f"Final: {score_data['final_score']:.1f}")
+                return (dict(score_data), None)
+        elif scored_photos is not None:
+            owned = asyncio.get_running_loop().create_future()
+            scored_photos[photo_hash] = owned
+            outcome = (None, 'cancelled')
+            try:
+                outcome = await compare_image_with_gemini_score(model, reference_image, product_image, product_num)
+            finally:
+                if outcome[1]:
+                    # Failed or cancelled: a retry of any product with this photo scores it again
+                    scored_photos.pop(photo_hash, None)
+                owned.set_result(outcome)
+            score_data, error = outcome
+        else:
+            score_data, error = await compare_image_with_gemini_score(model, reference_image, product_image, product_num)
         
         if error:
             if 'rate_limit' in str(error):
@@ -420,53 +551,65 @@ def process_single_product(model, reference_image, product, product_num, total_p
         print(f"  [{product_num}/{total_products}] ⚠️ Processing error: {e}")
         return (None, f'processing_error: {str(e)}')
 
-def process_products_parallel(model, reference_image, products):
-    """Process all products in parallel and return the one with highest score"""
-    print(f"\n🔎 Analyzing {len(products)} products with parallel processing...")
+def process_products_parallel(model, reference_image, products, max_workers=None, known_scores=None,
+                              cheapest_only=False):
+    """Score all products concurrently and return the one with highest score
+
+    max_workers is the number of products in flight at once (default GEMINI_MAX_IN_FLIGHT).
+    Products whose image URL is in known_scores reuse that score instead of being sent.
+
+    With cheapest_only, products are scored in waves from the cheapest up, stopping once a
+    ≥95 match is confirmed and every cheaper product has been scored (or failed). The
+    more expensive products are left unscored, so the results only cover what was scored.
+    """
+    known_scores = known_scores or {}
+    results = [(product, known_scores[product['image_url']]) for product in products
+               if product['image_url'] in known_scores]
+    to_score = [product for product in products if product['image_url'] not in known_scores]
+    error_count = 0
+    
+    print(f"\n🔎 Analyzing {len(to_score)} products with parallel processing...")
+    if results:
+        print(f"♻️  {len(results)} products already scored for this reference (cached)")
     print("=" * 50)
     
-    results = []
-    error_count = 0
+    # Photo hash -> Future of its score; all tasks run on the engine loop, so no lock is needed
+    scored_photos = {}
     
-    batch_size = 50
-    total_batches = (len(products) + batch_size - 1) // batch_size
+    async def task(product, product_num, total):
+        return await process_single_product(model, reference_image, product, product_num, total,
+                                            scored_photos=scored_photos)
     
-    with ThreadPoolExecutor(max_workers=25) as executor:
-        for batch_num in range(total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, len(products))
-            batch = products[start_idx:end_idx]
-            
-            print(f"\n📦 Processing batch {batch_num + 1}/{total_batches} ({len(batch)} products)")
-            print(f"   Products {start_idx + 1}-{end_idx} of {len(products)}")
-            
-            futures = []
-            for i, product in enumerate(batch):
-                product_num = start_idx + i + 1
-                future = executor.submit(
-                    process_single_product,
-                    model, reference_image, product, product_num, len(products)
-                )
-                futures.append((future, product))
-            
-            batch_processed = 0
-            for future, product in futures:
-                try:
-                    score_data, error = future.result(timeout=30)
-                    
-                    if error:
-                        error_count += 1
-                    elif score_data is not None:
-                        results.append((product, score_data))
-                        batch_processed += 1
-                except Exception as e:
-                    print(f"  ⚠️ Thread error: {e}")
-                    error_count += 1
-            
-            print(f"   ✅ Batch complete: {batch_processed} products scored")
+    def on_result(product, outcome):
+        nonlocal error_count
+        score_data, error = outcome if outcome else (None, 'timeout')
+        if error or score_data is None:
+            error_count += 1
+            return 'errors'
+        results.append((product, score_data))
+        return 'products scored'
+    
+    # Timed-out calls are retried and quota errors pause the run instead of dropping products
+    if to_score and cheapest_only:
+        remaining = sorted(to_score, key=lambda product: parse_price(product['price']))
+        wave_size = max(1, int(read_float_setting('PRICE_SCORE_WAVE_SIZE', DEFAULT_WAVE_SIZE)))
+        while remaining and not get_usage_tracker().budget_exceeded():
+            wave, remaining = remaining[:wave_size], remaining[wave_size:]
+            run_batched(wave, task, on_result, batch_size=max_workers, label='products')
             
-            if batch_num < total_batches - 1:
-                time.sleep(0.5)
+            cheapest = find_cheapest_high_quality(results)
+            if cheapest and remaining and parse_price(remaining[0]['price']) >= parse_price(cheapest[0]['price']):
+                print(f"⏹️  Cheapest ≥{HIGH_QUALITY_SCORE:g} match confirmed at {cheapest[0]['price']} - "
+                      f"{len(remaining)} pricier products not scored")
+                break
+    elif to_score:
+        run_batched(to_score, task, on_result, batch_size=max_workers, label='products')
+    
+    if to_score:
+        newly_scored = len(results) - (len(products) - len(to_score))
+        if 0 < len(scored_photos) < newly_scored:
+            print(f"🧬 {newly_scored} products share {len(scored_photos)} distinct photos - "
+                  f"{newly_scored - len(scored_photos)} scoring calls saved")
     
     # Sort results by final_score (highest first) for display
     results_sorted = sorted(results, key=lambda x: x[1]['final_score'], reverse=True)
@@ -499,27 +642,23 @@ def process_products_parallel(model, reference_image, products):
 def save_to_csv(reference_image_url, product_url, product_image_url, price, score_data):
     """Save result to Watched_prices.csv in accumulative mode"""
     csv_file = 'Watched_prices.csv'
-    file_exists = os.path.isfile(csv_file)
     
     try:
-        with open(csv_file, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            if not file_exists:
-                writer.writerow(['reference_image_url', '1688_url', '1688_product_image_url', 'price', 
-                               'final_score', 'shape_score', 'strap_score', 'dial_score', 'color_score'])
-            
-            writer.writerow([
-                reference_image_url, 
-                product_url, 
-                product_image_url, 
-                price, 
-                score_data['final_score'],
-                score_data['shape'],
-                score_data['strap'],
-                score_data['dial'],
-                score_data['color']
-            ])
+        # Locked append: safe with parallel searches and other watch_prices.py processes
+        append_csv_rows(csv_file,
+                        ['reference_image_url', '1688_url', '1688_product_image_url', 'price', 
+                         'final_score', 'shape_score', 'strap_score', 'dial_score', 'color_score'],
+                        [[
+                            reference_image_url, 
+                            product_url, 
+                            product_image_url, 
+                            price, 
+                            score_data['final_score'],
+                            score_data['shape'],
+                            score_data['strap'],
+                            score_data['dial'],
+                            score_data['color']
+                        ]])
         
         print(f"💾 Saved to {csv_file}")
         return True
@@ -527,54 +666,48 @@ def save_to_csv(reference_image_url, product_url, product_image_url, price, scor
         print(f"❌ Error saving to CSV: {e}")
         return False
 
-def save_cheapest_high_quality_match(reference_image_url, all_products_with_scores):
-    """Save the cheapest product with ≥95% score to Watches.csv"""
-    csv_file = 'Watches.csv'
-    file_exists = os.path.isfile(csv_file)
-    
-    # Filter products with final_score >= 95
+def parse_price(price_str):
+    """Extract numeric value from price string (e.g., '¥27.03' -> 27.03)"""
+    try:
+        # Remove currency symbols and other non-numeric chars except . and digits
+        numbers = re.findall(r'\d+\.?\d*', price_str)
+        if numbers:
+            return float(numbers[0])
+        return float('inf')  # If can't parse, treat as expensive
+    except:
+        return float('inf')
+
+def find_cheapest_high_quality(all_products_with_scores):
+    """Cheapest (product, score_data) with final_score ≥ HIGH_QUALITY_SCORE, or None"""
     high_quality_products = [
         (product, score_data) for product, score_data in all_products_with_scores
-        if score_data['final_score'] >= 95.0
+        if score_data['final_score'] >= HIGH_QUALITY_SCORE
     ]
-    
     if not high_quality_products:
+        return None
+    return min(high_quality_products, key=lambda x: parse_price(x[0]['price']))
+
+def save_cheapest_high_quality_match(reference_image_url, all_products_with_scores):
+    """Save the cheapest product with ≥95% score to Watches.csv"""
+    csv_file = 'Watches.csv'
+    
+    cheapest = find_cheapest_high_quality(all_products_with_scores)
+    if not cheapest:
         print(f"⚠️ No products with ≥95% score found for Watches.csv")
         return False
     
-    # Parse prices and find the cheapest
-    def parse_price(price_str):
-        """Extract numeric value from price string (e.g., '¥27.03' -> 27.03)"""
-        try:
-            # Remove currency symbols and other non-numeric chars except . and digits
-            import re
-            numbers = re.findall(r'\d+\.?\d*', price_str)
-            if numbers:
-                return float(numbers[0])
-            return float('inf')  # If can't parse, treat as expensive
-        except:
-            return float('inf')
-    
-    # Find cheapest among high quality products
-    cheapest_product, cheapest_score_data = min(
-        high_quality_products,
-        key=lambda x: parse_price(x[0]['price'])
-    )
+    cheapest_product, cheapest_score_data = cheapest
     
     try:
-        with open(csv_file, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            if not file_exists:
-                writer.writerow(['reference_image_url', 'final_score', 'price', '1688_url', '1688_thumbnail'])
-            
-            writer.writerow([
-                reference_image_url,
-                cheapest_score_data['final_score'],
-                cheapest_product['price'],
-                cheapest_product['product_url'],
-                cheapest_product['image_url']
-            ])
+        append_csv_rows(csv_file,
+                        ['reference_image_url', 'final_score', 'price', '1688_url', '1688_thumbnail'],
+                        [[
+                            reference_image_url,
+                            cheapest_score_data['final_score'],
+                            cheapest_product['price'],
+                            cheapest_product['product_url'],
+                            cheapest_product['image_url']
+                        ]])
         
         print(f"💎 Saved to {csv_file} (cheapest ≥95% match: {cheapest_product['price']})")
         return True
@@ -586,20 +719,12 @@ def save_all_products_to_csv(reference_image_url, all_products_with_scores):
     """Save all products with their scores to a detailed CSV file"""
     # Create the Watches Detailed prices folder if it doesn't exist
     detail_folder = 'Watches Detailed prices'
-    if not os.path.exists(detail_folder):
-        os.makedirs(detail_folder)
-    
-    # Auto-increment filename if exists
-    base_filename = 'Watched_prices_detailed'
-    csv_file = os.path.join(detail_folder, f'{base_filename}.csv')
-    counter = 1
-    
-    while os.path.exists(csv_file):
-        csv_file = os.path.join(detail_folder, f'{base_filename}{counter}.csv')
-        counter += 1
+    os.makedirs(detail_folder, exist_ok=True)
     
     try:
-        with open(csv_file, mode='w', newline='', encoding='utf-8') as f:
+        # Auto-increment filename if exists (claimed atomically, so parallel searches never share one)
+        csv_file, f = create_numbered_csv(detail_folder, 'Watched_prices_detailed')
+        with f:
             writer = csv.writer(f)
             
             # Always write header for new file
@@ -684,89 +809,23 @@ def download_image_from_url(url, temp_filename):
         print(f"❌ Error downloading image from URL: {e}")
         return False
 
-def get_imgbb_api_key():
-    """Get ImgBB API key from environment or user input"""
-    api_key = os.getenv('IMGBB_API_KEY')
+def prepare_upload_file(image_path, temp_dir, idx):
+    """Path to hand to AliPrice's file input, re-encoded as a smaller JPEG if it is over
+    AliPrice's upload size limit"""
+    if os.path.getsize(image_path) <= ALIPRICE_MAX_UPLOAD_BYTES:
+        return image_path
     
-    if not api_key:
-        print("\n🔑 ImgBB API Key Setup (FREE - takes 30 seconds!)")
-        print("=" * 60)
-        print("1. Go to: https://api.imgbb.com/")
-        print("2. Click 'Get API Key' (no credit card needed)")
-        print("3. Sign up with email (free forever)")
-        print("4. Copy your API key")
-        print("=" * 60)
-        api_key = input("Paste your ImgBB API key here: ").strip()
-        
-        if not api_key:
-            print("❌ No API key provided!")
-            print("💡 Tip: Set IMGBB_API_KEY environment variable to skip this step")
-            return None
-        
-        # Offer to save it
-        save = input("\n💾 Save this key to .env file? (y/n): ").strip().lower()
-        if save == 'y':
-            try:
-                with open('.env', 'a') as f:
-                    f.write(f"\nIMGBB_API_KEY={api_key}\n")
-                print("✅ Key saved to .env file!")
-            except Exception as e:
-                print(f"⚠️ Could not save to .env: {e}")
-    
-    return api_key
-
-def upload_local_image_to_imgbb(image_path, api_key):
-    """Upload local image to ImgBB and return the URL with proper extension"""
+    upload_path = os.path.join(temp_dir, f'upload_image_{idx}.jpg')
     try:
-        # ImgBB free upload - using multipart form
-        url = 'https://api.imgbb.com/1/upload'
-        
-        # Get file extension
-        file_ext = os.path.splitext(image_path)[1].lower()
-        if not file_ext or file_ext not in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']:
-            file_ext = '.jpg'  # Default to .jpg
-        
-        # Read the image file
-        with open(image_path, 'rb') as f:
-            files = {
-                'image': (os.path.basename(image_path), f, 'image/' + file_ext[1:])
-            }
-            
-            params = {
-                'key': api_key
-            }
-            
-            print(f"📤 Uploading local image to ImgBB...")
-            response = requests.post(url, params=params, files=files, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('success'):
-                # Get the direct URL to the image - ImgBB gives us the URL with extension
-                image_url = result['data']['url']
-                
-                print(f"✅ Image uploaded successfully!")
-                print(f"   URL: {image_url[:80]}...")
-                return image_url
-            else:
-                error_msg = result.get('error', {}).get('message', 'Unknown error')
-                print(f"❌ ImgBB upload failed: {error_msg}")
-                return None
-        else:
-            print(f"❌ ImgBB API error: {response.status_code}")
-            if response.text:
-                try:
-                    error_data = response.json()
-                    print(f"   Error: {error_data.get('error', {}).get('message', response.text[:200])}")
-                except:
-                    print(f"   Response: {response.text[:200]}")
-            return None
-            
+        image = Image.open(image_path).convert('RGB')
+        image.thumbnail((1600, 1600), Image.LANCZOS)
+        image.save(upload_path, format='JPEG', quality=85)
+        print(f"🗜️  Reference is {os.path.getsize(image_path) // 1024}KB - uploading a "
+              f"{os.path.getsize(upload_path) // 1024}KB copy")
+        return upload_path
     except Exception as e:
-        print(f"❌ Error uploading to ImgBB: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        print(f"⚠️ Could not shrink reference image ({e}) - uploading the original")
+        return image_path
 
 def is_url(path):
     """Check if the input is a URL or local file path"""
@@ -790,87 +849,309 @@ def normalize_file_path(path):
     
     return path
 
-def main():
-    """Main function"""
-    print("🔍 Watch Prices - 1688 Product Finder")
-    print("=" * 50)
+def load_image_inputs_from_csv(csv_path):
+    """Read reference image URLs from the first column of a CSV (None on error)"""
+    image_inputs = []
+    try:
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            csv_reader = csv.reader(f)
+            for row in csv_reader:
+                if row and row[0].strip():  # Get first column, skip empty rows
+                    url = row[0].strip()
+                    if url.startswith('http'):  # Basic validation
+                        image_inputs.append(url)
+        
+        print(f"✅ Loaded {len(image_inputs)} URLs from CSV")
+        return image_inputs
+    except Exception as e:
+        print(f"❌ Error reading CSV: {e}")
+        return None
+
+def search_aliprice(context, idx, total, image_url, temp_dir, is_first_url=False):
+    """Load the reference image and scrape its AliPrice results (runs on a search lane)
+
+    image_url is a URL (downloaded, then pasted into AliPrice) or a local file path (read
+    from disk and uploaded through AliPrice's file input). Fresh cached results for the
+    same image content are reused without opening a tab.
+
+    Returns:
+        dict: reference_image, products, temp_filename (None for local files), cache_key
+              and from_cache, or None if the search failed
+    """
+    print(f"\n{'=' * 50}")
+    print(f"📸 Processing input {idx}/{total}")
+    print(f"   {'URL' if is_url(image_url) else 'File'}: {image_url[:80]}{'...' if len(image_url) > 80 else ''}")
+    print(f"{'=' * 50}")
     
-    model = setup_gemini_api()
-    if not model:
-        return False
+    if is_url(image_url):
+        temp_filename = os.path.join(temp_dir, f'temp_image_{idx}.jpg')
+        image_path = temp_filename
+        print(f"⬇️  Downloading reference image...")
+        
+        if not download_image_from_url(image_url, temp_filename):
+            print(f"⚠️ Skipping this input - could not download reference image")
+            return None
+    else:
+        temp_filename = None
+        image_path = image_url
     
-    print("\n🔗 Choose input method:")
-    print("   1. Enter URLs manually (paste or type)")
-    print("   2. Load URLs from CSV file")
-    print()
-    choice = input("Enter choice (1 or 2): ").strip()
+    reference_image = load_reference_image(image_path)
+    if not reference_image:
+        print(f"⚠️ Skipping this input - could not load reference image")
+        if temp_filename and os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        return None
     
-    if choice == '2':
-        # CSV file mode
-        csv_path = input("Enter CSV file path: ").strip()
-        csv_path = normalize_file_path(csv_path)
+    search = {'reference_image': reference_image, 'temp_filename': temp_filename,
+              'cache_key': None, 'from_cache': False}
+    
+    cache = get_price_cache()
+    if cache:
+        search['cache_key'] = content_hash(image_path)
+        cached_products = cache.fresh_products(search['cache_key'])
+        if cached_products:
+            print(f"♻️  Reusing cached AliPrice results ({len(cached_products)} products) - skipping search")
+            return dict(search, products=cached_products, from_cache=True)
+    
+    # Create a new page (tab) for this search
+    page = context.new_page()
+    result_page = None
+    products = []
+    
+    try:
+        if is_url(image_url):
+            result_page = upload_image_to_aliprice(context, page, image_url, is_first_url=is_first_url)
+        else:
+            upload_path = prepare_upload_file(image_path, temp_dir, idx)
+            result_page = upload_image_to_aliprice(context, page, upload_path, is_first_url=is_first_url,
+                                                   local_file=True)
         
-        if not os.path.exists(csv_path):
-            print(f"❌ CSV file not found: {csv_path}")
-            return False
+        if not result_page:
+            print(f"⚠️ Failed to submit image URL - skipping")
+        else:
+            products = extract_products_from_results(result_page)
+            if not products:
+                print(f"⚠️ No products found in results - skipping")
+    except Exception as e:
+        print(f"❌ Error processing URL: {e}")
+        import traceback
+        traceback.print_exc()
+        products = []
+    finally:
+        # Close this search's tabs now that the data is extracted; the browser stays open
+        for tab in (result_page, page):
+            try:
+                if tab:
+                    tab.close()
+            except:
+                pass
+    
+    if not products:
+        if temp_filename and os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        return None
+    
+    if cache:
+        cache.store_search(search['cache_key'], image_url, products)
+    
+    return dict(search, products=products)
+
+def score_and_save(model, idx, image_url, search, max_workers=None, cheapest_only=False):
+    """Score one search's products and save the results to the CSVs (runs on the scoring pool)"""
+    products = search['products']
+    cache = get_price_cache() if search['cache_key'] else None
+    try:
+        print(f"\n🧮 Scoring input {idx} ({len(products)} products)")
+        known_scores = cache.scores(search['cache_key']) if cache else {}
+        best_product, best_score, error_count, all_results = process_products_parallel(
+            model, search['reference_image'], products, max_workers=max_workers, known_scores=known_scores,
+            cheapest_only=cheapest_only
+        )
         
-        # Read URLs from CSV
-        image_inputs = []
-        try:
-            with open(csv_path, 'r', encoding='utf-8') as f:
-                csv_reader = csv.reader(f)
-                for row in csv_reader:
-                    if row and row[0].strip():  # Get first column, skip empty rows
-                        url = row[0].strip()
-                        if url.startswith('http'):  # Basic validation
-                            image_inputs.append(url)
-            
-            print(f"✅ Loaded {len(image_inputs)} URLs from CSV")
-        except Exception as e:
-            print(f"❌ Error reading CSV: {e}")
-            return False
+        if cache:
+            new_scores = {product['image_url']: score_data for product, score_data in all_results
+                          if product['image_url'] not in known_scores}
+            cache.store_scores(search['cache_key'], new_scores)
+            cache.count_reused_scores(len(all_results) - len(new_scores))
         
-        if not image_inputs:
-            print("❌ No valid URLs found in CSV!")
-            return False
-    else:
-        # Manual input mode (existing logic)
-        print("   - For single input: paste one URL or file path")
-        print("   - For multiple inputs: paste multiple lines (one URL per line)")
-        print()
-        sys.stdout.flush()
-        user_input = input("Image URL(s) or path(s): ").strip()
+        # Save all products with scores to detailed CSV
+        detailed_csv = None
+        if all_results:
+            detailed_csv = save_all_products_to_csv(image_url, all_results)
+            # Also save the cheapest high-quality match to Watches.csv
+            save_cheapest_high_quality_match(image_url, all_results)
         
-        # Capture any additional lines pasted after the first line
-        additional_lines = []
-        try:
-            import select
-            while select.select([sys.stdin], [], [], 0.5)[0]:
-                line = sys.stdin.readline().strip()
-                if line:
-                    additional_lines.append(line)
-        except:
-            pass
+        # Save the best product to main CSV
+        if best_product and best_score is not None:
+            save_to_csv(
+                image_url,
+                best_product['product_url'],
+                best_product['image_url'],
+                best_product['price'],
+                best_score
+            )
+            print(f"✅ Successfully processed input {idx}")
+            if detailed_csv:
+                print(f"   Detailed results: {detailed_csv}")
+        else:
+            print(f"❌ Could not find a match for input {idx}")
         
-        # Combine first line with additional lines if any were pasted
-        if additional_lines:
-            user_input = user_input + '\n' + '\n'.join(additional_lines)
+        if error_count > 0:
+            print(f"⚠️ {error_count} products had errors during processing")
+    except Exception as e:
+        print(f"❌ Error scoring input {idx}: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        # This reference is done - drop its uploaded files/context cache
+        release_references([search['reference_image']])
+        if search['temp_filename'] and os.path.exists(search['temp_filename']):
+            os.remove(search['temp_filename'])
+
+class PriceSearchPipeline:
+    """Runs AliPrice searches on several browser lanes while finished searches are scored
+    
+    Each lane is a thread with its own Playwright instance (the sync API only works on the
+    thread that started it) and opens its own tabs. A lane hands the scraped products to the
+    scoring pool and starts its next search straight away, so Gemini scoring of search i
+    overlaps scraping of search i+1. Lane 1 runs the first search alone so the AliPrice
+    login happens once; the other lanes start from its cookies.
+    """
+    
+    def __init__(self, model, image_inputs, temp_dir, search_tabs=1, interactive=True, max_workers=None,
+                 cheapest_only=False):
+        self.model = model
+        self.temp_dir = temp_dir
+        self.interactive = interactive
+        self.max_workers = max_workers
+        self.cheapest_only = cheapest_only
+        self.total = len(image_inputs)
+        self.jobs = deque(enumerate(image_inputs, 1))
+        self.lanes = max(1, min(search_tabs, sum(1 for image_input in image_inputs if image_input)))
+        self.lock = threading.Lock()
+        self.cookies = None
+        self.first_search_done = threading.Event()
+        self.finished_lanes = set()
+        self.all_lanes_finished = threading.Event()
+        self.score_pool = ThreadPoolExecutor(max_workers=self.lanes, thread_name_prefix='price-score')
+    
+    def next_job(self):
+        """Next (idx, image URL or path) to search, or None when all are taken or the budget is reached"""
+        with self.lock:
+            if self.jobs and get_usage_tracker().budget_exceeded():
+                print(f"⏭️ Skipping remaining {len(self.jobs)} searches (Gemini budget reached)")
+                self.jobs.clear()
+            return self.jobs.popleft() if self.jobs else None
+    
+    def open_context(self, p, lane):
+        """Open this lane's browser context"""
+        cookies = self.cookies if lane > 1 and self.cookies else load_chrome_cookies('new_chrome_cookies.json')
         
-        if not user_input:
-            print("❌ No URLs provided!")
-            return False
+        # A profile directory can only be opened by one browser - extra lanes start fresh
+        mode = 'fresh' if lane > 1 and get_session_mode()[0] == 'persistent' else None
         
-        # Support both ||| separator and newline-separated URLs
-        if '|||' in user_input:
-            image_inputs = [inp.strip() for inp in user_input.split('|||') if inp.strip()]
-        elif '\n' in user_input:
-            image_inputs = [inp.strip() for inp in user_input.split('\n') if inp.strip()]
-        else:
-            image_inputs = [user_input]
+        return open_browser_context(
+            p,
+            context_options={
+                'viewport': {'width': 1920, 'height': 1080},
+                'user_agent': DEFAULT_USER_AGENT,
+            },
+            cookies=cookies,
+            launch_args=[
+                '--disable-blink-features=AutomationControlled',
+                '--disable-dev-shm-usage',
+            ],
+            mode=mode,
+            login_site='aliprice'
+        )
+    
+    def finish_lane(self, lane):
+        with self.lock:
+            self.finished_lanes.add(lane)
+            if len(self.finished_lanes) == self.lanes:
+                self.all_lanes_finished.set()
+        if lane == 1:
+            self.first_search_done.set()
+    
+    def run_lane(self, lane):
+        """Search until the job queue is empty (runs on the lane's own thread)"""
+        if lane > 1:
+            self.first_search_done.wait()
         
-        if not image_inputs:
-            print("❌ No valid inputs found!")
-            return False
+        try:
+            with sync_playwright() as p:
+                context, close_browser, session_warm = self.open_context(p, lane)
+                try:
+                    first_search = lane == 1
+                    while True:
+                        job = self.next_job()
+                        if job is None:
+                            break
+                        idx, image_url = job
+                        
+                        if image_url is None:
+                            print(f"\n⏭️  Skipping input {idx} (failed to prepare)")
+                            continue
+                        
+                        # Warm sessions are already logged in to AliPrice; unattended runs can't pause
+                        is_first_url = first_search and not session_warm and self.interactive
+                        search = search_aliprice(context, idx, self.total, image_url, self.temp_dir,
+                                                 is_first_url=is_first_url)
+                        
+                        # Cached results never opened a tab, so the login check is still to come
+                        if first_search and not (search and search['from_cache']):
+                            first_search = False
+                            self.cookies = context.cookies()
+                            self.first_search_done.set()
+                        
+                        if search:
+                            self.score_pool.submit(score_and_save, self.model, idx, image_url, search,
+                                                   self.max_workers, self.cheapest_only)
+                finally:
+                    # Lanes attached over CDP share one browser: disconnect only once all are done
+                    self.finish_lane(lane)
+                    self.all_lanes_finished.wait()
+                    close_browser()
+        except Exception as e:
+            print(f"❌ Search lane {lane} failed: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            self.finish_lane(lane)
+    
+    def run(self):
+        """Run every lane, then wait for the remaining scoring to finish"""
+        if self.lanes > 1:
+            print(f"\n🗂️  Running {self.lanes} AliPrice searches at a time (scoring overlaps scraping)")
+        
+        threads = [threading.Thread(target=self.run_lane, args=(lane,), name=f'aliprice-lane-{lane}', daemon=True)
+                   for lane in range(1, self.lanes + 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.score_pool.shutdown(wait=True)
+
+def run_price_search(model, image_inputs, interactive=True, max_workers=None, search_tabs=None,
+                     cheapest_only=None):
+    """Search AliPrice/1688 for every image input and save results to the CSVs
+    
+    Args:
+        model: Gemini model instance
+        image_inputs: list of image URLs and/or local file paths
+        interactive: Pause for AliPrice login (False for unattended runs)
+        max_workers: Concurrent Gemini scoring requests per search
+        search_tabs: AliPrice searches run at once (default ALIPRICE_SEARCH_TABS)
+        cheapest_only: Score cheapest-first and stop at the cheapest ≥95 match instead of
+                       scoring every product (default PRICE_SEARCH_MODE=cheapest)
+    """
+    if search_tabs is None:
+        search_tabs = int(read_float_setting('ALIPRICE_SEARCH_TABS', DEFAULT_SEARCH_TABS))
+    if cheapest_only is None:
+        cheapest_only = (read_env_setting('PRICE_SEARCH_MODE') or 'full').lower() == 'cheapest'
+    if cheapest_only:
+        print(f"⏩ Cheapest-first scoring: stopping at the cheapest ≥{HIGH_QUALITY_SCORE:g} match per search")
     
     print(f"\n✅ Found {len(image_inputs)} input(s) to process")
     if len(image_inputs) <= 5:
@@ -887,9 +1168,8 @@ def main():
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir)
     
-    # Convert all inputs to URLs (upload local files if needed)
-    image_urls = []
-    imgbb_api_key = None  # Will be requested only if needed
+    # URLs are pasted into AliPrice; local files are uploaded through its file input
+    prepared_inputs = []
     
     for idx, image_input in enumerate(image_inputs, 1):
         print(f"\n{'=' * 50}")
@@ -899,23 +1179,10 @@ def main():
         if is_url(image_input):
             # It's already a URL
             print(f"✅ Using URL directly: {image_input[:60]}...")
-            image_urls.append(image_input)
+            prepared_inputs.append(image_input)
         else:
-            # It's a local file path - need to upload it
             print(f"📁 Local file detected: {image_input}")
             
-            # Get ImgBB API key if we haven't already
-            if imgbb_api_key is None:
-                imgbb_api_key = get_imgbb_api_key()
-                if not imgbb_api_key:
-                    print(f"⚠️ Cannot upload without ImgBB API key")
-                    print(f"⚠️ Skipping all remaining local files")
-                    # Skip all remaining local files
-                    for remaining_idx in range(idx, len(image_inputs) + 1):
-                        if not is_url(image_inputs[remaining_idx - 1] if remaining_idx <= len(image_inputs) else ""):
-                            image_urls.append(None)
-                    break
-            
             # Normalize the path (handle escaped spaces, quotes, etc.)
             normalized_path = normalize_file_path(image_input)
             print(f"📝 Normalized path: {normalized_path}")
@@ -924,7 +1191,7 @@ def main():
             if not os.path.exists(normalized_path):
                 print(f"❌ File not found: {normalized_path}")
                 print(f"⚠️ Skipping this input")
-                image_urls.append(None)
+                prepared_inputs.append(None)
                 continue
             
             # Check if it's a valid image
@@ -935,138 +1202,19 @@ def main():
             except Exception as e:
                 print(f"❌ Invalid image file: {e}")
                 print(f"⚠️ Skipping this input")
-                image_urls.append(None)
+                prepared_inputs.append(None)
                 continue
             
-            # Upload to ImgBB to get a URL
-            uploaded_url = upload_local_image_to_imgbb(normalized_path, imgbb_api_key)
-            if uploaded_url:
-                image_urls.append(uploaded_url)
-            else:
-                print(f"⚠️ Skipping this input - could not upload image")
-                image_urls.append(None)
-    
-    # Launch browser once and reuse it for all URLs
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=False,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-            ]
-        )
-        
-        cookies = load_chrome_cookies('new_chrome_cookies.json')
-        
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-        )
-        
-        if cookies:
-            context.add_cookies(cookies)
-            print(f"🍪 Cookies loaded into browser context")
-        
-        # Now process all URLs using the same browser
-        for idx, image_url in enumerate(image_urls, 1):
-            if image_url is None:
-                print(f"\n⏭️  Skipping input {idx} (failed to prepare)")
-                continue
-                
-            is_first_url = (idx == 1)
-            print(f"\n{'=' * 50}")
-            print(f"📸 Processing input {idx}/{len(image_urls)}")
-            print(f"   URL: {image_url[:80]}{'...' if len(image_url) > 80 else ''}")
-            print(f"{'=' * 50}")
-            
-            temp_filename = os.path.join(temp_dir, f'temp_image_{idx}.jpg')
-            print(f"⬇️  Downloading reference image...")
-            
-            if not download_image_from_url(image_url, temp_filename):
-                print(f"⚠️ Skipping this input - could not download reference image")
-                continue
-            
-            reference_image = load_reference_image(temp_filename)
-            if not reference_image:
-                print(f"⚠️ Skipping this URL - could not load reference image")
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
-                continue
-            
-            # Create a new page (tab) for this search
-            page = context.new_page()
-            
-            try:
-                result_page = upload_image_to_aliprice(context, page, image_url, is_first_url=is_first_url)
-                
-                if not result_page:
-                    print(f"⚠️ Failed to submit image URL - skipping")
-                    page.close()  # Close only the current tab
-                    if os.path.exists(temp_filename):
-                        os.remove(temp_filename)
-                    continue
-                
-                page = result_page
-                
-                products = extract_products_from_results(page)
-                
-                if not products:
-                    print(f"⚠️ No products found in results - skipping")
-                    page.close()  # Close only the current tab
-                    if os.path.exists(temp_filename):
-                        os.remove(temp_filename)
-                    continue
-                
-                # Keep browser open, just close the search results tab after processing
-                best_product, best_score, error_count, all_results = process_products_parallel(
-                    model, reference_image, products
-                )
-                
-                # Close the search results tab now that we've extracted the data
-                page.close()
-                
-                # Save all products with scores to detailed CSV
-                detailed_csv = None
-                if all_results:
-                    detailed_csv = save_all_products_to_csv(image_url, all_results)
-                    # Also save the cheapest high-quality match to Watches.csv
-                    save_cheapest_high_quality_match(image_url, all_results)
-                
-                # Save the best product to main CSV
-                if best_product and best_score is not None:
-                    save_to_csv(
-                        image_url,
-                        best_product['product_url'],
-                        best_product['image_url'],
-                        best_product['price'],
-                        best_score
-                    )
-                    print(f"✅ Successfully processed URL")
-                    if detailed_csv:
-                        print(f"   Detailed results: {detailed_csv}")
-                else:
-                    print(f"❌ Could not find a match for this URL")
-                
-                if error_count > 0:
-                    print(f"⚠️ {error_count} products had errors during processing")
-                
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
-                
-            except Exception as e:
-                print(f"❌ Error processing URL: {e}")
-                import traceback
-                traceback.print_exc()
-                try:
-                    page.close()  # Close only the current tab
-                except:
-                    pass
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
-                continue
-        
-        # Browser will close automatically when exiting the 'with' block
-        print(f"\n🌐 Browser will remain open. Close it manually when done.")
+            prepared_inputs.append(normalized_path)
+    
+    # Search on one or more browser lanes; scoring runs while the next search is scraped
+    pipeline = PriceSearchPipeline(model, prepared_inputs, temp_dir, search_tabs=search_tabs,
+                                   interactive=interactive, max_workers=max_workers,
+                                   cheapest_only=cheapest_only)
+    pipeline.run()
+    
+    if get_price_cache():
+        print(f"\n{get_price_cache().summary()}")
     
     try:
         if os.path.exists(temp_dir):
@@ -1085,6 +1233,80 @@ def main():
     print(f"{'=' * 50}")
     return True
 
+def main():
+    """Main function"""
+    apply_budget_arg()
+    print("🔍 Watch Prices - 1688 Product Finder")
+    print("=" * 50)
+    
+    model = setup_gemini_api()
+    if not model:
+        return False
+    
+    print("\n🔗 Choose input method:")
+    print("   1. Enter URLs manually (paste or type)")
+    print("   2. Load URLs from CSV file")
+    print()
+    choice = input("Enter choice (1 or 2): ").strip()
+    
+    if choice == '2':
+        # CSV file mode
+        csv_path = input("Enter CSV file path: ").strip()
+        csv_path = normalize_file_path(csv_path)
+        
+        if not os.path.exists(csv_path):
+            print(f"❌ CSV file not found: {csv_path}")
+            return False
+        
+        # Read URLs from CSV
+        image_inputs = load_image_inputs_from_csv(csv_path)
+        if image_inputs is None:
+            return False
+        
+        if not image_inputs:
+            print("❌ No valid URLs found in CSV!")
+            return False
+    else:
+        # Manual input mode (existing logic)
+        print("   - For single input: paste one URL or file path")
+        print("   - For multiple inputs: paste multiple lines (one URL per line)")
+        print()
+        sys.stdout.flush()
+        user_input = input("Image URL(s) or path(s): ").strip()
+        
+        # Capture any additional lines pasted after the first line
+        additional_lines = []
+        try:
+            import select
+            while select.select([sys.stdin], [], [], 0.5)[0]:
+                line = sys.stdin.readline().strip()
+                if line:
+                    additional_lines.append(line)
+        except:
+            pass
+        
+        # Combine first line with additional lines if any were pasted
+        if additional_lines:
+            user_input = user_input + '\n' + '\n'.join(additional_lines)
+        
+        if not user_input:
+            print("❌ No URLs provided!")
+            return False
+        
+        # Support both ||| separator and newline-separated URLs
+        if '|||' in user_input:
+            image_inputs = [inp.strip() for inp in user_input.split('|||') if inp.strip()]
+        elif '\n' in user_input:
+            image_inputs = [inp.strip() for inp in user_input.split('\n') if inp.strip()]
+        else:
+            image_inputs = [user_input]
+        
+        if not image_inputs:
+            print("❌ No valid inputs found!")
+            return False
+    
+    return run_price_search(model, image_inputs)
+
 if __name__ == "__main__":
     try:
         main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Watchlist Scheduler
+Long-running daemon that re-scans a watchlist of Douyin seller pages on per-page intervals,
+runs the job_runner stages (match/tag/backup/...) on new videos only, and keeps the browser
+and Gemini load within a global budget
+
+Usage:
+  python3 watchlist_scheduler.py                   # uses watchlist.json, runs forever
+  python3 watchlist_scheduler.py my_watchlist.json
+  python3 watchlist_scheduler.py watchlist.json --once   # run due pages once and exit (cron)
+
+Watchlist file (see watchlist_example.json):
+{
+  "stages": ["match", "tag", "backup"],          default stages run after extraction
+  "reference_image": "Products/GAMEBOY.png",
+  "browser_concurrency": 1,                      pages scrolled at the same time
+  "gemini_concurrency": 50,                      Gemini calls in flight across all pages
+  "backup_concurrency": 20,
+  "default_interval_minutes": 360,
+  "retry_minutes": 30,                           retry delay after a failed run
+  "start_stagger_seconds": 120,                  spread first runs instead of bursting
+  "max_duration_minutes": 10,
+  "pages": [
+    {"url": "https://www.douyin.com/user/...", "interval_minutes": 120, "priority": 1},
+    {"url": "https://www.douyin.com/user/...", "priority": 5, "stages": ["tag"]}
+  ]
+}
+
+Priority 1 is highest; when more pages are due than the browser budget allows, higher
+priority (then longest overdue) pages go first. Seen video IDs and next run times are kept
+in watchlist_state.json so restarts pick up where they left off.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import job_runner
+from douyin_extraction import extract_video_id
+
+STATE_FILE = 'watchlist_state.json'
+POLL_SECONDS = 15
+
+# Spec keys copied from the watchlist (or a page entry) into each page's job spec
+SPEC_KEYS = ['reference_image', 'reference_folder', 'max_duration_minutes', 'captcha_wait_seconds', 'output']
+
+
+def load_watchlist(watchlist_path):
+    """Load and validate the watchlist file"""
+    with open(watchlist_path, 'r', encoding='utf-8') as f:
+        watchlist = json.load(f)
+
+    pages = watchlist.get('pages') or []
+    if not pages:
+        raise ValueError("Watchlist has no pages")
+
+    for entry in pages:
+        if not entry.get('url'):
+            raise ValueError(f"Watchlist page without 'url': {entry}")
+        stages = entry.get('stages', watchlist.get('stages', []))
+        unknown = [s for s in stages if s not in job_runner.KNOWN_STAGES or s == 'extract']
+        if unknown:
+            raise ValueError(f"Unsupported stage(s) for {entry['url']}: {', '.join(unknown)}")
+
+    return watchlist
+
+
+def load_state():
+    """Load per-page scheduler state (seen IDs, next run, last result)"""
+    if os.path.exists(STATE_FILE):
+        try:
+            with open(STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Error loading {STATE_FILE}: {e}")
+    return {}
+
+
+def save_state(state):
+    """Save scheduler state (written to a temp file first so a crash can't corrupt it)"""
+    temp_file = f'{STATE_FILE}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(temp_file, STATE_FILE)
+
+
+def build_page_spec(watchlist, entry):
+    """Build the job_runner spec for one watchlist page"""
+    spec = {
+        'name': page_report_name(entry['url']),
+        'pages': [entry['url']],
+        'stages': entry.get('stages', watchlist.get('stages', [])),
+        'stop_when_caught_up': True,
+        # Every page run adds to the shared Matches CSVs instead of rewriting them
+        'append_matches': True,
+        'max_duration_minutes': 10,
+        'concurrency': {
+            'gemini': watchlist.get('gemini_concurrency', 50),
+            'backup': watchlist.get('backup_concurrency', 20)
+        }
+    }
+    for key in SPEC_KEYS:
+        if key in entry:
+            spec[key] = entry[key]
+        elif key in watchlist:
+            spec[key] = watchlist[key]
+    return spec
+
+
+def page_report_name(url):
+    """Short run-report name for a page URL"""
+    return 'watch_' + url.rstrip('/').split('/')[-1].split('?')[0][:24]
+
+
+class WatchlistScheduler:
+    """Runs due watchlist pages within the browser and Gemini budgets
+
+    Extraction runs on a pool sized by browser_concurrency. Stages after extraction run
+    one page at a time with the full gemini_concurrency, so at most gemini_concurrency
+    Gemini calls are ever in flight while the next page is already being scrolled.
+    """
+
+    def __init__(self, watchlist, stagger_first_runs=True):
+        self.watchlist = watchlist
+        self.state = load_state()
+        self.lock = threading.Lock()
+        self.running = set()
+        self.extracting = 0
+        self.browser_concurrency = max(1, watchlist.get('browser_concurrency', 1))
+        self.extract_pool = ThreadPoolExecutor(max_workers=self.browser_concurrency)
+        # One Gemini job at a time: jobs share the process-wide usage tracker (see job_runner.run_job)
+        self.process_pool = ThreadPoolExecutor(max_workers=1)
+        self.report_folder = watchlist.get('output', {}).get('report_folder', 'Reports')
+
+        # Stagger first runs of pages we have never scanned
+        now = time.time()
+        stagger = watchlist.get('start_stagger_seconds', 120) if stagger_first_runs else 0
+        new_pages = [e for e in watchlist['pages'] if e['url'] not in self.state]
+        for i, entry in enumerate(sorted(new_pages, key=lambda e: e.get('priority', 5))):
+            self.state[entry['url']] = {'next_run': now + i * stagger, 'seen_ids': [], 'runs': 0}
+        save_state(self.state)
+
+    def due_pages(self):
+        """Return due, not-running pages ordered by priority then how overdue they are"""
+        now = time.time()
+        due = [
+            entry for entry in self.watchlist['pages']
+            if entry['url'] not in self.running and self.state[entry['url']]['next_run'] <= now
+        ]
+        due.sort(key=lambda e: (e.get('priority', 5), self.state[e['url']]['next_run']))
+        return due
+
+    def dispatch_due(self):
+        """Start as many due pages as the browser budget allows; returns number started"""
+        started = 0
+        with self.lock:
+            for entry in self.due_pages():
+                if self.extracting >= self.browser_concurrency:
+                    break
+                self.running.add(entry['url'])
+                self.extracting += 1
+                self.extract_pool.submit(self.extract_page, entry)
+                started += 1
+        return started
+
+    def extract_page(self, entry):
+        """Scroll one page for new videos, then queue its remaining stages"""
+        url = entry['url']
+        spec = build_page_spec(self.watchlist, entry)
+        with self.lock:
+            seen_ids = set(self.state[url].get('seen_ids', []))
+        job_state = {'pages': {}, 'tagged_json': [], 'seen_ids': {url: seen_ids}}
+
+        print(f"\n🕑 [{time.strftime('%H:%M:%S')}] Scanning {url[:60]}... ({len(seen_ids)} seen)")
+        try:
+            extract_report = job_runner.run_job(dict(spec, stages=['extract']), job_state)
+        except Exception as e:
+            extract_report = {'name': spec['name'], 'success': False,
+                              'stages': [{'stage': 'extract', 'status': 'failed', 'error': str(e)[:500]}]}
+        finally:
+            with self.lock:
+                self.extracting -= 1
+
+        if not extract_report['success']:
+            self.finish_page(entry, extract_report, new_ids=None)
+            return
+
+        new_videos = job_state['pages'].get(url, {}).get('videos', [])
+        new_ids = {extract_video_id(v['video_url']) for v in new_videos}
+        if not new_videos:
+            print(f"  ✅ No new videos on {url[:60]}")
+            self.finish_page(entry, extract_report, new_ids=new_ids)
+            return
+
+        print(f"  🆕 {len(new_videos)} new videos - queued for {', '.join(spec['stages']) or 'no stages'}")
+        self.process_pool.submit(self.process_page, entry, spec, job_state, extract_report, new_ids)
+
+    def process_page(self, entry, spec, job_state, extract_report, new_ids):
+        """Run the post-extraction stages for a page's new videos"""
+        report = extract_report
+        if spec['stages']:
+            try:
+                report = job_runner.run_job(spec, job_state)
+                report['stages'] = extract_report['stages'] + report['stages']
+            except Exception as e:
+                report = dict(extract_report, success=False, stages=extract_report['stages'] + [
+                    {'stage': ', '.join(spec['stages']), 'status': 'failed', 'error': str(e)[:500]}
+                ])
+
+        # Only mark videos as seen once every stage succeeded, so failures are retried
+        self.finish_page(entry, report, new_ids=new_ids if report['success'] else None)
+
+    def finish_page(self, entry, report, new_ids):
+        """Record a page run and schedule its next one"""
+        url = entry['url']
+        interval = entry.get('interval_minutes', self.watchlist.get('default_interval_minutes', 360))
+        retry = self.watchlist.get('retry_minutes', 30)
+
+        try:
+            report_file = job_runner.write_run_report(report, self.report_folder)
+        except Exception as e:
+            print(f"⚠️ Could not write run report: {e}")
+            report_file = None
+
+        with self.lock:
+            page_state = self.state[url]
+            if new_ids:
+                page_state['seen_ids'] = sorted(set(page_state.get('seen_ids', [])) | new_ids)
+            delay = interval if report['success'] else min(interval, retry)
+            page_state['last_run'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            page_state['last_status'] = 'success' if report['success'] else 'failed'
+            page_state['last_new_videos'] = len(new_ids or [])
+            page_state['last_report'] = report_file
+            page_state['next_run'] = time.time() + delay * 60
+            page_state['runs'] = page_state.get('runs', 0) + 1
+            self.running.discard(url)
+            save_state(self.state)
+
+        icon = '✅' if report['success'] else '❌'
+        print(f"{icon} {url[:60]} done - next run in {delay} min")
+
+    def idle(self):
+        """True when nothing is running"""
+        with self.lock:
+            return not self.running
+
+    def run(self, once=False):
+        """Main scheduler loop"""
+        try:
+            while True:
+                self.dispatch_due()
+                if once and self.idle() and not self.due_pages():
+                    break
+                time.sleep(POLL_SECONDS if not once else 1)
+        except KeyboardInterrupt:
+            print("\n👋 Stopping scheduler (waiting for running pages)...")
+        finally:
+            self.extract_pool.shutdown(wait=True)
+            self.process_pool.shutdown(wait=True)
+            with self.lock:
+                save_state(self.state)
+
+    def print_schedule(self):
+        """Print the upcoming schedule"""
+        now = time.time()
+        print(f"\n📅 Schedule ({len(self.watchlist['pages'])} pages):")
+        for entry in sorted(self.watchlist['pages'], key=lambda e: self.state[e['url']]['next_run']):
+            page_state = self.state[entry['url']]
+            minutes = max(0, int((page_state['next_run'] - now) / 60))
+            print(f"   P{entry.get('priority', 5)}  in {minutes:>4} min  {entry['url'][:60]}  "
+                  f"({len(page_state.get('seen_ids', []))} seen)")
+
+
+def main():
+    """Main entry point"""
+    print("📅 Watchlist Scheduler")
+    print("=" * 50)
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    once = '--once' in sys.argv
+    watchlist_path = args[0] if args else 'watchlist.json'
+
+    try:
+        watchlist = load_watchlist(watchlist_path)
+    except Exception as e:
+        print(f"❌ Invalid watchlist {watchlist_path}: {e}")
+        sys.exit(1)
+
+    job_runner.load_env()
+    if not os.getenv('GEMINI_API_KEY'):
+        print("❌ GEMINI_API_KEY not set (add it to .env)")
+        sys.exit(1)
+
+    # Unattended: any leftover input() prompt fails fast instead of blocking the daemon
+    sys.stdin = open(os.devnull, 'r')
+
+    scheduler = WatchlistScheduler(watchlist, stagger_first_runs=not once)
+    print(f"   Browser budget: {scheduler.browser_concurrency} page(s) at a time")
+    print(f"   Gemini budget: {watchlist.get('gemini_concurrency', 50)} concurrent calls")
+    scheduler.print_schedule()
+
+    scheduler.run(once=once)
+    scheduler.print_schedule()
+
+
+if __name__ == "__main__":
+    main()